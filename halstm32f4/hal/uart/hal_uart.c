@@ -62,6 +62,7 @@ os_queue_handle_t hal_uart_queue_tx;
 DEFINE_STATIC_QUEUE_BUFFER( hal_uart_tx, HAL_UART_QUEUE_TX_LEN, 1 );
 #endif
 #endif
+static uint32_t hal_uart_baudrate;
 
 
 
@@ -115,6 +116,7 @@ int hal_uart_init( uint32_t baudrate )
     usart_init.HardwareFlowControl = LL_USART_HWCONTROL_NONE;
     usart_init.OverSampling = LL_USART_OVERSAMPLING_16;
     LL_USART_Init( HAL_UARTx, &usart_init );
+    hal_uart_baudrate = usart_init.BaudRate;
     LL_USART_Enable( HAL_UARTx );
     LL_USART_ClearFlag_nCTS( HAL_UARTx );
     LL_USART_ClearFlag_TC( HAL_UARTx );
@@ -180,6 +182,42 @@ void hal_uart_reset(void)
 }
 
 
+uint32_t hal_uart_get_baudrate(void)
+{
+    return hal_uart_baudrate;
+}
+
+
+int hal_uart_set_baudrate( uint32_t baudrate )
+{
+    LL_USART_InitTypeDef usart_init;
+    int i;
+
+    /* let the queued bytes out with the old baudrate, 1s at most */
+    for( i=0; i<10000; i++ )
+    {
+#if HAL_UART_QUEUE_TX_LEN
+        if( os_queue_count( hal_uart_queue_tx ) == 0 )
+#endif
+            if( LL_USART_IsActiveFlag_TC( HAL_UARTx ) )
+                break;
+        hal_delay_us( 100 );
+    }
+    LL_USART_Disable( HAL_UARTx );
+    usart_init.BaudRate = baudrate;
+    usart_init.DataWidth = LL_USART_DATAWIDTH_8B;
+    usart_init.StopBits = LL_USART_STOPBITS_1;
+    usart_init.Parity = LL_USART_PARITY_NONE;
+    usart_init.TransferDirection = LL_USART_DIRECTION_TX_RX;
+    usart_init.HardwareFlowControl = LL_USART_HWCONTROL_NONE;
+    usart_init.OverSampling = LL_USART_OVERSAMPLING_16;
+    LL_USART_Init( HAL_UARTx, &usart_init );
+    LL_USART_Enable( HAL_UARTx );
+    hal_uart_baudrate = baudrate;
+    return 1;
+}
+
+
 void hal_uart_enable(uint8_t enable)
 {
     if( enable )
@@ -55,6 +55,7 @@
 #endif
 
 QueueHandle_t hal_uart_queue_rx, hal_uart_queue_tx;
+static uint32_t hal_uart_baudrate;
 
 
 int hal_uart_init( uint32_t baudrate )
@@ -102,6 +103,7 @@ int hal_uart_init( uint32_t baudrate )
     usart_init.USART_HardwareFlowControl = USART_HardwareFlowControl_None;
     usart_init.USART_Mode = USART_Mode_Rx | USART_Mode_Tx;
     USART_Init( HAL_UARTx, &usart_init );
+    hal_uart_baudrate = usart_init.USART_BaudRate;
     /* Enable USART */
     USART_Cmd( HAL_UARTx, ENABLE );
     USART_ClearFlag( HAL_UARTx, USART_FLAG_CTS | USART_FLAG_LBD | USART_FLAG_TC | USART_FLAG_RXNE );   
@@ -160,6 +162,39 @@ void hal_uart_reset(void)
 }
 
 
+uint32_t hal_uart_get_baudrate(void)
+{
+    return hal_uart_baudrate;
+}
+
+
+int hal_uart_set_baudrate( uint32_t baudrate )
+{
+    USART_InitTypeDef usart_init;
+    int i;
+
+    /* let the queued bytes out with the old baudrate, 1s at most */
+    for( i=0; i<10000; i++ )
+    {
+        if( uxQueueMessagesWaiting( hal_uart_queue_tx ) == 0 )
+            if( USART_GetFlagStatus( HAL_UARTx, USART_FLAG_TC ) == SET )
+                break;
+        hal_delay_us( 100 );
+    }
+    USART_Cmd( HAL_UARTx, DISABLE );
+    usart_init.USART_BaudRate = baudrate;
+    usart_init.USART_WordLength = USART_WordLength_8b;
+    usart_init.USART_StopBits = USART_StopBits_1;
+    usart_init.USART_Parity = USART_Parity_No;
+    usart_init.USART_HardwareFlowControl = USART_HardwareFlowControl_None;
+    usart_init.USART_Mode = USART_Mode_Rx | USART_Mode_Tx;
+    USART_Init( HAL_UARTx, &usart_init );
+    USART_Cmd( HAL_UARTx, ENABLE );
+    hal_uart_baudrate = baudrate;
+    return 1;
+}
+
+
 void hal_uart_enable(uint8_t enable)
 {
     USART_Cmd(HAL_UARTx, enable ? ENABLE : DISABLE );
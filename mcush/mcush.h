@@ -190,6 +190,9 @@ extern "C" {
 #ifndef USE_CMD_BEEP
     #define USE_CMD_BEEP  0
 #endif
+#ifndef USE_CMD_BAUD
+    #define USE_CMD_BAUD  0
+#endif
 #ifndef USE_CMD_SGPIO
     #define USE_CMD_SGPIO  0
 #endif
@@ -16,6 +16,7 @@ extern int cmd_uptime( int argc, char *argv[] );
 extern int cmd_system( int argc, char *argv[] );
 extern int cmd_mapi( int argc, char *argv[] );
 extern int cmd_beep( int argc, char *argv[] );
+extern int cmd_baud( int argc, char *argv[] );
 extern int cmd_sgpio( int argc, char *argv[] );
 extern int cmd_mkbuf( int argc, char *argv[] );
 extern int cmd_power( int argc, char *argv[] );
@@ -247,6 +248,11 @@ const shell_cmd_t CMD_TAB[] = {
     "beep control",
     "beep [-f <freq>] [<ms>]"  },
 #endif
+#if USE_CMD_BAUD
+{   CMD_HIDDEN, 0,  "baud",  cmd_baud, 
+    "shell baudrate",
+    "baud [-l|c] [-s <baudrate>]"  },
+#endif
 #if USE_CMD_FCFS
 {   CMD_HIDDEN, 0, "fcfs",  cmd_fcfs, 
     "fcfs control",
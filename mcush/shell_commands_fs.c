@@ -614,12 +614,21 @@ int cmd_stop( int argc, char *argv[] )
 int cmd_crc( int argc, char *argv[] )
 {
     static const mcush_opt_spec opt_spec[] = {
+        { MCUSH_OPT_VALUE, MCUSH_OPT_USAGE_VALUE_REQUIRED, 
+          'b', shell_str_address, shell_str_address, "memory mode" },
+        { MCUSH_OPT_VALUE, MCUSH_OPT_USAGE_VALUE_REQUIRED, 
+          'l', shell_str_length, shell_str_length, "memory length" },
+        { MCUSH_OPT_VALUE, MCUSH_OPT_USAGE_VALUE_REQUIRED, 
+          's', shell_str_size, shell_str_size, "block size, one crc per block" },
         { MCUSH_OPT_ARG, MCUSH_OPT_USAGE_REQUIRED, 
           0, shell_str_file, 0, shell_str_file_name },
         { MCUSH_OPT_NONE } };
     mcush_opt_parser parser;
     mcush_opt opt;
     char *fname=0;
+    void *addr=(void*)-1;
+    int length=-1;
+    int block=0;
     int size;
     uint32_t crc;
 
@@ -630,11 +639,37 @@ int cmd_crc( int argc, char *argv[] )
         {
             if( STRCMP( opt.spec->name, shell_str_file ) == 0 )
                 fname = (char*)opt.value;   
+            else if( STRCMP( opt.spec->name, shell_str_address ) == 0 )
+                parse_int(opt.value, (int*)&addr);
+            else if( STRCMP( opt.spec->name, shell_str_length ) == 0 )
+                parse_int(opt.value, (int*)&length);
+            else if( STRCMP( opt.spec->name, shell_str_size ) == 0 )
+                parse_int(opt.value, (int*)&block);
         }
         else
             STOP_AT_INVALID_ARGUMENT 
     }
 
+    if( addr != (void*)-1 )
+    {
+        /* memory mode */
+        if( length < 0 )
+        {
+            shell_write_err( shell_str_length );
+            return -1;
+        }
+        if( block <= 0 )
+            block = length;
+        do
+        {
+            size = length < block ? length : block;
+            shell_printf("0x%08X\n", _crc32((const uint8_t*)addr, size, 0, crc32_table));
+            addr = (void*)(((int)addr) + size);
+            length -= size;
+        } while( length > 0 );
+        return 0;
+    }
+
     if( !fname )
         return -1;
         
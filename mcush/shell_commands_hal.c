@@ -1457,6 +1457,116 @@ err_port:
 #endif
 
 
+#if USE_CMD_BAUD
+/* switch the shell uart baudrate, used by host to upshift:
+   baud -s <rate> replies at the old rate and switches after the prompt
+   is sent, then falls back unless baud -c is received at the new rate */
+#ifndef BAUD_RATES
+    #define BAUD_RATES  9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600
+#endif
+#ifndef BAUD_SWITCH_DELAY_MS
+    #define BAUD_SWITCH_DELAY_MS  20
+#endif
+#ifndef BAUD_REVERT_MS
+    #define BAUD_REVERT_MS  500
+#endif
+extern uint32_t hal_uart_get_baudrate(void);
+extern int hal_uart_set_baudrate( uint32_t baudrate );
+static const uint32_t baud_rates[] = { BAUD_RATES };
+static uint32_t baud_old, baud_new;
+static uint8_t baud_unconfirmed;
+static os_timer_handle_t baud_timer_switch, baud_timer_revert;
+
+static void baud_switch( os_timer_handle_t timer )
+{
+    (void)timer;
+    hal_uart_set_baudrate( baud_new );
+    baud_unconfirmed = 1;
+    os_timer_start( baud_timer_revert );
+}
+
+static void baud_revert( os_timer_handle_t timer )
+{
+    (void)timer;
+    hal_uart_set_baudrate( baud_old );
+    baud_unconfirmed = 0;
+}
+
+int cmd_baud( int argc, char *argv[] )
+{
+    static const mcush_opt_spec opt_spec[] = {
+        { MCUSH_OPT_SWITCH, 0, 
+          'l', shell_str_list, 0, "supported baudrates" },
+        { MCUSH_OPT_VALUE, MCUSH_OPT_USAGE_VALUE_REQUIRED, 
+          's', shell_str_set, shell_str_baudrate, "switch after the prompt" },
+        { MCUSH_OPT_SWITCH, 0, 
+          'c', "confirm", 0, "keep the switched baudrate" },
+        { MCUSH_OPT_NONE } };
+    mcush_opt_parser parser;
+    mcush_opt opt;
+    int rate=-1, confirm=0;
+    unsigned int i;
+
+    mcush_opt_parser_init(&parser, opt_spec, argv+1, argc-1 );
+    while( mcush_opt_parser_next( &opt, &parser ) )
+    {
+        if( opt.spec )
+        {
+            if( STRCMP( opt.spec->name, shell_str_set ) == 0 )
+            {
+                if( ! parse_int(opt.value, &rate) )
+                    STOP_AT_INVALID_ARGUMENT
+            }
+            else if( STRCMP( opt.spec->name, shell_str_list ) == 0 )
+                rate = 0;
+            else
+                confirm = 1;
+        }
+        else
+            STOP_AT_INVALID_ARGUMENT 
+    }
+
+    if( confirm )
+    {
+        if( baud_timer_revert )
+            os_timer_stop( baud_timer_revert );
+        baud_unconfirmed = 0;
+        return 0;
+    }
+
+    if( rate <= 0 )
+    {
+        for( i=0; i<sizeof(baud_rates)/sizeof(baud_rates[0]); i++ )
+            shell_printf( "%u\n", (unsigned int)baud_rates[i] );
+        return 0;
+    }
+
+    for( i=0; i<sizeof(baud_rates)/sizeof(baud_rates[0]); i++ )
+    {
+        if( baud_rates[i] == (uint32_t)rate )
+            break;
+    }
+    if( i == sizeof(baud_rates)/sizeof(baud_rates[0]) )
+        STOP_AT_INVALID_ARGUMENT
+
+    if( baud_timer_switch == 0 )
+        baud_timer_switch = os_timer_create( "baudT", OS_TICKS_MS(BAUD_SWITCH_DELAY_MS), 0, baud_switch );
+    if( baud_timer_revert == 0 )
+        baud_timer_revert = os_timer_create( "baudR", OS_TICKS_MS(BAUD_REVERT_MS), 0, baud_revert );
+    if( baud_timer_switch == 0 || baud_timer_revert == 0 )
+        return 1;  /* no timer support */
+    /* fall back to the confirmed one if switched again before confirmed */
+    os_timer_stop( baud_timer_revert );
+    if( !baud_unconfirmed )
+        baud_old = hal_uart_get_baudrate();
+    baud_new = (uint32_t)rate;
+    if( !os_timer_start( baud_timer_switch ) )
+        return 1;
+    return 0;
+}
+#endif
+
+
 #if USE_CMD_UPGRADE
 int cmd_upgrade( int argc, char *argv[] )
 {
@@ -16,6 +16,7 @@ from mcush import *
 from mcush.Mcush import *
 import tempfile
 import base64
+from struct import unpack
 import math
 
 def halt(message=None):
@@ -86,16 +87,22 @@ def reboot( argv=None ):
     except:
         pass
 
+def reboot_fast( argv=None ):
+    m = Mcush()
+    print( 'boot time: %.3f sec'% m.rebootFast() )
+
 def regs_test( argv=None ):
     s = Mcush()
-    s.addReg( Register( 'PORTA_CRL', 0x40010800, 'PORTA control (low)' ) )
-    s.addReg( Register( 'PORTA_CRH', 0x40010804, 'PORTA control (high)' ) )
-    s.addReg( Register( 'PORTA_IDR', 0x40010808, 'PORTA input data' ) )
-    s.addReg( Register( 'PORTA_ODR', 0x40010808, 'PORTA output data' ) )
+    s.addReg( Register.UInt32( 'PORTA_CRL', 0x40010800, 'PORTA control (low)' ) )
+    s.addReg( Register.UInt32( 'PORTA_CRH', 0x40010804, 'PORTA control (high)' ) )
+    s.addReg( Register.UInt32( 'PORTA_IDR', 0x40010808, 'PORTA input data' ) )
+    s.addReg( Register.UInt32( 'PORTA_ODR', 0x4001080C, 'PORTA output data' ) )
     print( hex(s.getReg('PORTA_CRL')) )
     print( hex(s.getReg('PORTA_CRH')) )
     print( hex(s.getReg('PORTA_IDR')) )
     print( hex(s.getReg('PORTA_ODR')) )
+    for name, value in sorted(s.readRegs().items()):
+        print( '%s: 0x%X'% (name, value) )
     s.setReg('PORTA_ODR', 0x12345678)
 
 
@@ -185,18 +192,23 @@ def memory_read( argv=None ):
         print( 'output: %s'% ('stdout' if fname is None else fname ) )
     if length <= 0:
         return
+    def progress( read, total ):
+        sys.stderr.write( '\r%d/%d bytes'% (read, total) )
+        if read == total:
+            sys.stderr.write( '\n' )
+    s = Mcush()
     t0 = time.time()
-    mem = Mcush().readMem( addr, length, compact_mode=Env.COMPACT_MODE )
-    dt = time.time() - t0
     if fname is None:
-        #Utils.dumpMem( mem, method=1 ) 
-        open(Env.TEST_WR, 'w+').write(mem)
-        #Utils.dumpFile( Env.TEST_WR )
-        sys.stdout.write( mem )  # write binary directly to console
-        os.remove( Env.TEST_WR )
+        # write binary directly to console, chunk by chunk
+        out = getattr( sys.stdout, 'buffer', sys.stdout )
+        for mem in s.iterMem( addr, length, compact_mode=Env.COMPACT_MODE ):
+            out.write( mem )
+        out.flush()
     else:
-        open(fname, 'w+').write(str(mem))
-    print( 'speed: %.3f kBytes/sec'% (len(mem)/dt/1000.0) )
+        s.dumpMemToFile( addr, length, fname, compact_mode=Env.COMPACT_MODE,
+                         callback=progress if Env.VERBOSE else None )
+    dt = time.time() - t0
+    print( 'speed: %.3f kBytes/sec'% (length/dt/1000.0) )
 
 
 def memory_read_loop( argv=None ):
@@ -276,6 +288,27 @@ def spiffs_get( argv=None ):
 
 
 
+#############################################################################
+# MULTIPLE DEVICES
+def discover( argv=None ):
+    t0 = time.time()
+    manager = DeviceManager.DeviceManager( probe_timeout=Env.getenv_float('PROBE_TIMEOUT', 0.5) )
+    manager.discover( argv if argv else None )
+    dt = time.time() - t0
+    for key in manager:
+        d = manager[key]
+        print( '%s  %s  %s'% (d.port.port, key, d.idn) )
+    print( '%d devices found in %.3f sec'% (len(manager), dt) )
+    manager.close()
+
+def rtc_sync_all( argv=None ):
+    manager = DeviceManager.DeviceManager()
+    manager.discover( argv if argv else None )
+    for key, ret in sorted(manager.run( 'rtcSync' ).items()):
+        print( '%s  %s'% (key, 'error: %s'% ret if isinstance(ret, Exception) else 'ok') )
+    manager.close()
+
+
 #############################################################################
 # I2C
 def i2c_search( argv=None ):
@@ -427,6 +460,635 @@ def upgradeFromSPIFFS(argv=None):
     s.upgradeFromSPIFFS( argv[0], transferCallback )
     s.port.write( "reboot\n" )
     
+
+#############################################################################
+# BENCHMARK
+class BenchmarkPort(Instrument.Port):
+    '''replay prepared response in chunks like usb-cdc driver does'''
+    CHUNK_SIZE = 4096
+
+    def __init__( self, parent, *args, **kwargs ):
+        Instrument.Port.__init__( self, parent, *args, **kwargs )
+        self.response = Env.EMPTY_BYTE
+        self.pos = 0
+
+    def connect( self ):
+        self._connected = True
+
+    def feed( self, response ):
+        self.response = response
+        self.pos = 0
+
+    def read( self, read_bytes=1 ):
+        ret = self.response[self.pos:self.pos+read_bytes]
+        self.pos += len(ret)
+        return ret
+
+    @property
+    def in_waiting( self ):
+        return min(self.CHUNK_SIZE, len(self.response)-self.pos)
+
+    def write( self, buf ):
+        pass
+
+class BenchmarkInstrument(Instrument.Instrument):
+    PORT_TYPE = BenchmarkPort
+
+def legacy_read_until_prompts( inst ):
+    # the former byte-by-byte reader, kept here for comparison
+    contents, newline_str = [], ''
+    while True:
+        byte = inst.port.read(1)
+        if byte:
+            if Env.PYTHON_V3:
+                byte = chr(ord(byte))
+            if byte == inst.DEFAULT_TERMINATOR_READ:
+                contents.append( newline_str.rstrip() )
+                newline_str = ''
+            else:
+                newline_str += byte
+        else:
+            raise Instrument.CommandTimeoutError( ' | '.join(contents) )
+        if inst.prompts.match( newline_str ):
+            contents.append( newline_str )
+            return contents
+
+def benchmark_read_until_prompts( argv=None ):
+    try:
+        length = int(eval(argv[0]))
+    except:
+        length = 20*1024
+    try:
+        rounds = int(argv[1])
+    except:
+        rounds = 10
+    # simulate response of 'x -b 0x20000000 -l <length>'
+    cmd = 'x -b 0x20000000 -l %d'% length
+    lines = [cmd + '\n']
+    for addr in range(0x20000000, 0x20000000+length, 16):
+        lines.append( '%08X: '% addr + ' '.join(['%02X'% randint(0,255) for i in range(16)]) + ' \r\n' )
+    lines.append( '=>' )
+    response = ''.join(lines).encode('utf8')
+    inst = BenchmarkInstrument( 'benchmark', terminal_reset=False, check_idn=False )
+    results = []
+    for name, reader in [('legacy', legacy_read_until_prompts),
+                         ('buffered', BenchmarkInstrument.readUntilPrompts)]:
+        t0 = time.time()
+        for r in range(rounds):
+            inst.port.feed( response )
+            ret = reader( inst )
+        dt = time.time() - t0
+        results.append( ret )
+        print( '%-10s %8.3f ms/round, %10.3f kBytes/sec'% (name, dt*1000.0/rounds, len(response)*rounds/dt/1000.0) )
+    if Env.PYTHON_V3:
+        # the same parser shared by AsyncInstrument, response from a loopback device
+        import asyncio
+        class ReplayDevice:
+            def process( self, data ):
+                return response
+        async def run():
+            inst = AsyncMcush.AsyncLoopbackMcush( 'loop', device=ReplayDevice(),
+                                                  terminal_reset=False, check_idn=False )
+            await inst.port.connect()
+            t0 = time.time()
+            for r in range(rounds):
+                await inst.writeLine( cmd )
+                ret = await inst.readUntilPrompts()
+            return time.time() - t0, ret
+        dt, ret = asyncio.run( run() )
+        results.append( ret )
+        print( '%-10s %8.3f ms/round, %10.3f kBytes/sec'% ('async', dt*1000.0/rounds, len(response)*rounds/dt/1000.0) )
+    for ret in results[1:]:
+        if ret != results[0]:
+            halt( 'results not match' )
+
+def benchmark_pipeline( argv=None ):
+    cmd = 'w -b 0x20000000 -w1 ' + ' '.join(['%d'% randint(0,255) for i in range(16)])
+    for baudrate, commands in [(9600, 20), (115200, 200)]:
+        inst = Simulator.SimulatorMcush( 'sim', baudrate=baudrate, emulate_timing=True, check_idn=False )
+        t0 = time.time()
+        for i in range(commands):
+            inst.writeCommand( cmd )
+        t1 = time.time()
+        inst.writeCommands( [cmd] * commands )
+        t2 = time.time()
+        print( '%6d baud, %3d commands: sequential %7.1f cmd/sec, pipelined %7.1f cmd/sec'% (
+                baudrate, commands, commands/(t1-t0), commands/(t2-t1)) )
+
+def benchmark_simulator( argv=None ):
+    try:
+        baudrates = [int(b) for b in argv]
+    except:
+        baudrates = []
+    if not baudrates:
+        baudrates = [115200, 921600]
+    size = 4096
+    dat = bytes(bytearray([randint(0,255) for i in range(size)]))
+    tmp = tempfile.NamedTemporaryFile( suffix='.bin', delete=False )
+    tmp.write( dat )
+    tmp.close()
+    for baudrate in baudrates:
+        s = Simulator.SimulatorMcush( 'sim', baudrate=baudrate, emulate_timing=True )
+        t0 = time.time()
+        s.readMem( 0x20000000, size )
+        t1 = time.time()
+        s.putFile( '/s/benchmark.bin', tmp.name )
+        t2 = time.time()
+        s.mkbuf( range(512) )
+        t3 = time.time()
+        print( '%7d baud: readMem %7.1f Bytes/sec, putFile %7.1f Bytes/sec, mkbuf %7.1f items/sec'% (
+                baudrate, size/(t1-t0), size/(t2-t1), 512/(t3-t2)) )
+    remove( tmp.name )
+
+def benchmark_itermem( argv=None ):
+    # simulated 64 kB read: one readMem command, then iterMem chunks
+    # with and without pipelining, peak host memory traced
+    import tracemalloc
+    try:
+        baudrate = int(argv[0])
+    except:
+        baudrate = 921600
+    size = Simulator.Shell.RAM_SIZE
+    tmp = tempfile.NamedTemporaryFile( suffix='.bin', delete=False )
+    tmp.close()
+    s = Simulator.SimulatorMcush( 'sim', baudrate=baudrate, emulate_timing=True )
+    s.port.device.ram[:] = bytearray([randint(0,255) for i in range(size)])
+    for name, func in [
+            ('readMem', lambda: open(tmp.name, 'wb').write(s.readMem(0x20000000, size))),
+            ('iterMem', lambda: s.dumpMemToFile(0x20000000, size, tmp.name)),
+            ('iterMem (not pipelined)', lambda: [f.write(m) for f in [open(tmp.name, 'wb')]
+                                    for m in s.iterMem(0x20000000, size, pipelined=False)]) ]:
+        tracemalloc.start()
+        t0 = time.time()
+        func()
+        dt = time.time() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert open(tmp.name, 'rb').read() == bytes(s.port.device.ram)
+        print( '%24s: %7.1f kBytes/sec, peak memory %d kB'% (name, size/dt/1000.0, peak/1000) )
+    remove( tmp.name )
+
+def benchmark_writemem( argv=None ):
+    # simulated 4 kB table write: byte items (former 16 decimal items per
+    # command), packed byte items, packed 32-bit words, and crc verify
+    try:
+        baudrate = int(argv[0])
+    except:
+        baudrate = 115200
+    size = 4096
+    dat = bytes(bytearray([randint(0,255) for i in range(size)]))
+    s = Simulator.SimulatorMcush( 'sim', baudrate=baudrate, emulate_timing=True )
+    def former( addr, dat ):
+        with s.pipeline() as p:
+            for i in range(0, len(dat), 16):
+                p.writeCommand( 'w -b 0x%X -w1 '% (addr+i) + ' '.join([str(c) for c in bytearray(dat[i:i+16])]) )
+    for name, func in [
+            ('former', lambda: former(0x20000001, dat)),
+            ('width 1', lambda: s.writeMem(0x20000001, dat, width=1)),
+            ('words', lambda: s.writeMem(0x20000001, dat, width=None)),
+            ('words + verify', lambda: s.writeMem(0x20000001, dat, width=None, verify=True)) ]:
+        s.fillMem( 0x20000000, 0, 1, size+8 )
+        t0 = time.time()
+        func()
+        dt = time.time() - t0
+        assert s.port.device.readRam(0x20000001, size) == dat
+        print( '%16s: %7.1f Bytes/sec'% (name, size/dt) )
+
+def benchmark_regs( argv=None ):
+    # 32 registers of a simulated 256 bytes struct:
+    # getReg one by one compared with coalesced readRegs
+    try:
+        baudrate = int(argv[0])
+    except:
+        baudrate = 115200
+    s = Simulator.SimulatorMcush( 'sim', baudrate=baudrate, emulate_timing=True )
+    s.port.device.ram[:256] = bytearray([randint(0,255) for i in range(256)])
+    types = ['uint8', 'int16', 'uint32', 'float']
+    for i in range(32):
+        s.addReg( Register.Register( 'r%d'% i, 0x20000000 + i * 8, '', types[i % len(types)] ) )
+    names = ['r%d'% i for i in range(32)]
+    t0 = time.time()
+    values = dict([(n, s.getReg(n)) for n in names])
+    t1 = time.time()
+    values2 = s.readRegs( names )
+    t2 = time.time()
+    assert repr(values) == repr(values2)
+    print( 'getReg: %.3f sec, readRegs: %.3f sec (%d commands)'% (
+            t1-t0, t2-t1, len(s.reg_sets[tuple(names)].ranges)) )
+
+BENCHMARK_SVD = '''<?xml version="1.0" encoding="utf-8"?>
+<device>
+  <name>SIM</name>
+  <size>32</size>
+  <peripherals>
+    <peripheral>
+      <name>TIM1</name>
+      <baseAddress>0x20000000</baseAddress>
+      <registers>
+        <register>
+          <name>CR1</name>
+          <addressOffset>0x0</addressOffset>
+          <fields>
+            <field><name>CEN</name><bitOffset>0</bitOffset><bitWidth>1</bitWidth></field>
+            <field><name>DIR</name><bitRange>[4:4]</bitRange></field>
+            <field><name>CKD</name><lsb>8</lsb><msb>9</msb></field>
+          </fields>
+        </register>
+        <register><name>CR2</name><addressOffset>0x4</addressOffset></register>
+        <register><name>SR</name><addressOffset>0x10</addressOffset><size>16</size></register>
+        <register><name>EGR</name><addressOffset>0x14</addressOffset><access>write-only</access></register>
+        <register><name>CNT</name><addressOffset>0x24</addressOffset></register>
+        <register><name>PSC</name><addressOffset>0x28</addressOffset><size>16</size></register>
+        <register><name>ARR</name><addressOffset>0x2C</addressOffset></register>
+        <register>
+          <name>CCR%s</name><addressOffset>0x34</addressOffset>
+          <dim>4</dim><dimIncrement>4</dimIncrement><dimIndex>1-4</dimIndex>
+        </register>
+      </registers>
+    </peripheral>
+    <peripheral derivedFrom="TIM1">
+      <name>TIM8</name>
+      <baseAddress>0x20000400</baseAddress>
+    </peripheral>
+  </peripherals>
+</device>
+'''
+
+def benchmark_svd( argv=None ):
+    # timer peripheral of a simulated svd file: getReg per register
+    # compared with one readMem and unpack of the whole peripheral
+    try:
+        baudrate = int(argv[0])
+    except:
+        baudrate = 115200
+    tmp = tempfile.NamedTemporaryFile( suffix='.svd', delete=False )
+    tmp.write( BENCHMARK_SVD.encode('utf8') )
+    tmp.close()
+    peripherals = RegisterMap.loadSvd( tmp.name )
+    unsafe = len(RegisterMap.loadSvd( tmp.name, unsafe=True )['TIM8'].registers) - len(peripherals['TIM8'].registers)
+    remove( tmp.name )
+    s = Simulator.SimulatorMcush( 'sim', baudrate=baudrate, emulate_timing=True )
+    s.port.device.ram[:0x800] = bytearray([randint(0,255) for i in range(0x800)])
+    tim = peripherals['TIM8']
+    s.addRegs( tim )
+    t0 = time.time()
+    values = dict([(r.name, s.getReg(r.name)) for r in tim.registers])
+    t1 = time.time()
+    values2 = tim.read( s )
+    t2 = time.time()
+    assert values == values2
+    print( 'TIM8 %d registers (%d not safe to read left out), getReg: %.3f sec, RegisterSet: %.3f sec (%d readMem)'% (
+            len(tim.registers), unsafe, t1-t0, t2-t1, len(tim.ranges)) )
+    print( 'TIM8_CR1 fields: %s'% tim.readFields( s )['TIM8_CR1'] )
+
+def benchmark_sampler( argv=None ):
+    # sample 8 registers and 8 bytes of memory of the simulated device,
+    # compared with a sleep loop drifting by the read time
+    try:
+        rate = float(argv[0])
+    except:
+        rate = 20
+    try:
+        duration = float(argv[1])
+    except:
+        duration = 2
+    s = Simulator.SimulatorMcush( 'sim', baudrate=115200, emulate_timing=True )
+    regs = [Register.UInt32( 'r%d'% i, 0x20000000 + i * 4, '' ) for i in range(8)]
+    s.addRegs( regs )
+    names = [r.name for r in regs]
+    count, t0 = 0, time.time()
+    while time.time() - t0 < duration:
+        s.readRegs( names )
+        s.readMem( 0x20000020, 8 )
+        count += 1
+        time.sleep( 1.0 / rate )
+    print( 'sleep loop: %.1f samples/sec (target %.1f)'% (count / (time.time() - t0), rate) )
+    sampler = Sampler.Sampler( s, regs + [(0x20000020, 8)], rate )
+    sampler.start()
+    time.sleep( duration )
+    sampler.stop()
+    st = sampler.stats()
+    print( '   Sampler: %.1f samples/sec, jitter mean %.2f ms, std %.2f ms, max %.2f ms, %d dropped, %d errors'% (
+            st['rate'], st['jitter_mean']*1000, st['jitter_std']*1000, st['jitter_max']*1000,
+            st['dropped'], st['errors']) )
+    tmp = tempfile.NamedTemporaryFile( suffix='.csv', delete=False )
+    tmp.close()
+    sampler.exportCsv( tmp.name )
+    lines = open( tmp.name ).read().splitlines()
+    print( '%d columns, %d rows exported'% (len(lines[0].split(',')), len(lines)-1) )
+    remove( tmp.name )
+
+def benchmark_mirror( argv=None ):
+    # watch 16 kB of simulated memory with 2 blocks changed between
+    # refreshes: full readMem compared with MemoryMirror in the modes
+    # one crc command, pipelined crc per block, and no crc support
+    try:
+        baudrate = int(argv[0])
+    except:
+        baudrate = 921600
+    size = 16*1024
+    s = Simulator.SimulatorMcush( 'sim', baudrate=baudrate, emulate_timing=True )
+    ram = s.port.device.ram
+    ram[:size] = bytearray([randint(0,255) for i in range(size)])
+    def change():
+        for offset in [100, 9000]:
+            ram[offset] = (ram[offset] + 1) & 0xFF
+    change()
+    t0 = time.time()
+    s.readMem( 0x20000000, size )
+    print( '%24s: %.3f sec'% ('readMem', time.time()-t0) )
+    for mode in ['crc -s', 'crc per block', 'no crc']:
+        if mode == 'crc per block':
+            s.mem_crc_blocks_supported = False
+        elif mode == 'no crc':
+            s.mem_crc_supported = False
+        m = MemoryMirror.MemoryMirror( s, 0x20000000, size )
+        m.refresh()
+        change()
+        t0 = time.time()
+        changed = m.refresh()
+        dt = time.time() - t0
+        assert bytes(m.view) == bytes(ram[:size])
+        print( '%24s: %.3f sec, changed blocks %s'% ('MemoryMirror (%s)'% mode, dt, changed) )
+
+def benchmark_s2a( argv=None ):
+    # convert 100k samples: struct.unpack per item compared with
+    # array copy, memoryview without copy and numpy if installed
+    try:
+        count = int(argv[0])
+    except:
+        count = 100000
+    buf = bytes(bytearray([randint(0,255) for i in range(count*4)]))
+    t0 = time.time()
+    old = [unpack('I', buf[i*4:(i+1)*4]) for i in range(count)]
+    print( '%24s: %.4f sec'% ('unpack per item', time.time()-t0) )
+    expected = [v[0] for v in old]
+    modes = [('array', {}), ('memoryview', {'copy': False})]
+    try:
+        import numpy
+        modes += [('numpy', {'use_numpy': True}), ('numpy view', {'use_numpy': True, 'copy': False})]
+    except ImportError:
+        pass
+    for name, kwargs in modes:
+        t0 = time.time()
+        ret = Utils.s2Ia( buf, **kwargs )
+        dt = time.time() - t0
+        assert list(ret) == expected
+        print( '%24s: %.4f sec'% (name, dt) )
+    t0 = time.time()
+    ret = Utils.s2Ia( buf, big_endian=True )
+    print( '%24s: %.4f sec'% ('array big endian', time.time()-t0) )
+    assert list(ret) == list(unpack('>%dI'% count, buf))
+
+def benchmark_writelines( argv=None ):
+    # multi-line input (mkbuf) through a pty served simulator:
+    # split writes of payload/terminator (former writeLine), coalesced
+    # writeLine, and batched writeLines
+    try:
+        items = int(argv[0])
+    except:
+        items = 4096
+    try:
+        latency = float(argv[1])
+    except:
+        latency = 0.0005
+    server = Simulator.PtyServer( latency=latency ).start()
+    s = Mcush( server.port, baudrate=115200 )
+    values = [randint(0, 65535) for i in range(items)]
+    lines = []
+    line = ''
+    for v in values:
+        line += '%d '% v
+        if len(line) > s.DEFAULT_MULTILINE_INPUT_LINE_LIMIT:
+            lines.append( line.rstrip() )
+            line = ''
+    if line:
+        lines.append( line.rstrip() )
+    def split_write_line( dat, encode_utf8=True ):
+        s.port.write( dat.encode('utf8') if Env.PYTHON_V3 else dat )
+        s.port.write( s.DEFAULT_TERMINATOR_WRITE )
+        s.port.flush()
+    for title in ['split', 'coalesced', 'batched']:
+        if title == 'split':
+            s.writeLine = split_write_line
+        t0 = time.time()
+        s.setPrompts( s.DEFAULT_PROMPTS_MULTILINE )
+        s.writeCommand( 'mkbuf' )
+        if title == 'batched':
+            s.writeLines( lines )
+        else:
+            for l in lines:
+                s.writeCommand( l )
+        s.setPrompts()
+        addr = int(Utils.parseKeyValueLines(s.writeCommand(''))['address'], 16)
+        dt = time.time() - t0
+        s.__dict__.pop( 'writeLine', None )
+        s.free( addr )
+        print( '%9s: %d lines, %.3f sec, %.1f lines/sec, %.1f items/sec'% (title, len(lines), dt, len(lines)/dt, items/dt) )
+    s.disconnect()
+    server.stop()
+
+def benchmark_resync( argv=None ):
+    # lossy simulated link: static timeout and blind retry compared with
+    # adaptive timeout and Ctrl-C resync
+    try:
+        rounds = int(argv[0])
+    except:
+        rounds = 200
+    try:
+        loss = float(argv[1])
+    except:
+        loss = 0.002
+    for adaptive in [False, True]:
+        s = Simulator.SimulatorMcush( 'sim', baudrate=115200, emulate_timing=True,
+                                      adaptive_timeout=adaptive )
+        s.port.loss = loss
+        Simulator.random.seed( 1 )  # same lost bytes in both modes
+        errors = 0
+        t0 = time.time()
+        for i in range(rounds):
+            try:
+                s.writeCommandRetry( 'uptime' )
+                s.readMem( 0x20000000, 64 )
+            except Exception:
+                errors += 1
+        dt = time.time() - t0
+        r = s.recoveryStats()
+        print( '%s: %.3f sec, %d errors, %d timeouts, %d resyncs (%d failed, %.3f sec), %d bytes lost'% (
+                'adaptive' if adaptive else '  static', dt, errors, r['timeouts'],
+                r['resyncs'], r['resync_failures'], r['resync_time'], s.port.dropped) )
+    # pipelined: a timeout drops the commands in flight and resyncs once,
+    # the next command must get its own response
+    for adaptive in [False, True]:
+        s = Simulator.SimulatorMcush( 'sim', baudrate=115200, emulate_timing=True,
+                                      adaptive_timeout=adaptive )
+        s.port.loss = loss * 10
+        Simulator.random.seed( 1 )
+        errors = out_of_sync = 0
+        t0 = time.time()
+        for i in range(rounds // 10):
+            try:
+                s.writeCommands( ['uptime'] * 10 )
+            except Exception:
+                errors += 1
+            s.port.loss = 0
+            try:
+                if s.writeCommand( '*idn?' )[0].strip() != s.idn:
+                    out_of_sync += 1
+            except Exception:
+                out_of_sync += 1
+            s.port.loss = loss * 10
+        dt = time.time() - t0
+        r = s.recoveryStats()
+        print( '%s pipelined: %.3f sec, %d errors, %d out of sync, %d resyncs'% (
+                'adaptive' if adaptive else '  static', dt, errors, out_of_sync, r['resyncs']) )
+
+def benchmark_reboot( argv=None ):
+    # simulated controller booting in 0.3 sec: fixed delays compared with
+    # polling the port for the prompt
+    try:
+        boot_delay = float(argv[0])
+    except:
+        boot_delay = 0.3
+    # upshifted: the device boots at its power-on baudrate, not the negotiated one
+    for upshift in [False, True]:
+        for fast in [False, True]:
+            dev = Simulator.Shell()
+            dev.BOOT_DELAY = boot_delay
+            if upshift:
+                dev.POWER_ON_BAUDRATE = 115200
+                dev.reset()
+            s = Simulator.SimulatorMcush( 'sim', device=dev, baudrate=115200, emulate_timing=True,
+                                          upshift=upshift )
+            t0 = time.time()
+            if fast:
+                s.rebootFast()
+            else:
+                s.reboot()
+            dt = time.time() - t0
+            print( '%s%s: %.3f sec, %d baud, reboot counter %d'% ('  fast' if fast else 'static',
+                    ' upshift' if upshift else '', dt, s.port.baudrate, s.getRebootCounter()) )
+
+def benchmark_replay( argv=None ):
+    # record a simulated session, then replay it as fast as possible
+    # so only the host side parsing cost is measured
+    try:
+        record_file = argv[0]
+    except:
+        record_file = None
+    try:
+        rounds = int(argv[1])
+    except:
+        rounds = 10
+    length = 16*1024
+    if record_file is None:
+        record_file = os.path.join( Env.TEST_DIR, 'benchmark_replay.rec' )
+        s = Recorder.recordingClass( Simulator.SimulatorMcush )( 'sim', record_file=record_file )
+        s.readMem( 0x20000000, length )
+        s.disconnect()
+        s.port.close()
+    t0 = time.time()
+    for r in range(rounds):
+        s = Recorder.replayClass( Mcush )( record_file )
+        s.readMem( 0x20000000, length )
+    dt = time.time() - t0
+    print( 'replay %d rounds: %.3f ms/round, %.1f kBytes/sec'% (rounds, dt*1000.0/rounds, length*rounds/dt/1000.0) )
+
+def benchmark_import( argv=None ):
+    # startup cost of scripts: import mcush in a new interpreter, with the
+    # lazily imported modules untouched or all loaded (former behavior)
+    try:
+        rounds = int(argv[0])
+    except:
+        rounds = 10
+    code = """import sys, time
+sys.path.insert(0, %r)
+t = time.time()
+import mcush
+if %r:
+    for name in dir(mcush):
+        try:
+            getattr( getattr(mcush, name), '__name__', None )
+        except Exception:
+            pass
+print( time.time() - t )"""
+    path = os.path.dirname(os.path.abspath(__file__))
+    for title, load_all in [('lazy', False), ('all loaded', True)]:
+        t_import, t_total = 0, 0
+        for r in range(rounds):
+            t0 = time.time()
+            p = Popen( [sys.executable, '-c', code% (path, load_all)], stdout=PIPE, stderr=PIPE )
+            out, err = p.communicate()
+            t_total += time.time() - t0
+            t_import += float(out.split()[-1])
+        print( '%s: import %.1f ms, process %.1f ms'% (title, t_import*1000.0/rounds, t_total*1000.0/rounds) )
+
+def benchmark_shared( argv=None ):
+    # one simulated device shared by background pollers and an interactive
+    # thread, interactive commands go ahead of the queued polling
+    import threading
+    try:
+        pollers = int(argv[0])
+    except:
+        pollers = 4
+    try:
+        rounds = int(argv[1])
+    except:
+        rounds = 50
+    s = Simulator.SimulatorMcush( 'sim', baudrate=115200, emulate_timing=True )
+    shared = Shared.SharedInstrument( s )
+    background = shared.proxy( Shared.PRIORITY_BACKGROUND )
+    interactive = shared.proxy( Shared.PRIORITY_INTERACTIVE )
+    stop = threading.Event()
+    errors = []
+    polled = [0]
+    def poll():
+        while not stop.is_set():
+            try:
+                background.uptime()
+                background.readMem( 0x20000000, 64 )
+                polled[0] += 2
+            except Exception as e:
+                errors.append( e )
+    threads = [threading.Thread( target=poll ) for i in range(pollers)]
+    for t in threads:
+        t.start()
+    latency = []
+    for i in range(rounds):
+        t0 = time.time()
+        if interactive.scpiIdn() != s.idn:
+            errors.append( 'idn mismatch' )
+        latency.append( time.time() - t0 )
+    stop.set()
+    for t in threads:
+        t.join()
+    shared.close()
+    print( '%d pollers, %d background commands, %d errors'% (pollers, polled[0], len(errors)) )
+    print( 'interactive latency: avg %.2f ms, max %.2f ms'% (sum(latency)*1000.0/rounds, max(latency)*1000.0) )
+
+def benchmark_async( argv=None ):
+    import asyncio
+    try:
+        devices = int(argv[0])
+    except:
+        devices = 200
+    try:
+        rounds = int(argv[1])
+    except:
+        rounds = 100
+    async def run( dev ):
+        await dev.connect()
+        for i in range(rounds):
+            await dev.scpiIdn()
+        dev.disconnect()
+    async def main():
+        devs = [AsyncMcush.AsyncLoopbackMcush( 'loop%d'% i ) for i in range(devices)]
+        await asyncio.gather(*[run(d) for d in devs])
+    t0 = time.time()
+    asyncio.run( main() )
+    dt = time.time() - t0
+    print( '%d devices, %d commands: %.3f sec, %.1f cmd/sec'% (devices, devices*rounds, dt, devices*rounds/dt) )
+
   
 #############################################################################
 if __name__ == '__main__':
@@ -0,0 +1 @@
+Tests.py
\ No newline at end of file
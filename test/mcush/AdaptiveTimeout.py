@@ -0,0 +1,91 @@
+# coding: utf8
+__doc__ = 'command timeouts adapted to the measured response silence'
+__author__ = 'Peng Shulin <trees_peng@163.com>'
+__license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
+
+
+class RttEstimator:
+    '''smoothed estimation as RFC 6298 retransmission timer'''
+    ALPHA = 0.125
+    BETA = 0.25
+
+    def __init__( self ):
+        self.samples = 0
+        self.srtt = 0.0
+        self.rttvar = 0.0
+        self.max = 0.0
+
+    def update( self, sample ):
+        if self.samples == 0:
+            self.srtt = sample
+            self.rttvar = sample / 2.0
+        else:
+            self.rttvar = (1-self.BETA) * self.rttvar + self.BETA * abs(self.srtt - sample)
+            self.srtt = (1-self.ALPHA) * self.srtt + self.ALPHA * sample
+        self.samples += 1
+        if sample > self.max:
+            self.max = sample
+
+    def rto( self ):
+        return self.srtt + 4 * self.rttvar
+
+
+class AdaptiveTimeout:
+    '''learn the longest silence (time to the first byte, or pause between
+       received chunks) of each command verb and subcommand, and derive the read timeout:
+       max(rto, FACTOR * longest silence seen), bounded by MIN_TIMEOUT and the
+       static timeout; verbs with few samples keep the static timeout.
+       Multi-line input data lines are counted together.'''
+    MIN_SAMPLES = 4
+    MIN_TIMEOUT = 0.2
+    FACTOR = 2
+
+    def __init__( self, min_samples=None, min_timeout=None ):
+        if min_samples is not None:
+            self.MIN_SAMPLES = min_samples
+        if min_timeout is not None:
+            self.MIN_TIMEOUT = min_timeout
+        self.verbs = {}
+
+    def getVerb( self, cmd ):
+        '''first word, with the '-c <subcommand>' if any: 'fcfs -c erase' is
+           much slower than 'fcfs -c program' and must not share its timeout'''
+        args = cmd.split() if cmd else []
+        verb = args[0] if args else ''
+        if verb and not (verb[0].isalpha() or verb[0] in '*?'):
+            return ''  # data line
+        for i, arg in enumerate(args[1:-1], 1):
+            if arg == '-c' and args[i+1][0].isalpha():
+                return '%s -c %s'% (verb, args[i+1])
+        return verb
+
+    def getTimeout( self, cmd, static ):
+        est = self.verbs.get( self.getVerb(cmd) )
+        if est is None or est.samples < self.MIN_SAMPLES:
+            return static
+        timeout = max( self.MIN_TIMEOUT, est.rto(), self.FACTOR * est.max )
+        if static is not None:
+            timeout = min( static, timeout )
+        return timeout
+
+    def update( self, cmd, silence ):
+        verb = self.getVerb( cmd )
+        try:
+            est = self.verbs[verb]
+        except KeyError:
+            est = self.verbs[verb] = RttEstimator()
+        est.update( silence )
+
+    def snapshot( self, static=None ):
+        '''return {verb: {samples, srtt, rttvar, max, timeout}}'''
+        ret = {}
+        for verb, est in self.verbs.items():
+            ret[verb] = {
+                'samples': est.samples,
+                'srtt': est.srtt,
+                'rttvar': est.rttvar,
+                'max': est.max,
+                'timeout': self.getTimeout( verb, static ),
+                }
+        return ret
+
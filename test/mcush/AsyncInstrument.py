@@ -0,0 +1,427 @@
+# coding: utf8
+__doc__ = 'asyncio instrument class, python 3.5+ only'
+__author__ = 'Peng Shulin <trees_peng@163.com>'
+__license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
+import os
+import asyncio
+import logging
+from . import Env
+from .Instrument import Instrument, PortNotFound, UnknownPortError, \
+                        CommandTimeoutError, IDNMatchError
+
+
+class ShellProtocol(asyncio.Protocol):
+    '''collect received bytes for AsyncInstrument'''
+
+    def __init__( self ):
+        self.transport = None
+        self.received = bytearray()
+        self.event = asyncio.Event()
+        self.lost = False
+
+    def connection_made( self, transport ):
+        self.transport = transport
+
+    def data_received( self, data ):
+        self.received += data
+        self.event.set()
+
+    def connection_lost( self, exc ):
+        self.lost = True
+        self.event.set()
+
+    async def read_chunk( self, timeout ):
+        '''return all received bytes, wait until timeout for the first one'''
+        if not self.received and not self.lost:
+            self.event.clear()
+            try:
+                await asyncio.wait_for( self.event.wait(), timeout )
+            except asyncio.TimeoutError:
+                pass
+        ret = bytes(self.received)
+        del self.received[:]
+        return ret
+
+
+class AsyncPort(object):
+
+    def __init__( self, parent, *args, **kwargs ):
+        self.parent = parent
+        for k, v in kwargs.items():
+            self.__dict__[k] = v
+        self.protocol = None
+        self.transport = None
+
+    async def connect( self ):
+        raise NotImplementedError
+
+    def disconnect( self ):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    @property
+    def connected( self ):
+        return (self.transport is not None) and (not self.protocol.lost)
+
+    async def read_chunk( self ):
+        return await self.protocol.read_chunk( self.timeout )
+
+    def write( self, buf ):
+        if isinstance(buf, str):
+            buf = buf.encode('utf8')
+        self.transport.write( buf )
+
+    async def drain( self ):
+        pass
+
+    @property
+    def baudrate( self ):
+        return self._baudrate
+
+    @property
+    def timeout( self ):
+        return self._timeout
+
+    @timeout.setter
+    def timeout( self, val ):
+        self._timeout = val
+
+
+class AsyncSerialPort(AsyncPort):
+    '''serial port wrapped as read/write pipes (posix only)'''
+
+    async def connect( self ):
+        if self.transport is not None:
+            return
+        import serial
+        try:
+            self.ser = serial.serial_for_url( self.port, do_not_open=True )
+        except AttributeError:
+            self.ser = serial.Serial()
+            self.ser.port = self.port
+        self.ser.baudrate = self.baudrate
+        self.ser.rtscts = self.rtscts
+        self.ser.parity = self.parity
+        self.ser.timeout = 0
+        try:
+            self.ser.open()
+            self.ser.reset_output_buffer()
+            self.ser.reset_input_buffer()
+        except IOError:
+            raise PortNotFound( self.port )
+        except Exception as e:
+            raise UnknownPortError( e )
+        self.tx_buffer = bytearray()
+        self.tx_writer = False
+        self.tx_done = None
+        self.tx_error = None
+        loop = asyncio.get_event_loop()
+        self.protocol = ShellProtocol()
+        self.transport, _ = await loop.connect_read_pipe( lambda: self.protocol,
+                                open(self.ser.fileno(), 'rb', buffering=0, closefd=False) )
+
+    def disconnect( self ):
+        # connect may not have run or failed before opening the port
+        ser = getattr(self, 'ser', None)
+        if self.transport is not None and getattr(self, 'tx_writer', False):
+            asyncio.get_event_loop().remove_writer( ser.fileno() )
+        self.tx_writer = False
+        AsyncPort.disconnect( self )
+        if ser is not None and ser.is_open:
+            ser.close()
+
+    def write( self, buf ):
+        '''queue bytes, the event loop writes them when the port is ready'''
+        if isinstance(buf, str):
+            buf = buf.encode('utf8')
+        self.tx_buffer += buf
+        if not self.tx_writer:
+            self._writeReady()
+
+    def _writeReady( self ):
+        # the fd is non-blocking, write what the driver takes now and wait
+        # for it being writable again with the rest
+        try:
+            written = os.write( self.ser.fileno(), self.tx_buffer )
+        except (BlockingIOError, InterruptedError):
+            written = 0
+        except OSError as e:
+            self.tx_error = e
+            written = len(self.tx_buffer)
+        del self.tx_buffer[:written]
+        loop = asyncio.get_event_loop()
+        if self.tx_buffer:
+            if not self.tx_writer:
+                loop.add_writer( self.ser.fileno(), self._writeReady )
+                self.tx_writer = True
+            return
+        if self.tx_writer:
+            loop.remove_writer( self.ser.fileno() )
+            self.tx_writer = False
+        if self.tx_done is not None and not self.tx_done.done():
+            self.tx_done.set_result( None )
+
+    async def drain( self ):
+        '''wait until the queued bytes are written'''
+        if self.tx_buffer:
+            self.tx_done = asyncio.get_event_loop().create_future()
+            await self.tx_done
+            self.tx_done = None
+        if self.tx_error is not None:
+            e, self.tx_error = self.tx_error, None
+            raise UnknownPortError( str(e) )
+
+
+class AsyncSocketPort(AsyncPort):
+
+    async def connect( self ):
+        if self.transport is not None:
+            return
+        loop = asyncio.get_event_loop()
+        self.protocol = ShellProtocol()
+        try:
+            self.transport, _ = await loop.create_connection( lambda: self.protocol,
+                                        self.ip, int(self.port) )
+        except OSError as e:
+            raise PortNotFound( str(e) )
+
+    async def drain( self ):
+        # let the event loop push buffered bytes out
+        await asyncio.sleep( 0 )
+
+
+class LoopbackShell(object):
+    '''minimal shell emulator for AsyncLoopbackPort: echo, prompts and *idn?'''
+    IDN = 'mcush,1.0'
+
+    def __init__( self ):
+        self.line = bytearray()
+
+    def process( self, data ):
+        '''feed input bytes, return output bytes'''
+        out = bytearray()
+        for c in bytearray(data):
+            if c == 0x03:
+                self.line = bytearray()
+                out += b'\r\n=>'
+            elif c == 0x0A:
+                out += self.line + b'\n'
+                cmd = self.line.decode('utf8').strip()
+                self.line = bytearray()
+                if cmd == '*idn?':
+                    out += self.IDN.encode('utf8') + b'\r\n'
+                out += b'=>'
+            elif c != 0x0D:
+                self.line.append( c )
+        return bytes(out)
+
+
+class LoopbackTransport(asyncio.Transport):
+    '''deliver written bytes to an in-process device'''
+
+    def __init__( self, device, protocol ):
+        asyncio.Transport.__init__( self )
+        self.device = device
+        self.protocol = protocol
+        self.closed = False
+        self.protocol.connection_made( self )
+
+    def write( self, data ):
+        out = self.device.process( data )
+        if out:
+            asyncio.get_event_loop().call_soon( self.protocol.data_received, out )
+
+    def close( self ):
+        if not self.closed:
+            self.closed = True
+            self.protocol.connection_lost( None )
+
+    def is_closing( self ):
+        return self.closed
+
+
+class AsyncLoopbackPort(AsyncPort):
+    '''connect to an in-process device object, for tests without hardware'''
+
+    async def connect( self ):
+        if self.transport is not None:
+            return
+        device = self.__dict__.get('device', None)
+        if device is None:
+            device = self.device = LoopbackShell()
+        self.protocol = ShellProtocol()
+        self.transport = LoopbackTransport( device, self.protocol )
+
+
+
+class AsyncInstrument:
+    '''asyncio instrument, use await on connect/writeCommand'''
+
+    DEFAULT_NAME = 'INST'
+    DEFAULT_TERMINATOR_WRITE = Instrument.DEFAULT_TERMINATOR_WRITE
+    DEFAULT_TERMINATOR_READ = Instrument.DEFAULT_TERMINATOR_READ
+    DEFAULT_TERMINATOR_RESET = Instrument.DEFAULT_TERMINATOR_RESET
+    DEFAULT_TIMEOUT = Instrument.DEFAULT_TIMEOUT
+    DEFAULT_PROMPTS = Instrument.DEFAULT_PROMPTS
+    DEFAULT_PROMPTS_MULTILINE = Instrument.DEFAULT_PROMPTS_MULTILINE
+    DEFAULT_IDN = Instrument.DEFAULT_IDN
+
+    DEFAULT_TERMINAL_RESET = True
+    DEFAULT_CHECK_IDN = True
+    DEFAULT_CHECK_RETURN_COMMAND = True
+
+    PORT_TYPE = AsyncSerialPort
+
+    def __init__( self, *args, **kwargs ):
+        '''init, call connect() later'''
+        self.logger = logging.getLogger( self.DEFAULT_NAME )
+        self.returned_cmd = None
+        self.returned_prompt = None
+        try:
+            kwargs['port'] = args[0]
+        except IndexError:
+            pass
+        kwargs.setdefault( 'port', Env.PORT )
+        kwargs.setdefault( 'baudrate', Env.BAUDRATE )
+        kwargs.setdefault( 'rtscts', Env.RTSCTS )
+        kwargs.setdefault( 'parity', Env.PARITY )
+        kwargs.setdefault( 'prompts', self.DEFAULT_PROMPTS )
+        kwargs.setdefault( 'timeout', self.DEFAULT_TIMEOUT )
+        if 'terminal_reset' in kwargs:
+            self.DEFAULT_TERMINAL_RESET = bool(kwargs.pop('terminal_reset'))
+        if 'check_idn' in kwargs:
+            self.DEFAULT_CHECK_IDN = bool(kwargs.pop('check_idn'))
+        for n in ['baudrate', 'timeout']:
+            kwargs['_'+n] = kwargs.pop(n)
+        self.prompts = kwargs.pop('prompts')
+        self.idn = None
+        self.serial_number = None
+        self.rx_buffer = bytearray()
+        self.log_subscribers = []  # used by the shared parser, not routed here
+        self.log_dropped = 0
+        self.recovery = {'timeouts': 0, 'resyncs': 0, 'resync_failures': 0, 'resync_time': 0.0}
+        self.port = self.PORT_TYPE( self, **kwargs )
+
+    @property
+    def connected( self ):
+        return self.port.connected
+
+    # share the parsers with Instrument
+    _decodeLine = Instrument._decodeLine
+    _parseReceived = Instrument._parseReceived
+    _raiseTimeout = Instrument._raiseTimeout
+    setPrompts = Instrument.setPrompts
+    checkReturnedCommand = Instrument.checkReturnedCommand
+    checkReturnedPrompt = Instrument.checkReturnedPrompt
+
+    def setTimeout( self, new=None ):
+        if new is None:
+            new = self.DEFAULT_TIMEOUT
+        old = self.port.timeout
+        self.port.timeout = new
+        return old
+
+    async def connect( self ):
+        '''connect'''
+        await self.port.connect()
+        if self.DEFAULT_TERMINAL_RESET:
+            self.logger.debug( '[RST]' )
+            self.port.write( self.DEFAULT_TERMINATOR_RESET )
+            await self.port.drain()
+            await self.readUntilPrompts()
+        if self.DEFAULT_CHECK_IDN:
+            await self.scpiIdn()
+        return self
+
+    def disconnect( self ):
+        '''disconnect'''
+        self.port.disconnect()
+
+    async def readChunk( self ):
+        '''append incoming bytes to rx_buffer, return False when timeout'''
+        chunk = await self.port.read_chunk()
+        if not chunk:
+            return False
+        self.rx_buffer += chunk
+        return True
+
+    async def readUntilPrompts( self, line_callback=None ):
+        '''read until prompts'''
+        contents = []
+        while not self._parseReceived( contents, line_callback ):
+            if not await self.readChunk():
+                self._raiseTimeout( contents )
+        return contents
+
+    async def writeLine( self, dat ):
+        if isinstance( dat, bytes ):
+            self.logger.debug( '[T] '+str(dat) )
+        else:
+            self.logger.debug( '[T] '+dat )
+            dat = dat.encode('utf8')
+        self.port.write( dat + self.DEFAULT_TERMINATOR_WRITE.encode('utf8') )
+        await self.port.drain()
+
+    async def writeCommand( self, cmd, strip=True ):
+        '''write command and wait for prompts'''
+        if strip:
+            cmd = cmd.strip()
+        await self.writeLine( cmd )
+        ret = await self.readUntilPrompts()
+        self.checkReturnedPrompt( ret )
+        if cmd and self.DEFAULT_CHECK_RETURN_COMMAND and not Env.NO_ECHO_CHECK:
+            self.checkReturnedCommand( ret, cmd )
+        return ret[1:-1]
+
+    async def scpiRst( self ):
+        '''scpi reset'''
+        await self.writeCommand( '*rst' )
+
+    async def scpiIdn( self, check=True ):
+        '''get identify name'''
+        ret = await self.writeCommand( '*idn?' )
+        self.idn = ret[0].strip()
+        if len(ret)>1:
+            self.serial_number = ret[1].strip()
+        self.logger.info( 'IDN:%s', str(self.idn) )
+        if check and (not Env.NO_IDN_CHECK):
+            if not self.DEFAULT_IDN.match( self.idn ):
+                raise IDNMatchError(self.idn.split(',')[0])
+        return self.idn
+
+    async def getModel( self ):
+        if self.idn is None:
+            await self.scpiIdn()
+        try:
+            return self.idn.split(',')[0]
+        except IndexError:
+            return ''
+
+    async def getVersion( self ):
+        if self.idn is None:
+            await self.scpiIdn()
+        try:
+            return self.idn.split(',')[1]
+        except IndexError:
+            return ''
+
+    async def getSerialNumber( self ):
+        if self.serial_number is None:
+            ret = await self.writeCommand( '*idn?' )
+            if len(ret) > 1:
+                self.serial_number = ret[1].strip()
+        if self.serial_number is None:
+            return ''
+        return self.serial_number
+
+
+class AsyncSerialInstrument(AsyncInstrument):
+    '''Serial port based instruments'''
+    PORT_TYPE = AsyncSerialPort
+
+
+class AsyncSocketInstrument(AsyncInstrument):
+    '''Socket port based instruments'''
+    PORT_TYPE = AsyncSocketPort
+
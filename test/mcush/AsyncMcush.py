@@ -0,0 +1,235 @@
+# coding:utf8
+__doc__ = 'asyncio mcush controller, python 3.5+ only'
+__author__ = 'Peng Shulin <trees_peng@163.com>'
+__license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
+import time
+import base64
+import asyncio
+from . import Env
+from . import Utils
+from . import Instrument
+from . import Mcush
+from . import AsyncInstrument
+
+
+
+class AsyncMcush( AsyncInstrument.AsyncSerialInstrument ):
+    '''Mcush core, common commands as coroutines'''
+    DEFAULT_NAME = Mcush.Mcush.DEFAULT_NAME
+    DEFAULT_IDN = Mcush.Mcush.DEFAULT_IDN
+    DEFAULT_CMD_LINE_LIMIT = Mcush.Mcush.DEFAULT_CMD_LINE_LIMIT
+    DEFAULT_CMD_ARGV_LIMIT = Mcush.Mcush.DEFAULT_CMD_ARGV_LIMIT
+    DEFAULT_REBOOT_RETRY = Mcush.Mcush.DEFAULT_REBOOT_RETRY
+    DEFAULT_DELAY_AFTER_REBOOT = Mcush.Mcush.DEFAULT_DELAY_AFTER_REBOOT
+
+    parseMemLine = Mcush.Mcush.parseMemLine
+    parseMemLines = Mcush.Mcush.parseMemLines
+    convPathname = Mcush.Mcush.convPathname
+
+    async def getLedNumber( self ):
+        r = await self.writeCommand( 'led -n' )
+        return int(r[0])
+
+    async def led( self, idx, on=None, toggle=None ):
+        '''led control'''
+        if on is None and toggle is None:
+            r = await self.writeCommand( 'led -i%d'% (idx) )
+            return bool(r[0].strip() == '1')
+        else:
+            cmd = 'led -i%d'% (idx)
+            if toggle is not None:
+                cmd += ' -t'
+            else:
+                cmd += ' -s' if on else ' -c'
+            await self.writeCommand( cmd )
+
+    async def ledOn( self, idx ):
+        await self.led( idx, on=True )
+
+    async def ledOff( self, idx ):
+        await self.led( idx, on=False )
+
+    async def ledToggle( self, idx ):
+        await self.led( idx, toggle=True )
+
+    async def gpio( self, port, i=None, o=None, s=None, c=None, t=None ):
+        '''gpio control'''
+        cmd = 'gpio -p%s'% str(port)
+        for opt, val in [('i', i), ('o', o), ('s', s), ('c', c), ('t', t)]:
+            if val is None:
+                continue
+            if type(val) is int:
+                cmd += ' -%s0x%x'% (opt, val)
+            elif type(val) is bool and val:
+                cmd += ' -%s'% opt
+        ret = await self.writeCommand( cmd )
+        if ret:
+            return eval(ret[0])
+
+    async def pinInput( self, pin ):
+        await self.gpio( pin, i=True )
+
+    async def pinOutput( self, pin ):
+        await self.gpio( pin, o=True )
+
+    async def pinSet( self, pin ):
+        await self.gpio( pin, s=True )
+
+    async def pinClr( self, pin ):
+        await self.gpio( pin, c=True )
+
+    async def pinToggle( self, pin ):
+        await self.gpio( pin, t=True )
+
+    async def pinRead( self, pin ):
+        return await self.gpio( pin )
+
+    async def readMem( self, addr, length=1, compact_mode=False ):
+        '''get memory'''
+        cmd = 'x -b 0x%X -l %d'% ( addr, length )
+        if compact_mode:
+            cmd += ' -c'
+        ret = await self.writeCommand( cmd )
+        mem = self.parseMemLines( [line.strip() for line in ret], compact_mode )
+        return mem[:length]
+
+    async def uptime( self ):
+        return (await self.writeCommand('uptime'))[0].strip()
+
+    async def reboot( self ):
+        '''reboot controller and reconnect'''
+        try:
+            await self.writeCommand( 'reboot' )
+        except (Instrument.ResponseError, Instrument.CommandTimeoutError):
+            pass
+        self.disconnect()
+        for retry in range(self.DEFAULT_REBOOT_RETRY):
+            try:
+                await self.connect()
+                return
+            except Exception:
+                self.disconnect()
+                await asyncio.sleep( self.DEFAULT_DELAY_AFTER_REBOOT )
+        raise Instrument.CommandTimeoutError()
+
+    async def getRebootCounter( self ):
+        ret = await self.writeCommand( 'reboot -c' )
+        return int(ret[0])
+
+    async def checkCommand( self, name ):
+        ret = await self.writeCommand( '? -c %s'% name )
+        return bool(int(ret[0]))
+
+    async def errno( self, new=None ):
+        '''set/get error number'''
+        if new is None:
+            ret = await self.writeCommand( 'error' )
+            return int(ret[0].strip())
+        else:
+            await self.writeCommand( 'error %d'% int(new) )
+
+    async def beep( self, freq=None, duration=0.05 ):
+        cmd = 'beep'
+        if freq:
+            cmd += ' -f%d'% freq
+        if duration:
+            cmd += ' %d'% (int(duration*1000))
+        await self.writeCommand( cmd )
+
+    async def list( self, pathname=None ):
+        cmd = 'ls %s'% pathname if pathname else 'ls'
+        flist = []
+        path = ''
+        for l in await self.writeCommand( cmd ):
+            if l.startswith('/'):
+                path = l.strip().rstrip(':')
+                flist.append( (path, None, None) )
+            else:
+                a, b = l.lstrip().split('  ')
+                flist.append( (path, b, int(a)) )
+        return flist
+
+    async def cat( self, pathname, b64=False ):
+        '''read file'''
+        cmd = 'cat -b ' if b64 else 'cat '
+        cmd += self.convPathname( pathname )
+        ret = '\n'.join(await self.writeCommand( cmd ))
+        if b64:
+            ret = base64.decodebytes( ret.encode('utf8') )
+        return ret
+
+    async def getFile( self, pathname, local_pathname ):
+        dat = await self.cat( pathname, b64=True )
+        open( local_pathname, 'wb+' ).write(dat)
+
+    async def remove( self, pathname ):
+        await self.writeCommand( 'rm ' + self.convPathname( pathname ) )
+
+    async def spiffsInfo( self ):
+        ret = await self.writeCommand( 'spiffs -c info' )
+        var = Utils.parseKeyValueLines( ret )
+        var['total'] = int(var['total'])
+        var['used'] = int(var['used'])
+        var['free'] = var['total'] - var['used']
+        return var
+
+    async def i2c( self, write=[], read=None, addr=None, no_stop_bit=None ):
+        cmd = 'i2c'
+        if addr is not None:
+            cmd += ' -a0x%X'% addr
+        if read:
+            cmd += ' -r%d'% read
+        if no_stop_bit:
+            cmd += ' -n'
+        if write:
+            cmd += ' %s'% (' '.join([str(i) for i in write]))
+        ret = await self.writeCommand( cmd )
+        if read:
+            return [eval(v) for l in ret for v in l.strip().split()]
+
+    async def spi( self, write=[], read=None ):
+        cmd = 'spi'
+        if read:
+            cmd += ' -r'
+        for d in write:
+            cmd += ' %d'% d
+        ret = await self.writeCommand( cmd )
+        if read:
+            return [eval(v) for l in ret for v in l.strip().split()]
+
+    async def adc( self, channel=None ):
+        if channel is None:
+            ret = await self.writeCommand( "adc" )
+            return [float(v) for v in ret[0].split(',')]
+        else:
+            ret = await self.writeCommand( "adc -i%d"% channel )
+            return float(ret[0])
+
+    async def rtcSync( self ):
+        t = time.localtime()
+        cmd = 'rtc -s %d-%d-%d %d:%d:%d'% (t.tm_year, t.tm_mon, t.tm_mday,
+                                           t.tm_hour, t.tm_min, t.tm_sec )
+        await self.writeCommand( cmd )
+
+    async def rtcRead( self ):
+        try:
+            r = await self.writeCommand( 'rtc' )
+            d, t = r[0].split(' ')
+        except Instrument.CommandExecuteError:
+            return None
+        YEAR, MONTH, MDAY = d.split('-')
+        HOUR, MIN, SEC = t.split(':')
+        return (int(YEAR), int(MONTH), int(MDAY), int(HOUR), int(MIN), int(SEC), 0, 1, -1)
+
+    async def crc( self, pathname ):
+        ret = await self.writeCommand( 'crc %s'% pathname )
+        return int(ret[0], 16)
+
+    async def env( self ):
+        return Utils.parseKeyValueLines( await self.writeCommand('env') )
+
+
+class AsyncLoopbackMcush( AsyncMcush ):
+    '''AsyncMcush connected to an in-process device, pass device=<obj>'''
+    PORT_TYPE = AsyncInstrument.AsyncLoopbackPort
+
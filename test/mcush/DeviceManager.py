@@ -0,0 +1,180 @@
+# coding: utf8
+__doc__ = 'multiple devices manager with parallel discovery and control'
+__author__ = 'Peng Shulin <trees_peng@163.com>'
+__license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
+import threading
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+from . import Utils
+from . import Instrument
+from . import Mcush
+
+
+PROBE_ERRORS = (
+    Instrument.PortNotFound,
+    Instrument.UnknownPortError,
+    Instrument.IDNMatchError,
+    Instrument.CommandTimeoutError,
+    Instrument.CommandSyntaxError,
+    Instrument.CommandExecuteError,
+    Instrument.ResponseError,
+)
+
+
+def parallel( func, items, threads=None ):
+    '''call func(item) in worker threads, return [(item, result, exception)] in order'''
+    items = list(items)
+    if threads is None:
+        threads = DeviceManager.DEFAULT_THREADS
+    results = [None] * len(items)
+    queue = Queue()
+    for i, item in enumerate(items):
+        queue.put( (i, item) )
+    def worker():
+        while True:
+            try:
+                i, item = queue.get( block=False )
+            except Empty:
+                return
+            try:
+                results[i] = (item, func(item), None)
+            except Exception as e:
+                results[i] = (item, None, e)
+    workers = [threading.Thread( target=worker ) for i in range(min(threads, len(items)))]
+    for w in workers:
+        w.daemon = True
+        w.start()
+    for w in workers:
+        w.join()
+    return results
+
+
+class DeviceManager:
+    '''discover devices in parallel, keep them by serial number and run jobs on all of them'''
+    DEFAULT_PROBE_TIMEOUT = 0.5
+    DEFAULT_THREADS = 64
+
+    def __init__( self, cls=None, probe_timeout=None, threads=None, **kwargs ):
+        self.cls = Mcush.Mcush if cls is None else cls
+        self.probe_timeout = self.DEFAULT_PROBE_TIMEOUT if probe_timeout is None else probe_timeout
+        self.threads = self.DEFAULT_THREADS if threads is None else threads
+        self.kwargs = kwargs  # passed to the instrument class
+        self.devices = {}
+        self.lock = threading.Lock()
+
+    def __len__( self ):
+        return len(self.devices)
+
+    def __iter__( self ):
+        return iter(self.keys())
+
+    def __getitem__( self, key ):
+        return self.devices[key]
+
+    def __contains__( self, key ):
+        return key in self.devices
+
+    def keys( self ):
+        return sorted(self.devices.keys())
+
+    def getKey( self, device ):
+        '''registry key: serial number, or idn@port if not available'''
+        sn = device.serial_number
+        if sn:
+            return sn
+        return '%s@%s'% (device.idn, device.port.port)
+
+    def register( self, device ):
+        key = self.getKey( device )
+        with self.lock:
+            old = self.devices.get( key )
+            self.devices[key] = device
+        if old is not None and old is not device:
+            old.disconnect()
+        return key
+
+    def unregister( self, key ):
+        with self.lock:
+            device = self.devices.pop( key, None )
+        if device is not None:
+            device.disconnect()
+
+    def probe( self, port ):
+        '''connect with short timeout and identify, return device or None'''
+        kwargs = dict(self.kwargs)
+        timeout = kwargs.pop( 'timeout', None )
+        kwargs['check_idn'] = False
+        kwargs['timeout'] = self.probe_timeout
+        kwargs['connect'] = False
+        device = None
+        try:
+            device = self.cls( port, **kwargs )
+            device.connect()
+            device.scpiIdn()
+            # restore the static timeout too, adaptive timeout and resync
+            # are bounded by it
+            if timeout is None:
+                timeout = device.DEFAULT_TIMEOUT
+            device._timeout = timeout
+            device.setTimeout( timeout )
+            return device
+        except Exception as e:
+            # never leave a foreign port open
+            if device is not None:
+                device.disconnect()
+            if isinstance(e, PROBE_ERRORS):
+                return None
+            raise
+
+    def discover( self, ports=None ):
+        '''probe all ports in parallel, return keys of the devices found'''
+        if ports is None:
+            ports = Utils.enumPorts()
+        ports = [p for p in ports if not self.findPort(p)]
+        found = []
+        for port, device, err in parallel( self.probe, ports, self.threads ):
+            if device is not None:
+                found.append( self.register( device ) )
+        return found
+
+    def findPort( self, port ):
+        '''return key of device opened on port'''
+        with self.lock:
+            for k, d in self.devices.items():
+                if d.port.port == port:
+                    return k
+        return None
+
+    def run( self, func, args=(), kwargs=None, keys=None, raise_error=False ):
+        '''call func(device, *args, **kwargs) or device.func(*args, **kwargs) on
+           all (or selected) devices in parallel, return {key: result}
+           failed devices get their exception as result if raise_error is False'''
+        if kwargs is None:
+            kwargs = {}
+        if keys is None:
+            keys = self.keys()
+        def job( key ):
+            device = self.devices[key]
+            if callable(func):
+                return func( device, *args, **kwargs )
+            else:
+                return getattr(device, func)( *args, **kwargs )
+        results = {}
+        errors = []
+        for key, ret, err in parallel( job, keys, self.threads ):
+            if err is not None:
+                results[key] = err
+                errors.append( err )
+            else:
+                results[key] = ret
+        if raise_error and errors:
+            raise errors[0]
+        return results
+
+    def close( self ):
+        '''disconnect all devices'''
+        for key in self.keys():
+            self.unregister( key )
+
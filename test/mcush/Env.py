@@ -7,7 +7,6 @@ from os.path import isdir, join
 from sys import platform, version_info
 from binascii import unhexlify
 from tempfile import mktemp
-from subprocess import check_output
 
 
 _bool_true_list = ['1', 'Y', 'y', 'T', 't', 'yes', 'Yes', 'YES', 'true', 'True', 'TRUE']
@@ -52,21 +51,52 @@ if platform == 'win32':
     PORT = getenv('PORT', 'COM1')
 else:
     PORT = getenv('PORT', '/dev/ttyUSB0')
-    try:
-        PORTS = check_output(['allports']).strip().decode(encoding='utf8')
-        PORTS_LIST = PORTS.split(',')
-    except:
-        PORTS_LIST = []
+
+_ports_list = None
+
+def getPortsList():
+    '''ports listed by the 'allports' tool, probed at the first call'''
+    global _ports_list
+    if _ports_list is None:
+        if platform == 'win32':
+            _ports_list = []
+        else:
+            try:
+                from subprocess import check_output
+                ports = check_output(['allports']).strip().decode(encoding='utf8')
+                _ports_list = ports.split(',')
+            except:
+                _ports_list = []
+    return _ports_list
+
+def __getattr__( name ):
+    # PORTS/PORTS_LIST are evaluated when accessed (python 3.7+)
+    if name == 'PORTS_LIST':
+        return getPortsList()
+    elif name == 'PORTS':
+        return ','.join(getPortsList())
+    raise AttributeError( "module '%s' has no attribute '%s'"% (__name__, name) )
+
+if version_info < (3, 7) and platform != 'win32':
+    PORTS_LIST = getPortsList()
+    PORTS = ','.join(PORTS_LIST)
+
 BAUDRATE = getenv_int( 'BAUDRATE', 9600 )
 RTSCTS = getenv_bool( 'RTSCTS' )
 PARITY = getenv( 'PARITY', 'N' )
+BAUDRATE_UPSHIFT = getenv_bool( 'BAUDRATE_UPSHIFT' )
+BAUDRATE_MAX = getenv_int( 'BAUDRATE_MAX', 0 )
+BAUDRATE_CACHE = getenv( 'BAUDRATE_CACHE' )  # not persisted if not set
 TIMEOUT = getenv_int('TIMEOUT', 5)
+ADAPTIVE_TIMEOUT = getenv_bool( 'ADAPTIVE_TIMEOUT' )
 COMMAND_FAIL_RETRY = getenv_int( 'COMMAND_FAIL_RETRY', 3 )
 
 DELAY = getenv_float( 'DELAY', 1 )
 RETRY = getenv_int( 'RETRY', 1000 )
 NO_ECHO_CHECK = getenv_bool( 'NO_ECHO_CHECK' )
 NO_IDN_CHECK = getenv_bool( 'NO_IDN_CHECK' )
+NO_QUERY_CACHE = getenv_bool( 'NO_QUERY_CACHE' )
+QUERY_CACHE_FILE = getenv( 'QUERY_CACHE_FILE' )  # not persisted if not set
 COMPACT_MODE = getenv_bool( 'COMPACT_MODE' )
 
 DEVELOPMENT = getenv_bool( 'DEVELOPMENT' )
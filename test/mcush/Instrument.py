@@ -5,6 +5,10 @@ __license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
 from re import compile as re_compile
 import time
 import logging
+try:
+    from Queue import Queue, Full
+except ImportError:
+    from queue import Queue, Full
 from . import Env, Utils
 
 if Env.LOGGING_FORMAT:
@@ -36,6 +40,8 @@ class CommandTimeoutError( Exception ):
 class IDNMatchError( Exception ):
     pass
 
+# stripped from both ends of the raw output lines
+RAW_WHITESPACE = b' \t\r\n'
 
 
 
@@ -50,11 +56,17 @@ class Instrument:
     DEFAULT_PROMPTS = re_compile( '[=#?!]>' )
     DEFAULT_PROMPTS_MULTILINE = re_compile( '[=#?!]?>' )
     DEFAULT_IDN = re_compile( '.*' )
+    DEFAULT_LOG_PATTERN = None  # asynchronous log lines, see subscribeLogs
 
     DEFAULT_TERMINAL_RESET = True
     DEFAULT_CHECK_IDN = True
     DEFAULT_READ_UNTIL_PROMPTS = True
     DEFAULT_CHECK_RETURN_COMMAND = True
+    DEFAULT_PIPELINE_WINDOW = 8  # max commands in flight
+    DEFAULT_PIPELINE_WINDOW_BYTES = 128  # device input queue size
+    DEFAULT_ADAPTIVE_TIMEOUT = Env.ADAPTIVE_TIMEOUT
+    DEFAULT_RESYNC_TIMEOUT = 1
+    DEFAULT_RESYNC_DRAIN_TIMEOUT = 0.05
    
 
     def __init__( self, *args, **kwargs ):
@@ -101,6 +113,8 @@ class Instrument:
             self.DEFAULT_TERMINAL_RESET = bool(kwargs['terminal_reset'])
         if 'check_idn' in kwargs:
             self.DEFAULT_CHECK_IDN = bool(kwargs['check_idn'])
+        stats = kwargs.pop('stats', False)
+        adaptive_timeout = kwargs.pop('adaptive_timeout', self.DEFAULT_ADAPTIVE_TIMEOUT)
         # some attributes 'connect', ...  need to be renamed for method conflict
         for n in ['connect', 'baudrate', 'timeout']:
             kwargs['_'+n] = kwargs.pop(n)
@@ -112,6 +126,22 @@ class Instrument:
         # init/connect
         self.idn = None
         self.serial_number = None
+        self.rx_buffer = bytearray()
+        self.rx_bytes = 0
+        self.t_first_byte = 0
+        self.command_stats = None
+        self.log_subscribers = []
+        self.log_dropped = 0
+        self.adaptive_timeout = None
+        self.t_rx_last = None  # silence tracking for adaptive timeout
+        self.rx_silence = 0
+        self.raw_patterns = None  # (prompts, bytes prompts, bytes eol)
+        self.recovery = {'timeouts': 0, 'resyncs': 0, 'resync_failures': 0, 'resync_time': 0.0}
+        self.commands_in_flight = 0  # written after the one being read, no resync then
+        if stats:
+            self.enableStats()
+        if adaptive_timeout:
+            self.enableAdaptiveTimeout()
         self.port = self.PORT_TYPE(self, *args, **kwargs)
         if self._connect:
             self.connect()
@@ -181,58 +211,166 @@ class Instrument:
             if not self.port.connect:
                 raise Exception("Fail to open port")
   
+    def _decodeLine( self, buf ):
+        # one char per byte, same as the former chr(ord(byte)) conversion
+        if Env.PYTHON_V3:
+            return buf.decode('latin1')
+        else:
+            return str(buf)
+
+    def readChunk( self ):
+        '''append incoming bytes to rx_buffer, return False when timeout'''
+        chunk = self.port.read_chunk()
+        if not chunk:
+            return False
+        if not isinstance(chunk, (bytes, bytearray)):
+            chunk = chunk.encode('latin1')
+        self.rx_buffer += chunk
+        self.rx_bytes += len(chunk)
+        if self.t_first_byte is None:
+            self.t_first_byte = time.time()
+        if self.t_rx_last is not None:
+            now = time.time()
+            if now - self.t_rx_last > self.rx_silence:
+                self.rx_silence = now - self.t_rx_last
+            self.t_rx_last = now
+        return True
+
+    def _parseReceived( self, contents, line_callback=None ):
+        '''split lines from rx_buffer into contents, return True when prompts matched'''
+        eol = self.DEFAULT_TERMINATOR_READ
+        if Env.PYTHON_V3:
+            eol = eol.encode('latin1')
+        eol_len = len(eol)
+        buf = self.rx_buffer
+        log_match = self.DEFAULT_LOG_PATTERN.match if self.log_subscribers else None
+        pos = 0
+        while True:
+            idx = buf.find( eol, pos )
+            if idx == -1:
+                break
+            newline_str = self._decodeLine( buf[pos:idx] )
+            match = self.prompts.match( newline_str )
+            if match:
+                # leading prompts, leave the remaining bytes buffered
+                del buf[:pos+match.end()]
+                contents.append( newline_str[:match.end()] )
+                return True
+            pos = idx + eol_len
+            newline_str = newline_str.rstrip()
+            if log_match is not None and log_match( newline_str ):
+                self.routeLog( newline_str )
+                continue
+            contents.append( newline_str )
+            self.logger.debug( '[R] '+ newline_str )
+            if line_callback is not None:
+                # use this carefully
+                line_callback( newline_str )
+        if pos:
+            del buf[:pos]
+        # prompts are not terminated, check the incomplete line
+        if buf:
+            newline_str = self._decodeLine( buf )
+            match = self.prompts.match( newline_str )
+            if match:
+                del buf[:match.end()]
+                contents.append( newline_str[:match.end()] )
+                return True
+        return False
+
+    def _raiseTimeout( self, contents ):
+        self.recovery['timeouts'] += 1
+        newline_str = self._decodeLine( self.rx_buffer )
+        del self.rx_buffer[:]
+        contents.append( newline_str )
+        self.logger.debug( '[R] '+ newline_str )
+        if contents:
+            raise CommandTimeoutError( ' | '.join(contents) )
+        else:
+            raise CommandTimeoutError( 'No response' )
+
     def readUntilPrompts( self, line_callback=None ):
         '''read until prompts'''
-        contents, newline_lst, newline_str = [], [], ''
+        contents = []
+        while not self._parseReceived( contents, line_callback ):
+            if not self.readChunk():
+                self._raiseTimeout( contents )
+        return contents
+
+    def readUntilPromptsRaw( self ):
+        '''read until prompts without decoding the output (python 3), return
+           [echoed command, line, ..., prompt], the output lines are stripped
+           memoryviews of one bytes copy of the response'''
+        prompts, eol = self._getRawPatterns()
+        eol_len = len(eol)
+        buf = self.rx_buffer
+        spans = []
+        pos = 0
         while True:
-            byte = self.port.read(1)
-            if byte:
-                if Env.PYTHON_V3:
-                    byte = chr(ord(byte))
-                if byte == self.DEFAULT_TERMINATOR_READ:
-                    newline_str = newline_str.rstrip()
-                    contents.append( newline_str )
-                    self.logger.debug( '[R] '+ newline_str )
-                    if line_callback is not None:
-                        # use this carefully
-                        line_callback( newline_str )
-                    newline_lst, newline_str = [], ''
-                else:
-                    newline_lst.append( byte )
-                    newline_str += byte
-            else:
-                contents.append( newline_str )
-                self.logger.debug( '[R] '+ newline_str )
-                if contents:
-                    raise CommandTimeoutError( ' | '.join(contents) )
-                else:
-                    raise CommandTimeoutError( 'No response' )
-            #print( newline_str )  # for port debug
-            match = self.prompts.match( newline_str )
+            idx = buf.find( eol, pos )
+            # prompts are not terminated, the incomplete line is checked too
+            match = prompts.match( buf, pos )
             if match:
-                contents.append( newline_str )
-                #self.logger.debug( '[P] '+ newline_str )
-                return contents
+                break
+            if idx == -1:
+                if not self.readChunk():
+                    self._raiseTimeout( [] )
+                continue
+            spans.append( (pos, idx) )
+            pos = idx + eol_len
+        end = match.end()
+        with memoryview( buf ) as view:
+            data = view[:end].tobytes()
+        del buf[:end]
+        prompt = data[pos:end].decode('latin1')
+        view = memoryview( data )
+        ret = []
+        for start, stop in spans:
+            while start < stop and data[start] in RAW_WHITESPACE:
+                start += 1
+            while stop > start and data[stop-1] in RAW_WHITESPACE:
+                stop -= 1
+            ret.append( view[start:stop] )
+        if ret:
+            # echoed command is compared as text
+            ret[0] = ret[0].tobytes().decode('latin1')
+        ret.append( prompt )
+        if self.logger.isEnabledFor( logging.DEBUG ):
+            for line in ret[1:]:
+                self.logger.debug( '[R] '+ (line if isinstance(line, str) else line.tobytes().decode('latin1')) )
+        return ret
+
+    def _getRawPatterns( self ):
+        # bytes version of the current prompts pattern and read terminator
+        cached = self.raw_patterns
+        if cached is None or cached[0] is not self.prompts:
+            cached = self.raw_patterns = ( self.prompts,
+                    re_compile( self.prompts.pattern.encode('latin1') ),
+                    self.DEFAULT_TERMINATOR_READ.encode('latin1') )
+        return cached[1], cached[2]
 
     def readLine( self, eol='\n', timeout=None, decode_utf8=True, strip=True ):
-        chars = []
-        if Env.PYTHON_V3:
-            eol = bytes(eol, encoding='utf8')
+        if Env.PYTHON_V3 and isinstance(eol, str):
+            eol = eol.encode('utf8')
         if timeout is not None:
             old_timeout = self.port.timeout
             self.port.timeout = timeout
+        buf = self.rx_buffer
+        pos = 0
         while True:
-            char = self.port.read(1) 
-            if char:
-                if char == eol:
-                    break
-                chars.append( char )
-            else:
+            idx = buf.find( eol, pos )
+            if idx != -1:
+                ret = bytes(buf[:idx])
+                del buf[:idx+len(eol)]
+                break
+            pos = len(buf)
+            if not self.readChunk():
+                ret = bytes(buf)
+                del buf[:]
                 break
         if timeout is not None:
             self.port.timeout = old_timeout
-        if chars:
-            ret = Env.EMPTY_BYTE.join(chars)
+        if ret:
             if strip:
                 ret = ret.strip()
             if decode_utf8:
@@ -244,7 +382,8 @@ class Instrument:
         else:
             return ''
 
-    def writeLine( self, dat, encode_utf8=True ):
+    def _encodeLine( self, dat, encode_utf8=True ):
+        '''return dat with write terminator appended'''
         if isinstance( dat, bytes ):
             self.logger.debug( '[T] '+str(dat) )
         else:
@@ -256,17 +395,181 @@ class Instrument:
             else:
                 if isinstance( dat, unicode ):
                     dat = dat.encode('utf8')
-        self.port.write( dat )
-        self.port.write( self.DEFAULT_TERMINATOR_WRITE )
+        eol = self.DEFAULT_TERMINATOR_WRITE
+        if isinstance( dat, (bytes, bytearray) ) and not isinstance( eol, (bytes, bytearray) ):
+            eol = eol.encode('latin1')
+        return dat + eol
+
+    def writeLine( self, dat, encode_utf8=True ):
+        # payload and terminator in one write
+        self.port.write( self._encodeLine( dat, encode_utf8 ) )
         self.port.flush()
+
+    def writeLines( self, lines, strip=True, window_bytes=None ):
+        '''write lines in batches and check their responses, each batch is
+           written at once and fits in the device input queue, return the
+           responses; used for multi-line input'''
+        if window_bytes is None:
+            window_bytes = self.DEFAULT_PIPELINE_WINDOW_BYTES
+        results = []
+        batch, buf = [], Env.EMPTY_BYTE
+        for line in lines:
+            if strip:
+                line = line.strip()
+            dat = self._encodeLine( line )
+            if batch and len(buf) + len(dat) > window_bytes:
+                results += self._writeBatch( batch, buf )
+                batch, buf = [], Env.EMPTY_BYTE
+            batch.append( line )
+            buf += dat
+        if batch:
+            results += self._writeBatch( batch, buf )
+        return results
+
+    def _writeBatch( self, batch, buf ):
+        t_write = None if self.command_stats is None else time.time()
+        self.port.write( buf )
+        self.port.flush()
+        # read all the responses to keep synchronized, then raise the first error
+        results, error = [], None
+        for line in batch:
+            try:
+                results.append( self.readCommandResponse( line, t_write ) )
+            except (CommandSyntaxError, CommandExecuteError, ResponseError) as e:
+                results.append( e )
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+        return results
    
-    def writeCommand( self, cmd, strip=True ):
-        '''write command and wait for prompts'''
+    def writeCommand( self, cmd, strip=True, raw=False ):
+        '''write command and wait for prompts, with raw=True the output lines
+           are returned as bytes-like objects, see readCommandResponse'''
         if strip:
             cmd = cmd.strip()
+        if self.command_stats is None and self.adaptive_timeout is None:
+            t_write = None
+        else:
+            t_write = time.time()
         self.writeLine( cmd )
+        return self.readCommandResponse( cmd, t_write, raw )
+
+    def readCommandResponse( self, cmd, t_write=None, raw=False ):
+        '''read and check the response of command already written;
+           raw=True is for binary payloads (memory, base64...): the output
+           lines are not decoded but returned as memoryviews of the received
+           bytes with python 3 (stripped bytes when falling back to the text
+           parser, with python 2 or when log lines are routed)'''
+        if self.adaptive_timeout is not None:
+            return self._readAdaptive( cmd, t_write, raw )
+        if self.command_stats is None:
+            return self._readCommandResponse( cmd, raw )
+        return self.command_stats.measure( self, cmd, t_write, raw )
+
+    def _readAdaptive( self, cmd, t_write=None, raw=False ):
+        static = self.port.timeout
+        if static != self._timeout:
+            # timeout set for special commands, not adapted
+            timeout = static
+        else:
+            timeout = self.adaptive_timeout.getTimeout( cmd, static )
+        if timeout != static:
+            self.port.timeout = timeout
+        self.rx_silence = 0
+        self.t_rx_last = time.time() if t_write is None else t_write
+        try:
+            if self.command_stats is None:
+                ret = self._readCommandResponse( cmd, raw )
+            else:
+                ret = self.command_stats.measure( self, cmd, t_write, raw )
+        except CommandTimeoutError:
+            if timeout != static:
+                self.port.timeout = static
+                timeout = static
+            if not self.commands_in_flight:
+                # or left to the pipeline, Ctrl-C would abort the queued commands
+                self.resync()
+            raise
+        finally:
+            self.t_rx_last = None
+            if timeout != static:
+                self.port.timeout = static
+        if static == self._timeout:
+            self.adaptive_timeout.update( cmd, self.rx_silence )
+        return ret
+
+    def enableAdaptiveTimeout( self, enable=True ):
+        '''adapt read timeout of each command to the measured silence'''
+        if enable:
+            if self.adaptive_timeout is None:
+                from . import AdaptiveTimeout
+                self.adaptive_timeout = AdaptiveTimeout.AdaptiveTimeout()
+        else:
+            self.adaptive_timeout = None
+
+    def resync( self, timeout=None ):
+        '''abort the pending command/input with Ctrl-C and synchronize
+           to the prompt, return True if succeeded'''
+        t0 = time.time()
+        self.recovery['resyncs'] += 1
+        if timeout is None:
+            timeout = self.DEFAULT_RESYNC_TIMEOUT
+            if self._timeout:
+                timeout = min( self._timeout, timeout )
+        old_timeout = self.setTimeout( timeout )
+        ok = True
+        try:
+            del self.rx_buffer[:]
+            self.port.write( self.DEFAULT_TERMINATOR_RESET )
+            self.port.flush()
+            self.readUntilPrompts()
+            # late output of the aborted command may be matched first
+            self.drain()
+        except CommandTimeoutError:
+            ok = False
+            self.recovery['resync_failures'] += 1
+        finally:
+            self.setTimeout( old_timeout )
+        dt = time.time() - t0
+        self.recovery['resync_time'] += dt
+        self.logger.warning( 'resync %s in %.3f s', 'done' if ok else 'failed', dt )
+        return ok
+
+    def drain( self, timeout=None ):
+        '''discard incoming bytes until the port is silent for timeout'''
+        if timeout is None:
+            timeout = self.DEFAULT_RESYNC_DRAIN_TIMEOUT
+        old_timeout = self.setTimeout( timeout )
+        try:
+            while self.readChunk():
+                pass
+        finally:
+            self.setTimeout( old_timeout )
+        del self.rx_buffer[:]
+
+    def recoveryStats( self ):
+        '''return counters of timeouts and resync, and the adaptive timeouts'''
+        ret = dict(self.recovery)
+        if self.adaptive_timeout is not None:
+            ret['adaptive_timeout'] = self.adaptive_timeout.snapshot( self._timeout )
+        return ret
+
+    def _readCommandResponse( self, cmd, raw=False ):
         if self.DEFAULT_READ_UNTIL_PROMPTS:
-            ret = self.readUntilPrompts()
+            if not raw:
+                ret = self.readUntilPrompts()
+            elif Env.PYTHON_V3 and not self.log_subscribers:
+                ret = self.readUntilPromptsRaw()
+                if ret[-1][:1] in ['?', '!']:
+                    # error messages are text
+                    ret[1:-1] = [line.tobytes().decode('latin1') for line in ret[1:-1]]
+            else:
+                ret = self.readUntilPrompts()
+                if Env.PYTHON_V3:
+                    ret[1:-1] = [line.strip().encode('latin1') for line in ret[1:-1]]
+                else:
+                    ret[1:-1] = [line.strip() for line in ret[1:-1]]
             #for line in [i.strip() for i in ret]:
             #    self.logger.debug( '[R] '+ line )
             self.checkReturnedPrompt( ret )
@@ -276,19 +579,109 @@ class Instrument:
         else:
             return []
     
-    def writeCommandRetry( self, cmd, retry=None ):
+    def enableStats( self, enable=True ):
+        '''enable/disable per command statistics'''
+        if enable:
+            if self.command_stats is None:
+                from . import Stats
+                self.command_stats = Stats.CommandStats()
+        else:
+            self.command_stats = None
+
+    def stats( self ):
+        '''return snapshot of command statistics, {verb: {counter: value}}'''
+        if self.command_stats is None:
+            return {}
+        return self.command_stats.snapshot()
+
+    def resetStats( self ):
+        if self.command_stats is not None:
+            self.command_stats.reset()
+
+    def subscribeLogs( self, callback=None, maxsize=0 ):
+        '''route log lines received during commands (and pollLogs) to a new
+           Queue which is returned, or to callback(line) in the reading thread'''
+        if self.DEFAULT_LOG_PATTERN is None:
+            raise NotImplementedError( 'log format not defined' )
+        subscriber = Queue( maxsize ) if callback is None else callback
+        self.log_subscribers.append( subscriber )
+        return subscriber
+
+    def unsubscribeLogs( self, subscriber ):
+        if subscriber in self.log_subscribers:
+            self.log_subscribers.remove( subscriber )
+
+    def routeLog( self, line ):
+        self.logger.debug( '[L] '+ line )
+        for subscriber in self.log_subscribers:
+            if callable(subscriber):
+                subscriber( line )
+            else:
+                try:
+                    subscriber.put_nowait( line )
+                except Full:
+                    self.log_dropped += 1
+
+    def pollLogs( self, timeout=0 ):
+        '''read log lines printed while no command is running, the other lines
+           are left buffered for the next command, return count of log lines'''
+        eol = self.DEFAULT_TERMINATOR_READ
+        if Env.PYTHON_V3:
+            eol = eol.encode('latin1')
+        old_timeout = self.setTimeout( timeout )
+        try:
+            while self.readChunk():
+                pass
+        finally:
+            self.setTimeout( old_timeout )
+        buf = self.rx_buffer
+        count = 0
+        while self.log_subscribers:
+            idx = buf.find( eol )
+            if idx == -1:
+                break
+            line = self._decodeLine( buf[:idx] ).rstrip()
+            if not self.DEFAULT_LOG_PATTERN.match( line ):
+                break
+            del buf[:idx+len(eol)]
+            self.routeLog( line )
+            count += 1
+        return count
+
+    def pipeline( self, window=None, window_bytes=None ):
+        '''create pipeline for streaming commands, use in with statement'''
+        return Pipeline( self, window, window_bytes )
+
+    def writeCommands( self, cmds, window=None, window_bytes=None, raise_error=True ):
+        '''write commands in pipeline mode, return list of results
+           failed commands get their exception as result if raise_error is False'''
+        p = Pipeline( self, window, window_bytes )
+        for cmd in cmds:
+            p.writeCommand( cmd )
+        p.flush()
+        if raise_error and p.errors:
+            raise p.errors[0][2]
+        return p.results
+
+    def writeCommandRetry( self, cmd, retry=None, raw=False ):
         '''write command with retry '''
         if retry is None:
             retry = Env.COMMAND_FAIL_RETRY
         assert retry > 1
         for r in range(retry-1):
             try:
-                ret = self.writeCommand( cmd )
+                ret = self.writeCommand( cmd, raw=raw )
                 return ret
+            except CommandTimeoutError as e:
+                if Env.VERBOSE:
+                    print( e )
+                if self.adaptive_timeout is None:
+                    # resync before retry, done already in adaptive mode
+                    self.resync()
             except Exception as e:
                 if Env.VERBOSE:
                     print( e )
-        return self.writeCommand( cmd )
+        return self.writeCommand( cmd, raw=raw )
   
     def checkReturnedCommand( self, ret, cmd ):
         '''assert command returned is valid'''
@@ -359,7 +752,8 @@ class Instrument:
             return ''
 
     def getSerialNumber( self ):
-        if self.serial_number is None:
+        if self.serial_number is None and self.idn is None:
+            # no serial number if identified already
             ret = self.writeCommand( '*idn?' )
             if len(ret) > 1:
                 self.serial_number = ret[1].strip()
@@ -386,6 +780,90 @@ class Instrument:
         print( '%s, %s'% (self.getModel(), self.getVersion()) )
 
 
+class Pipeline:
+    '''stream commands without waiting for the prompts one by one,
+       responses are read back in order when the window is full'''
+
+    def __init__( self, instrument, window=None, window_bytes=None ):
+        self.instrument = instrument
+        if window is None:
+            window = instrument.DEFAULT_PIPELINE_WINDOW
+        if window_bytes is None:
+            window_bytes = instrument.DEFAULT_PIPELINE_WINDOW_BYTES
+        self.window = max(1, int(window))
+        self.window_bytes = int(window_bytes)
+        self.pending = []  # (index, cmd, size, write time) in flight
+        self.results = []
+        self.errors = []  # (index, cmd, exception)
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_value, traceback ):
+        if exc_type is None:
+            self.flush()
+            if self.errors:
+                raise self.errors[0][2]
+        elif not issubclass(exc_type, CommandTimeoutError):
+            # keep the link synchronized before propagating
+            try:
+                self.flush()
+            except CommandTimeoutError:
+                pass
+        return False
+
+    def full( self, size ):
+        if not self.pending:
+            return False
+        if len(self.pending) >= self.window:
+            return True
+        # the oldest one has been taken by the shell before it was executed
+        queued = sum([p[2] for p in self.pending[1:]])
+        return queued + size > self.window_bytes
+
+    def writeCommand( self, cmd, strip=True ):
+        '''write command, return the index of its result'''
+        if strip:
+            cmd = cmd.strip()
+        size = len(cmd) + len(self.instrument.DEFAULT_TERMINATOR_WRITE)
+        while self.full( size ):
+            self.readResponse()
+        index = len(self.results)
+        self.results.append( None )
+        t_write = None if self.instrument.command_stats is None else time.time()
+        self.instrument.writeLine( cmd )
+        self.pending.append( (index, cmd, size, t_write) )
+        self.instrument.commands_in_flight += 1
+        return index
+
+    def readResponse( self ):
+        '''read response of the oldest command in flight'''
+        index, cmd, size, t_write = self.pending.pop(0)
+        self.instrument.commands_in_flight -= 1
+        try:
+            self.results[index] = self.instrument.readCommandResponse( cmd, t_write )
+        except (CommandSyntaxError, CommandExecuteError, ResponseError) as e:
+            self.results[index] = e
+            self.errors.append( (index, cmd, e) )
+        except CommandTimeoutError:
+            self.abort()
+            raise
+
+    def abort( self ):
+        '''drop the commands in flight after a timeout, their responses can not
+           be matched in order any more, and resync'''
+        if self.pending:
+            self.instrument.commands_in_flight -= len(self.pending)
+            self.pending = []
+            self.instrument.resync()
+
+    def flush( self ):
+        '''read all the responses left'''
+        while self.pending:
+            self.readResponse()
+        return self.results
+
+
 class Port(object):
     
     def __init__( self, parent, *args, **kwargs ):
@@ -419,6 +897,20 @@ class Port(object):
     def readall( self ):
         raise
 
+    @property
+    def in_waiting( self ):
+        return 0
+
+    def read_chunk( self ):
+        '''read all the waiting bytes, block until timeout for the first one'''
+        waiting = self.in_waiting
+        ret = self.read( waiting if waiting else 1 )
+        if ret and not waiting:
+            waiting = self.in_waiting
+            if waiting:
+                ret += self.read( waiting )
+        return ret
+
     def update_baudrate( self, baudrate ):
         pass
  
@@ -494,6 +986,13 @@ class SerialPort(Port):
     def readall( self ):
         return self.read( self.ser.in_waiting )
 
+    @property
+    def in_waiting( self ):
+        try:
+            return self.ser.in_waiting
+        except self.serial_exception as e:
+            raise UnknownPortError( str(e) )
+
     def write( self, buf ):
         try:
             #print(type(buf), buf)
@@ -511,34 +1010,117 @@ class SerialPort(Port):
  
 
 class SocketPort(Port):
+    RECV_BUFFER_SIZE = 4096
+    nodelay = False  # TCP_NODELAY, can be set with kwargs
+    keepalive = False  # SO_KEEPALIVE, can be set with kwargs
         
     def __init__( self, parent, *args, **kwargs ):
         import socket
-        self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        from select import select
+        self.socket = socket
+        self.select = select
+        self.s = None
+        self.recv_buffer = bytearray(self.RECV_BUFFER_SIZE)
+        self.recv_view = memoryview(self.recv_buffer)
+        self.received = bytearray()
+        self.s_timeout = None  # set to the socket, changed only if differs
         Port.__init__( self, parent, *args, **kwargs )
         
     def connect( self ):
         if self._connected:
             return
+        socket = self.socket
+        self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.s.connect( (self.ip, int(self.port)) )
-        self.s.settimeout( self.timeout )
+        self.s_timeout = None
+        self._settimeout( self.timeout )
+        if self.nodelay:
+            self.s.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+        if self.keepalive:
+            self.s.setsockopt( socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1 )
+        del self.received[:]
         self._connected = True
 
     def disconnect( self ):
         self._connected = False
-        self.s.close()
-    
+        if self.s is not None:
+            self.s.close()
+            self.s = None
+
+    def update_timeout( self, timeout ):
+        if self.s is not None:
+            self._settimeout( timeout )
+
+    def _settimeout( self, timeout ):
+        if timeout != self.s_timeout:
+            self.s.settimeout( timeout )
+            self.s_timeout = timeout
+
+    def _recv( self, timeout ):
+        # receive into the preallocated buffer, return False when timeout/closed
+        if timeout == 0:
+            if not self.select( [self.s], [], [], 0 )[0]:
+                return False
+        else:
+            self._settimeout( timeout )
+        try:
+            size = self.s.recv_into( self.recv_buffer )
+        except self.socket.timeout:
+            return False
+        except self.socket.error as e:
+            raise UnknownPortError( str(e) )
+        if not size:
+            self._connected = False
+            return False
+        self.received += self.recv_view[:size]
+        return True
+
+    def _take( self, size ):
+        ret = bytes(self.received[:size])
+        del self.received[:size]
+        return ret
+ 
     def read( self, read_bytes=1 ):
+        if not self._connected:
+            return Env.EMPTY_BYTE
+        if len(self.received) < read_bytes:
+            deadline = None if self.timeout is None else time.time() + self.timeout
+            try:
+                while len(self.received) < read_bytes:
+                    if deadline is None:
+                        remaining = None
+                    else:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                    if not self._recv( remaining ):
+                        break
+            finally:
+                if self.s is not None:
+                    self._settimeout( self.timeout )
+        return self._take( read_bytes )
+
+    @property
+    def in_waiting( self ):
+        # collect what has arrived without blocking, one recv at most so
+        # a device streaming continuously does not keep it looping
         if self._connected:
-            ret = []
-            for i in range(read_bytes):
-                r = self.s.recv(1)
-                if r:
-                    ret.append( r )
-                else:
-                    break
-            #print( 'read', ret )
-            return Env.EMPTY_BYTE.join(ret)
+            self._recv( 0 )
+        return len(self.received)
+
+    def read_chunk( self ):
+        if not self._connected:
+            return Env.EMPTY_BYTE
+        if not self.received:
+            try:
+                self._recv( self.timeout )
+            finally:
+                if self.s is not None:
+                    self._settimeout( self.timeout )
+        return self._take( self.in_waiting )
+
+    def readall( self ):
+        return self._take( self.in_waiting )
 
     def write( self, buf ):
         if self._connected:
@@ -548,9 +1130,6 @@ class SocketPort(Port):
             self.s.sendall(buf)
  
 
-
-
-
 class SerialInstrument(Instrument):
     '''Serial port based instruments'''
     PORT_TYPE = SerialPort
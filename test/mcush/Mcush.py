@@ -6,10 +6,13 @@ import os
 import re
 import sys
 import time
+import json
 import base64
 import binascii
 import logging
 import hashlib
+import struct
+import threading
 from . import Env
 from . import Utils
 from . import Instrument
@@ -25,32 +28,292 @@ class Mcush( Instrument.SerialInstrument ):
     DEFAULT_CMD_LINE_LIMIT = 127
     DEFAULT_CMD_ARGV_LIMIT = 20
     DEFAULT_REBOOT_RETRY = 10
+    DEFAULT_TIMEOUT_SPIFFS_ERASE = 60
+    DEFAULT_TIMEOUT_UPGRADE_TRANSFER = 30
     DEFAULT_DELAY_AFTER_REBOOT = 1
+    DEFAULT_REBOOT_TIMEOUT = 10
+    DEFAULT_REBOOT_POLL_INTERVAL = 0.02
+    DEFAULT_REBOOT_PROBE_TIMEOUT = 0.1
+    DEFAULT_MEM_CHUNK = 4096  # bytes read by one command in iterMem
+    DEFAULT_WRITE_MEM_VERIFY = False
+    # log line: 'H:MM:SS.mmm T module: message' or 'Y-M-D HH:MM:SS T module: message'
+    DEFAULT_LOG_PATTERN = re.compile( r'(\d+-\d+-\d+ \d+:\d\d:\d\d|\d+:\d\d:\d\d\.\d\d\d) [EWIDewid?]( |$)' )
+
+    DEFAULT_QUERY_CACHE = not Env.NO_QUERY_CACHE
+
+    DEFAULT_BAUDRATE_UPSHIFT = Env.BAUDRATE_UPSHIFT
+    DEFAULT_BAUDRATE_MAX = Env.BAUDRATE_MAX
+    DEFAULT_BAUDRATE_PROBE_TIMEOUT = 0.5
+    DEFAULT_BAUDRATE_SWITCH_DELAY = 0.05  # device switches after the prompt is sent
+    DEFAULT_BAUDRATE_REVERT_TIME = 1  # device falls back if not confirmed in time
+
+    baudrate_cache = None  # {'sn': {serial_number: baudrate}, 'port': {port: baudrate}}
+    query_cache = None  # {'serial_number/idn': {command: response}}, shared by the handles
+    query_cache_lock = threading.Lock()
+
+    def __init__( self, *args, **kwargs ):
+        # register maps are per instance
+        self.regs_by_name = {}
+        self.regs_by_addr = {}
+        self.reg_sets = {}
+        # entry of this device in query_cache, or local_query_cache when the
+        # device has no serial number
+        self.query_cache_key = None
+        self.local_query_cache = None
+        Instrument.SerialInstrument.__init__( self, *args, **kwargs )
+
+    def connect( self ):
+        '''connect, and negotiate faster baudrate if upshift is enabled'''
+        if not getattr(self, 'upshift', self.DEFAULT_BAUDRATE_UPSHIFT):
+            Instrument.SerialInstrument.connect( self )
+            return
+        self.connectAnyBaudrate()
+        if self.port.connected:
+            self.upshiftBaudrate()
+
+    def connectAnyBaudrate( self ):
+        '''connect with the baudrate negotiated before (device not reset yet),
+           or the current/initial one'''
+        rates = self.getProbeBaudrates()
+        timeout = self.port.timeout
+        for i, rate in enumerate(rates):
+            self.port.baudrate = rate
+            del self.rx_buffer[:]
+            last = bool(i == len(rates)-1)
+            if not last:
+                self.setTimeout( min(timeout, self.DEFAULT_BAUDRATE_PROBE_TIMEOUT) )
+            try:
+                Instrument.SerialInstrument.connect( self )
+                return
+            except (Instrument.CommandTimeoutError, Instrument.ResponseError,
+                    Instrument.CommandSyntaxError, Instrument.CommandExecuteError):
+                if last:
+                    raise
+            finally:
+                self.setTimeout( timeout )
+
+    def getProbeBaudrates( self, reset=False ):
+        '''baudrates the device may be listening at: the negotiated one, the
+           current and the initial one, or the initial one first after reset'''
+        cache = self.loadBaudrateCache()
+        rates = []
+        if reset:
+            candidates = [self._baudrate, self.port.baudrate, cache['port'].get(str(self.port.port))]
+        else:
+            candidates = [cache['port'].get(str(self.port.port)), self.port.baudrate, self._baudrate]
+        for r in candidates:
+            if r and r not in rates:
+                rates.append( r )
+        return rates
+
+    def getBaudrates( self ):
+        '''return supported baudrate list'''
+        return [int(r) for l in self.writeCommand( 'baud -l' ) for r in l.split()]
+
+    def upshiftBaudrate( self, rates=None ):
+        '''switch to the fastest baudrate that passes verification, return it;
+           needs the baud command (firmware built with USE_CMD_BAUD=1)'''
+        current = self.port.baudrate
+        cache = self.loadBaudrateCache()
+        sn = self.getSerialNumber()
+        remembered = cache['sn'].get( sn )
+        if remembered and remembered > current and rates is None:
+            # negotiated before, try it directly
+            if self.switchBaudrate( remembered ):
+                self.saveBaudrate( sn )
+                return remembered
+        if rates is None:
+            if not self.checkCommand( 'baud' ):
+                return current
+            rates = self.getBaudrates()
+        limit = self.DEFAULT_BAUDRATE_MAX
+        for rate in sorted(set(rates), reverse=True):
+            if rate <= current:
+                break
+            if limit and rate > limit:
+                continue
+            if rate != remembered and self.switchBaudrate( rate ):
+                break
+        self.saveBaudrate( sn )
+        return self.port.baudrate
+
+    def switchBaudrate( self, rate ):
+        '''switch both ends to new baudrate and verify with echo,
+           fall back to the old one on error, return True if succeeded'''
+        old = self.port.baudrate
+        try:
+            self.writeCommand( 'baud -s %d'% rate )
+        except (Instrument.CommandSyntaxError, Instrument.CommandExecuteError):
+            return False
+        time.sleep( self.DEFAULT_BAUDRATE_SWITCH_DELAY )
+        self.port.baudrate = rate
+        timeout = self.setTimeout( self.DEFAULT_BAUDRATE_PROBE_TIMEOUT )
+        try:
+            del self.rx_buffer[:]
+            self.port.write( self.DEFAULT_TERMINATOR_RESET )
+            self.readUntilPrompts()
+            ret = self.writeCommand( '*idn?' )
+            if ret[0].strip() != self.idn:
+                raise Instrument.ResponseError( ret[0] )
+            self.writeCommand( 'baud -c' )
+            self.logger.info( 'baudrate switched to %d', rate )
+            return True
+        except (Instrument.CommandTimeoutError, Instrument.ResponseError,
+                Instrument.CommandSyntaxError, Instrument.CommandExecuteError):
+            self.logger.info( 'baudrate %d failed', rate )
+        finally:
+            self.setTimeout( timeout )
+        # wait for the device to fall back and resync
+        self.port.baudrate = old
+        time.sleep( self.DEFAULT_BAUDRATE_REVERT_TIME )
+        del self.rx_buffer[:]
+        self.port.write( self.DEFAULT_TERMINATOR_RESET )
+        self.readUntilPrompts()
+        return False
+
+    def loadBaudrateCache( self ):
+        if Mcush.baudrate_cache is None:
+            cache = {'sn': {}, 'port': {}}
+            if Env.BAUDRATE_CACHE:
+                try:
+                    with open(Env.BAUDRATE_CACHE) as f:
+                        cache.update( json.load(f) )
+                except (IOError, ValueError):
+                    pass
+            Mcush.baudrate_cache = cache
+        return Mcush.baudrate_cache
+
+    def saveBaudrate( self, sn ):
+        '''remember current baudrate for the serial number and port'''
+        cache = self.loadBaudrateCache()
+        rate = self.port.baudrate
+        if sn:
+            cache['sn'][sn] = rate
+        cache['port'][str(self.port.port)] = rate
+        if Env.BAUDRATE_CACHE:
+            try:
+                with open(Env.BAUDRATE_CACHE, 'w') as f:
+                    json.dump( cache, f )
+            except IOError:
+                pass
+
+    def getQueryCacheKey( self ):
+        '''serial number and firmware identity, None if not available'''
+        if self.idn is None:
+            self.scpiIdn( check=False )
+        if not self.serial_number:
+            return None
+        return '%s/%s'% (self.serial_number, self.idn)
 
-    regs_by_name = {}
-    regs_by_addr = {}
+    def readQueryCacheFile( self ):
+        '''return {key: {command: response}} saved in QUERY_CACHE_FILE'''
+        if Env.QUERY_CACHE_FILE:
+            try:
+                with open(Env.QUERY_CACHE_FILE) as f:
+                    return json.load( f )
+            except (IOError, ValueError):
+                pass
+        return {}
+
+    def loadQueryCache( self ):
+        '''return {command: response} of this device, shared by all handles of
+           the same serial number and firmware in the process'''
+        self.query_cache_key = self.getQueryCacheKey()
+        if self.query_cache_key is None:
+            if self.local_query_cache is None:
+                self.local_query_cache = {}
+            return self.local_query_cache
+        with Mcush.query_cache_lock:
+            if Mcush.query_cache is None:
+                Mcush.query_cache = self.readQueryCacheFile()
+            return Mcush.query_cache.setdefault( self.query_cache_key, {} )
+
+    def saveQueryCache( self ):
+        '''write the shared cache to QUERY_CACHE_FILE'''
+        if not Env.QUERY_CACHE_FILE or Mcush.query_cache is None:
+            return
+        with Mcush.query_cache_lock:
+            try:
+                with open(Env.QUERY_CACHE_FILE, 'w') as f:
+                    json.dump( Mcush.query_cache, f )
+            except IOError:
+                pass
+
+    def writeQuery( self, cmd ):
+        '''write query whose response never changes for the same serial number
+           and firmware ('? -c', 'led -n', ...), return the cached response
+           if asked before; devices without serial number cache per instance'''
+        if not self.DEFAULT_QUERY_CACHE:
+            return self.writeCommand( cmd )
+        cache = self.loadQueryCache()
+        try:
+            return list(cache[cmd])
+        except KeyError:
+            pass
+        ret = self.writeCommand( cmd )
+        with Mcush.query_cache_lock:
+            cache[cmd] = list(ret)
+        if self.query_cache_key is not None:
+            self.saveQueryCache()
+        return ret
+
+    def invalidateQueryCache( self ):
+        '''forget cached queries of this device for all its handles, called
+           when rebooted/upgraded'''
+        self.local_query_cache = None
+        key = self.query_cache_key
+        if key is None and self.serial_number and self.idn is not None:
+            key = '%s/%s'% (self.serial_number, self.idn)
+        self.query_cache_key = None  # identity may change
+        if key is None:
+            return
+        with Mcush.query_cache_lock:
+            if Mcush.query_cache is None:
+                Mcush.query_cache = self.readQueryCacheFile()
+            dropped = Mcush.query_cache.pop( key, None ) is not None
+        if dropped:
+            self.saveQueryCache()
 
     def addReg( self, r ):
         '''add register'''
         self.regs_by_name[r.name] = r
         self.regs_by_addr[r.address] = r
+        self.reg_sets.clear()
         
+    def addRegs( self, registers ):
+        '''add registers, RegisterSet or list'''
+        for r in getattr(registers, 'registers', registers):
+            self.addReg( r )
+
     def setReg( self, regname, value ):
         '''set register'''
         r = self.regs_by_name[regname]
-        w, b, fget, fset = Register.REGISTER_TYPE[r.reg_type]
+        w, b, fget, fset, fmt = Register.REGISTER_TYPE[r.reg_type]
         m = fset(value)
         self.writeMem( r.address, m )
     
     def getReg( self, regname ):
         '''get register'''
         r = self.regs_by_name[regname]
-        w, b, fget, fset = Register.REGISTER_TYPE[r.reg_type]
+        w, b, fget, fset, fmt = Register.REGISTER_TYPE[r.reg_type]
         m = self.readMem( r.address, length=b )
         return fget(m)
 
+    def readRegs( self, names=None ):
+        '''read registers (all if names is None) with the least readMem
+           commands, return {name: value}'''
+        if names is None:
+            names = sorted(self.regs_by_name)
+        key = tuple(names)
+        try:
+            reg_set = self.reg_sets[key]
+        except KeyError:
+            reg_set = Register.RegisterSet( [self.regs_by_name[n] for n in names] )
+            self.reg_sets[key] = reg_set
+        return reg_set.read( self )
+
     def getLedNumber(self):
-        r = self.writeCommand( 'led -n' )
+        r = self.writeQuery( 'led -n' )
         return int(r[0])
     
     def led( self, idx, on=None, toggle=None ):
@@ -228,20 +491,25 @@ class Mcush( Instrument.SerialInstrument ):
 
     def parseMemLine( self, line, compact_mode=False ):
         '''parse memory line which has been stripped'''
+        return self.parseMemLines( [line], compact_mode )
+
+    def parseMemLines( self, lines, compact_mode=False ):
+        '''parse memory lines which have been stripped, decoded at once'''
         # format(standard):  XXXXXXXX: xx xx xx xx xx ... xx    (no ascii mode, final space stripped)
         # format(compact):   xxxxxxxxxxxx...xx
-        #print( type(line), line )
-        line_len = len(line)
-        line_len_err = bool(line_len % 2) if compact_mode else bool((line_len-9) % 3)
-        if line_len_err:
-            raise CommandExecuteError('memory line width error, length=%s'% line_len)
-        if compact_mode:
-            m = [binascii.unhexlify(line[i:i+2]) for i in range(0,line_len,2)]
-        else:
-            m = [binascii.unhexlify(line[i:i+2]) for i in range(10,line_len,3)]
-        ret = Env.EMPTY_BYTE.join(m)
-        #print( type(ret), len(ret), ret )
-        return ret
+        hexs = []
+        for line in lines:
+            if Env.PYTHON_V3 and isinstance(line, str):
+                line = line.encode('latin1')
+            line_len = len(line)
+            line_len_err = bool(line_len % 2) if compact_mode else bool((line_len-9) % 3)
+            if line_len_err:
+                raise Instrument.CommandExecuteError('memory line width error, length=%s'% line_len)
+            hexs.append( line if compact_mode else line[10:] )
+        hexs = Env.EMPTY_BYTE.join( hexs )
+        if not compact_mode:
+            hexs = hexs.translate( None, b' ' )
+        return binascii.unhexlify( hexs )
        
     def fillMem( self, addr, pattern, width, length ):
         '''fill memory with specific pattern'''
@@ -277,6 +545,7 @@ class Mcush( Instrument.SerialInstrument ):
         cmd = 'mkbuf -f' if float_mode else 'mkbuf'
         self.setPrompts( self.DEFAULT_PROMPTS_MULTILINE )
         self.writeCommand( cmd )
+        lines = []
         line = ''
         for v in value_list:
             if float_mode:
@@ -284,10 +553,11 @@ class Mcush( Instrument.SerialInstrument ):
             else:
                 line += '%d '% v
             if len(line) > self.DEFAULT_MULTILINE_INPUT_LINE_LIMIT:
-                self.writeCommand( line.rstrip() )
+                lines.append( line.rstrip() )
                 line = ''
         if line:
-            self.writeCommand( line.rstrip() )
+            lines.append( line.rstrip() )
+        self.writeLines( lines )
         self.setPrompts()
         r = Utils.parseKeyValueLines(self.writeCommand(''))
         return int(r['address'], 16)
@@ -298,36 +568,184 @@ class Mcush( Instrument.SerialInstrument ):
         cmd = 'x -b 0x%X -l %d'% ( addr, length )
         if compact_mode:
             cmd += ' -c'
+        # lines are hex in bytes, not decoded
         if retry:
-            ret = self.writeCommandRetry( cmd, retry )
+            ret = self.writeCommandRetry( cmd, retry, raw=True )
         else:
-            ret = self.writeCommand( cmd )
+            ret = self.writeCommand( cmd, raw=True )
         assert 1 <= len(ret)
-        for line in ret:
-            self.logger.info( line )
-        mem = Env.EMPTY_BYTE.join( \
-               [self.parseMemLine(line.strip(), compact_mode) for line in ret])
+        if self.logger.isEnabledFor( logging.INFO ):
+            for line in ret:
+                self.logger.info( bytes(line).decode('latin1') )
+        mem = self.parseMemLines( ret, compact_mode )
         #print( type(mem), len(mem), mem )
         return mem[:length]
 
-    MAX_ITEMS_PER_WRITE = { 1: 16, 2: 8, 4: 4  }
-
-    def writeMem( self, addr, data, width=1 ):
-        '''write memory'''
+    def iterMem( self, addr, length, chunk=None, compact_mode=False, pipelined=True ):
+        '''read memory chunk by chunk and yield each chunk (memoryview with
+           python 3), so large regions are read with bounded memory;
+           pipelined mode sends the next command before parsing the current'''
+        if chunk is None:
+            chunk = self.DEFAULT_MEM_CHUNK
+        window = 2 if pipelined else 1
+        end = addr + length
+        pending = []
+        try:
+            while addr < end or pending:
+                while addr < end and len(pending) < window:
+                    size = min(chunk, end - addr)
+                    cmd = 'x -b 0x%X -l %d'% ( addr, size )
+                    if compact_mode:
+                        cmd += ' -c'
+                    self.writeLine( cmd )
+                    pending.append( (cmd, size) )
+                    addr += size
+                # taken out before reading, the finally below drains only
+                # the commands still in flight
+                cmd, size = pending.pop( 0 )
+                others = len(pending)
+                self.commands_in_flight += others
+                try:
+                    ret = self.readCommandResponse( cmd, raw=True )
+                except Instrument.CommandTimeoutError:
+                    if others:
+                        # as Pipeline.abort, the next response can not be matched
+                        del pending[:]
+                        self.resync()
+                    raise
+                finally:
+                    self.commands_in_flight -= others
+                mem = self.parseMemLines( ret, compact_mode )
+                if Env.PYTHON_V3:
+                    yield memoryview( mem )[:size]
+                else:
+                    # file.write of python 2 does not take memoryview
+                    yield mem[:size]
+        finally:
+            # stopped or failed, keep the responses in flight from being mixed
+            # with the next command
+            for cmd, size in pending:
+                try:
+                    self.readCommandResponse( cmd, raw=True )
+                except Exception:
+                    pass
+
+    def readMemInto( self, addr, buf, chunk=None, compact_mode=False, callback=None ):
+        '''read memory into writable buffer (bytearray...), len(buf) bytes,
+           callback(read_bytes, total_bytes) is called after each chunk'''
+        view = memoryview( buf )
+        length = len( view )
+        read = 0
+        for mem in self.iterMem( addr, length, chunk, compact_mode ):
+            view[read:read+len(mem)] = mem
+            read += len(mem)
+            if callback:
+                callback( read, length )
+        return read
+
+    def dumpMemToFile( self, addr, length, pathname, chunk=None, compact_mode=False, callback=None ):
+        '''read memory and write to file chunk by chunk,
+           callback(read_bytes, total_bytes) is called after each chunk'''
+        read = 0
+        with open( pathname, 'wb' ) as f:
+            for mem in self.iterMem( addr, length, chunk, compact_mode ):
+                f.write( mem )
+                read += len(mem)
+                if callback:
+                    callback( read, length )
+        return read
+
+    def writeMem( self, addr, data, width=1, verify=None ):
+        '''write memory, pipelined w commands packed to the command line
+           limits; width is the bus width 1/2/4, or None to write aligned
+           32-bit words (bytes at the unaligned head/tail) when the target
+           accepts word access; verify=True compares the crc of written memory'''
+        if Env.PYTHON_V3 and isinstance(data, str):
+            data = data.encode('latin1')
+        data = bytearray(data)
         length = len(data)
-        written = 0
-        while written < length:
-            cmd = 'w -b 0x%X -w%d '% ( addr, width )
-            left = min(length-written, self.MAX_ITEMS_PER_WRITE[width])
-            if width == 1:
-                cmd += ' '.join([str(ord(c)) for c in data[written:written+left]])
-            elif width == 2:
-                cmd += ' '.join([hex(ord(data[i])+(ord(data[i+1])<<8)) for i in range(written, written+left*2, 2)])
-            elif width == 4:
-                cmd += ' '.join([hex(ord(data[i])+(ord(data[i+1])<<8)+(ord(data[i+2])<<16)+(ord(data[i+3])<<24)) for i in range(written, written+left*4, 4)])
-            self.writeCommand( cmd )
-            written += left*width
-            addr += left*width
+        if width is None:
+            head = min( (-addr) % 4, length )
+            tail = head + (length - head) // 4 * 4
+            segments = [(addr, data[:head], 1), (addr+head, data[head:tail], 4),
+                        (addr+tail, data[tail:], 1)]
+        else:
+            if length % width:
+                raise Instrument.CommandExecuteError( 'data length not aligned to width %d'% width )
+            segments = [(addr, data, width)]
+        with self.pipeline() as p:
+            for a, d, w in segments:
+                for cmd in self.writeMemCommands( a, d, w ):
+                    p.writeCommand( cmd )
+        if verify is None:
+            verify = self.DEFAULT_WRITE_MEM_VERIFY
+        if verify and length:
+            crc = self.memCrc( addr, length )
+            if crc != Utils.crc( bytes(data) ):
+                raise Instrument.CommandExecuteError( 'memory verify failed, crc 0x%08X'% crc )
+
+    def writeMemCommands( self, addr, data, width=4 ):
+        '''return w commands writing data, items in the shorter form of
+           decimal and hex, as many as the line/argv limits allow'''
+        fmt = {1: 'B', 2: 'H', 4: 'I'}[width]
+        values = struct.unpack( '<%d%s'% (len(data)//width, fmt), bytes(data) )
+        max_items = self.DEFAULT_CMD_ARGV_LIMIT - 4  # w -b <addr> -w<width>
+        cmds = []
+        i, count = 0, len(values)
+        while i < count:
+            cmd = 'w -b 0x%X -w%d'% (addr, width)
+            n = 0
+            while i < count and n < max_items:
+                v = values[i]
+                item = ' %d'% v
+                if len(item) > 3:
+                    h = ' 0x%X'% v
+                    if len(h) < len(item):
+                        item = h
+                if len(cmd) + len(item) > self.DEFAULT_CMD_LINE_LIMIT:
+                    break
+                cmd += item
+                i += 1
+                n += 1
+            cmds.append( cmd )
+            addr += n * width
+        return cmds
+
+    def memCrc( self, addr, length ):
+        '''crc32 of memory, computed by the controller (crc -b -l) if
+           supported, otherwise read back and computed locally'''
+        if getattr(self, 'mem_crc_supported', True):
+            try:
+                ret = self.writeCommand( 'crc -b 0x%X -l %d'% (addr, length) )
+                return int(ret[0], 16)
+            except (Instrument.CommandSyntaxError, Instrument.CommandExecuteError):
+                self.mem_crc_supported = False
+        crc = 0
+        for mem in self.iterMem( addr, length ):
+            crc = Utils.crc( mem, crc )
+        return crc
+
+    def memCrcBlocks( self, addr, length, block_size, fallback=True ):
+        '''crc32 of each block of memory, computed by the controller: one
+           command (crc -s) or pipelined commands per block; when neither is
+           supported read back and computed locally, or return None if
+           fallback is False'''
+        if getattr(self, 'mem_crc_blocks_supported', True):
+            try:
+                ret = self.writeCommand( 'crc -b 0x%X -l %d -s %d'% (addr, length, block_size) )
+                return [int(line, 16) for line in ret]
+            except (Instrument.CommandSyntaxError, Instrument.CommandExecuteError):
+                self.mem_crc_blocks_supported = False
+        if getattr(self, 'mem_crc_supported', True):
+            cmds = ['crc -b 0x%X -l %d'% (a, min(block_size, addr+length-a))
+                    for a in range(addr, addr+length, block_size)]
+            try:
+                return [int(ret[0], 16) for ret in self.writeCommands( cmds )]
+            except (Instrument.CommandSyntaxError, Instrument.CommandExecuteError):
+                self.mem_crc_supported = False
+        if not fallback:
+            return None
+        return [Utils.crc(mem) for mem in self.iterMem( addr, length, chunk=block_size )]
 
     def dumpMem( self, addr, length=1 ):
         '''dump memory'''
@@ -346,6 +764,7 @@ class Mcush( Instrument.SerialInstrument ):
 
     def reboot( self, delay=None ):
         '''reboot controller'''
+        self.invalidateQueryCache()
         sync = False
         retry = 0
         try:
@@ -371,6 +790,68 @@ class Mcush( Instrument.SerialInstrument ):
             time.sleep( delay )
 
 
+    def rebootFast( self, timeout=None, interval=None ):
+        '''reboot controller and reattach as soon as the shell answers,
+           return the boot time in seconds (also kept as last_boot_time)'''
+        if timeout is None:
+            timeout = self.DEFAULT_REBOOT_TIMEOUT
+        if interval is None:
+            interval = self.DEFAULT_REBOOT_POLL_INTERVAL
+        self.invalidateQueryCache()
+        old_timeout = self.setTimeout( self.DEFAULT_REBOOT_PROBE_TIMEOUT )
+        try:
+            t0 = time.time()
+            self.writeLine( 'reboot' )
+            # wait for the echo, prompts before it are from the old session
+            try:
+                while self.readLine() not in ['reboot', '']:
+                    pass
+            except (IOError, OSError):
+                pass  # usb device disappeared
+            self.disconnect()
+            deadline = t0 + timeout
+            while not self.reattach():
+                if time.time() > deadline:
+                    raise Instrument.CommandTimeoutError( 'reboot timeout' )
+                time.sleep( interval )
+            self.last_boot_time = time.time() - t0
+        finally:
+            self.setTimeout( old_timeout )
+        self.scpiIdn()
+        self.logger.info( 'boot time: %.3f s', self.last_boot_time )
+        if getattr(self, 'upshift', self.DEFAULT_BAUDRATE_UPSHIFT):
+            # the device boots at its power-on baudrate
+            self.upshiftBaudrate()
+        return self.last_boot_time
+
+    def reattach( self ):
+        '''reopen port (if closed) and probe the prompt once at each baudrate
+           the device may be listening at, return True if the shell answers'''
+        port = self.port.port
+        if isinstance(port, str) and port.startswith('/dev/') and not os.path.exists(port):
+            return False  # usb device is re-enumerating
+        try:
+            if not self.port.connected:
+                self.port.connect()
+            for rate in self.getProbeBaudrates( reset=True ):
+                self.port.baudrate = rate
+                del self.rx_buffer[:]
+                self.port.write( self.DEFAULT_TERMINATOR_RESET )
+                self.port.flush()
+                try:
+                    self.readUntilPrompts()
+                except Instrument.CommandTimeoutError:
+                    continue
+                # answers of former probes may follow
+                self.drain()
+                return True
+        except (Instrument.PortNotFound, Instrument.UnknownPortError, IOError, OSError):
+            try:
+                self.port.disconnect()
+            except (IOError, OSError):
+                pass
+        return False
+
     def getRebootCounter( self ):
         cmd = 'reboot -c'
         ret = self.writeCommand( cmd )
@@ -382,11 +863,11 @@ class Mcush( Instrument.SerialInstrument ):
 
     def checkCommand( self, name ):
         cmd = '? -c %s'% name
-        return bool(int(self.writeCommand(cmd)[0])) 
+        return bool(int(self.writeQuery(cmd)[0])) 
 
     def checkCommandShortName( self, name ):
         cmd = '? -s %s'% name
-        ret = self.writeCommand(cmd)
+        ret = self.writeQuery(cmd)
         return ret[0] if len(ret)>0 else None
 
     def errnoStop( self ):
@@ -484,9 +965,7 @@ class Mcush( Instrument.SerialInstrument ):
                     buf = base64.encodebytes(buf).decode('utf8')
                 else:
                     buf = base64.encodestring(buf)
-            buf = buf.splitlines()
-            for l in buf:
-                self.writeCommand( l.rstrip() )
+            self.writeLines( [l.rstrip() for l in buf.splitlines()] )
             self.setPrompts()
             self.writeCommand( '' )
         else:
@@ -495,11 +974,15 @@ class Mcush( Instrument.SerialInstrument ):
             else:
                 cmd = 'cat '
             cmd += pathname
-            ret = '\n'.join(self.writeCommand( cmd ))
             if b64:
-                if Env.PYTHON_V3 and isinstance(ret, str):
-                     ret = ret.encode('utf8')
-                ret = base64.decodestring( ret )
+                # base64 lines are joined as bytes, not decoded
+                ret = b'\n'.join(self.writeCommand( cmd, raw=True ))
+                if Env.PYTHON_V3:
+                    ret = base64.decodebytes( ret )
+                else:
+                    ret = base64.decodestring( ret )
+            else:
+                ret = '\n'.join(self.writeCommand( cmd ))
             return ret
 
     def writeFile( self, pathname, buf='' ):
@@ -545,7 +1028,7 @@ class Mcush( Instrument.SerialInstrument ):
             if segment_done_callback:
                 segment_done_callback(1+i, dat_segments, sent, dat_size)
  
-    def spiffs( self, command, value=None, addr=None, compact_mode=None ):
+    def spiffs( self, command, value=None, addr=None, compact_mode=None, raw=False ):
         cmd = 'spiffs -c %s'% command
         if value is not None:
             cmd += ' %s'% value
@@ -553,7 +1036,7 @@ class Mcush( Instrument.SerialInstrument ):
             cmd += ' -b 0x%X'% addr
         if compact_mode:
             cmd += ' --compact'
-        return self.writeCommand( cmd )
+        return self.writeCommand( cmd, raw=raw )
 
     def spiffsID( self ):
         return int(self.spiffs('id')[0], 16)
@@ -571,12 +1054,12 @@ class Mcush( Instrument.SerialInstrument ):
         self.spiffs('remount')
 
     def spiffsFormat( self ):
-        oldtimeout = self.setTimeout( 60 )
+        oldtimeout = self.setTimeout( self.DEFAULT_TIMEOUT_SPIFFS_ERASE )
         self.spiffs( 'format' )
         self.setTimeout( oldtimeout )
 
     def spiffsErase( self, addr=None ):
-        oldtimeout = self.setTimeout( 60 )
+        oldtimeout = self.setTimeout( self.DEFAULT_TIMEOUT_SPIFFS_ERASE )
         if addr is not None:
             self.spiffs( 'erase', addr=addr )
         else:
@@ -592,14 +1075,14 @@ class Mcush( Instrument.SerialInstrument ):
 
     def spiffsReadPage( self, page, pagesize=256 ):
         compact_mode = True
-        ret = self.spiffs( "read", addr=page*pagesize, compact_mode=compact_mode ) 
-        mem = Env.EMPTY_BYTE.join( \
-               [self.parseMemLine(line.strip(), compact_mode=compact_mode) for line in ret])
+        ret = self.spiffs( "read", addr=page*pagesize, compact_mode=compact_mode, raw=True ) 
+        mem = self.parseMemLines( ret, compact_mode=compact_mode )
         return mem
  
     def spiffsWritePage( self, page, buf, pagesize=256 ):
         self.setPrompts( self.DEFAULT_PROMPTS_MULTILINE )
         ret = self.spiffs( "write", addr=page*pagesize ) 
+        lines = []
         line = ''
         for item in buf:
             if isinstance(item, int):
@@ -607,10 +1090,11 @@ class Mcush( Instrument.SerialInstrument ):
             elif isinstance(item, str):
                 line += '%d '% ord(item)
             if len(line) > self.DEFAULT_MULTILINE_INPUT_LINE_LIMIT:
-                self.writeCommand( line.rstrip() )
+                lines.append( line.rstrip() )
                 line = ''
         if line:
-            self.writeCommand( line.rstrip() )
+            lines.append( line.rstrip() )
+        self.writeLines( lines )
         self.setPrompts()
         self.writeCommand( '' )
     
@@ -628,22 +1112,23 @@ class Mcush( Instrument.SerialInstrument ):
         # prepare 32bit word list
         words = [Utils.s2I(mem[4*i:4*(i+1)]) for i in range(int(len(mem)/4))]
         offset = 0
-        while words:
-            cmd = 'fcfs -c program'
-            if offset:
-                cmd += ' -o %d'% (offset*4)
-            count_argv = len(cmd.split(' '))
+        with self.pipeline() as p:
             while words:
-                wr = ' %d'% words[0] 
-                if len(cmd + wr) > self.DEFAULT_CMD_LINE_LIMIT:
-                    break
-                words.pop(0)
-                cmd += wr
-                offset += 1
-                count_argv += 1
-                if count_argv >= self.DEFAULT_CMD_ARGV_LIMIT:
-                    break
-            self.writeCommand( cmd )
+                cmd = 'fcfs -c program'
+                if offset:
+                    cmd += ' -o %d'% (offset*4)
+                count_argv = len(cmd.split(' '))
+                while words:
+                    wr = ' %d'% words[0] 
+                    if len(cmd + wr) > self.DEFAULT_CMD_LINE_LIMIT:
+                        break
+                    words.pop(0)
+                    cmd += wr
+                    offset += 1
+                    count_argv += 1
+                    if count_argv >= self.DEFAULT_CMD_ARGV_LIMIT:
+                        break
+                p.writeCommand( cmd )
 
     def sgpioStop( self ):
         self.writeCommand( 'sgpio --stop' )
@@ -658,14 +1143,16 @@ class Mcush( Instrument.SerialInstrument ):
             cmd += ' -l'
         self.setPrompts( self.DEFAULT_PROMPTS_MULTILINE )
         self.writeCommand( cmd )
+        lines = []
         line = ''
         for item in buf:
             line += '%d '% item
             if len(line) > self.DEFAULT_MULTILINE_INPUT_LINE_LIMIT:
-                self.writeCommand( line.rstrip() )
+                lines.append( line.rstrip() )
                 line = ''
         if line:
-            self.writeCommand( line.rstrip() )
+            lines.append( line.rstrip() )
+        self.writeLines( lines )
         self.setPrompts()
         self.writeCommand( '' )
         if start:
@@ -892,7 +1379,8 @@ class Mcush( Instrument.SerialInstrument ):
 
     def logEnter( self ):
         self.writeLine('log')
-        self.port.read(4)
+        # skip the echo through rx_buffer, bytes after it stay buffered
+        self.readLine()
 
     def logExit( self ):
         self.port.write( self.DEFAULT_TERMINATOR_RESET )
@@ -905,7 +1393,7 @@ class Mcush( Instrument.SerialInstrument ):
     def ping( self, host, times=10, silent=True ):
         cmd = 'ping %s'% host
         self.writeLine(cmd)
-        self.port.read(len(cmd)+1) 
+        self.readLine()  # echo
         send, recv, ms = 0, 0, 0
         while True:
             line = self.readLine()
@@ -939,9 +1427,7 @@ class Mcush( Instrument.SerialInstrument ):
     def setNewIP( self, ip, netmask, gateway ):
         self.setPrompts( self.DEFAULT_PROMPTS_MULTILINE )
         self.writeCommand('netstat -c ip')
-        self.writeCommand( str(ip) )
-        self.writeCommand( str(netmask) )
-        self.writeCommand( str(gateway) )
+        self.writeLines( [str(ip), str(netmask), str(gateway)] )
         self.setPrompts()
         self.writeCommand('')
         
@@ -971,13 +1457,15 @@ class Mcush( Instrument.SerialInstrument ):
                 i = eval(i)
             cmd += ' %u'% int(i)
         self.writeCommand( cmd )
+        # firmware will be replaced at next boot
+        self.invalidateQueryCache()
 
     def upgradeFromIntFlash( self, filename, process_cb=None ):
         # check if upgrade command is supported
         if not self.checkCommand( 'upgrade' ):
             raise Exception('Not supported')
         # check upgrade swap size
-        info = Utils.parseKeyValueLines(self.writeCommand('upgrade -c info'))
+        info = Utils.parseKeyValueLines(self.writeQuery('upgrade -c info'))
         # check new firmware size
         file_contents = open(filename, 'rb').read()
         file_size = len(file_contents)
@@ -991,21 +1479,22 @@ class Mcush( Instrument.SerialInstrument ):
             int_list.append( Utils.s2I(file_contents[i*4:(i+1)*4]) )
         # program new firmware
         programmed_bytes = 0
-        while programmed_bytes < file_size:
-            cmd = 'U -cp'  # short for: upgrade -c program
-            while int_list:
-                _cmd = cmd + ' %d'% int_list[0]
-                if len(_cmd) > self.DEFAULT_CMD_LINE_LIMIT:
-                    break
-                if len(_cmd.split(' ')) > self.DEFAULT_CMD_ARGV_LIMIT:
-                    break
-                cmd = _cmd
-                int_list.pop(0)
-                programmed_bytes += 4
-            self.writeCommand( cmd )
-            if process_cb is not None:
-                # inform the process percentage
-                process_cb( 0, 0, programmed_bytes, file_size )
+        with self.pipeline() as p:
+            while programmed_bytes < file_size:
+                cmd = 'U -cp'  # short for: upgrade -c program
+                while int_list:
+                    _cmd = cmd + ' %d'% int_list[0]
+                    if len(_cmd) > self.DEFAULT_CMD_LINE_LIMIT:
+                        break
+                    if len(_cmd.split(' ')) > self.DEFAULT_CMD_ARGV_LIMIT:
+                        break
+                    cmd = _cmd
+                    int_list.pop(0)
+                    programmed_bytes += 4
+                p.writeCommand( cmd )
+                if process_cb is not None:
+                    # inform the process percentage
+                    process_cb( 0, 0, programmed_bytes, file_size )
         # calculate md5
         md5 = hashlib.md5(file_contents).digest()
         flags = [file_size, Utils.s2I(md5[:4]), Utils.s2I(md5[4:8]), Utils.s2I(md5[8:12]), Utils.s2I(md5[12:])]
@@ -1022,7 +1511,7 @@ class Mcush( Instrument.SerialInstrument ):
         #self.spiffsFormat()
         #self.spiffsMount()
         # transfer file contents
-        oldtimeout = self.setTimeout( 30 )
+        oldtimeout = self.setTimeout( self.DEFAULT_TIMEOUT_UPGRADE_TRANSFER )
         self.putFile( '/s/upgrade.bin', filename, segment_size=512, segment_done_callback=process_cb )
         self.setTimeout( oldtimeout )
         # remount for filesystem sync
@@ -1136,5 +1625,5 @@ class Mcush( Instrument.SerialInstrument ):
         self.can( 'filter', ext=ext, rtr=rtr, args=[index, int(enable), can_id, mask] )
  
     def env( self ):
-        return Utils.parseKeyValueLines( self.writeCommand('env') )
+        return Utils.parseKeyValueLines( self.writeQuery('env') )
 
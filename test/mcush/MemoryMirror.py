@@ -0,0 +1,81 @@
+# coding: utf8
+__doc__ = 'host copy of a memory region refreshed by comparing block crc'
+__author__ = 'Peng Shulin <trees_peng@163.com>'
+__license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
+from . import Utils
+
+
+class MemoryMirror:
+    '''keep memory region [address, address+length) in a bytearray; refresh()
+       asks the controller for crc of every block and re-reads only the changed
+       ones, or re-reads all and compares here if crc is not supported'''
+    DEFAULT_BLOCK_SIZE = 256
+
+    def __init__( self, instrument, address, length, block_size=None ):
+        self.instrument = instrument
+        self.address = address
+        self.length = length
+        self.block_size = self.DEFAULT_BLOCK_SIZE if block_size is None else block_size
+        self.blocks = (length + self.block_size - 1) // self.block_size
+        self.buffer = bytearray( length )
+        self.crcs = None  # of the mirrored blocks, None before the first refresh
+        self.changed = []
+        self.refreshes = 0
+
+    @property
+    def view( self ):
+        '''memoryview of the mirror, updated in place by refresh()'''
+        return memoryview( self.buffer )
+
+    def blockRange( self, index ):
+        '''return (offset, length) of block'''
+        offset = index * self.block_size
+        return offset, min(self.block_size, self.length - offset)
+
+    def refresh( self ):
+        '''update the mirror, return indexes of the changed blocks'''
+        crcs = None
+        if self.crcs is not None:
+            crcs = self.instrument.memCrcBlocks( self.address, self.length, self.block_size, fallback=False )
+        if crcs is None:
+            # first refresh, or crc not supported by the controller
+            indexes = range(self.blocks)
+        else:
+            indexes = [i for i in range(self.blocks) if crcs[i] != self.crcs[i]]
+        changed = self.readBlocks( indexes )
+        self.changed = changed
+        self.refreshes += 1
+        return changed
+
+    def readBlocks( self, indexes ):
+        '''read blocks into the mirror, consecutive ones with one iterMem,
+           return indexes of those really changed'''
+        if self.crcs is None:
+            self.crcs = [None] * self.blocks
+        changed = []
+        indexes = list(indexes)
+        view = memoryview( self.buffer )
+        i = 0
+        while i < len(indexes):
+            j = i
+            while j + 1 < len(indexes) and indexes[j+1] == indexes[j] + 1:
+                j += 1
+            offset = self.blockRange( indexes[i] )[0]
+            end = sum( self.blockRange(indexes[j]) )
+            index = indexes[i]
+            for mem in self.instrument.iterMem( self.address + offset, end - offset, chunk=self.block_size ):
+                # chunks are aligned to blocks, crc is of the data read as
+                # memory may have changed after the crc query
+                crc = Utils.crc( mem )
+                if crc != self.crcs[index]:
+                    o, l = self.blockRange( index )
+                    view[o:o+l] = mem
+                    self.crcs[index] = crc
+                    changed.append( index )
+                index += 1
+            i = j + 1
+        return changed
+
+    def changedRanges( self ):
+        '''return [(address, length)] of the blocks changed in the last refresh'''
+        return [(self.address + o, l) for o, l in [self.blockRange(i) for i in self.changed]]
@@ -0,0 +1,282 @@
+# coding: utf8
+__doc__ = 'record port traffic to file and replay it without hardware'
+__author__ = 'Peng Shulin <trees_peng@163.com>'
+__license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
+import time
+import gzip
+import struct
+from bisect import bisect_right
+from . import Env
+from . import Instrument
+
+# file format:
+#   header: MAGIC, version (uint8), start time (float64)
+#   records: kind (b'W' written / b'R' read), delta time since previous
+#            record (float32), length (uint16), data
+MAGIC = b'MCUSHREC'
+VERSION = 1
+HEADER = struct.Struct( '<Bd' )
+RECORD = struct.Struct( '<cfH' )
+MAX_RECORD_LENGTH = 0xFFFF
+WRITE = b'W'
+READ = b'R'
+
+
+class ReplayError( Exception ):
+    pass
+
+
+def openFile( filename, mode ):
+    if filename.endswith('.gz'):
+        return gzip.open( filename, mode )
+    return open( filename, mode )
+
+def loadRecords( filename ):
+    '''return [(kind, time, data)], time counts from the first record'''
+    f = openFile( filename, 'rb' )
+    try:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ReplayError( 'invalid record file %s'% filename )
+        version, start = HEADER.unpack( f.read(HEADER.size) )
+        if version != VERSION:
+            raise ReplayError( 'unsupported record version %d'% version )
+        records = []
+        t = 0.0
+        while True:
+            head = f.read( RECORD.size )
+            if len(head) < RECORD.size:
+                break
+            kind, delta, length = RECORD.unpack( head )
+            t += delta
+            records.append( (kind, t, f.read(length)) )
+        return records
+    finally:
+        f.close()
+
+
+class RecordingPort(Instrument.Port):
+    '''wrap PORT_TYPE and save all the traffic into record_file'''
+    PORT_TYPE = None
+
+    def __init__( self, parent, *args, **kwargs ):
+        self.__dict__['inner'] = None
+        record_file = kwargs.pop( 'record_file' )
+        self.parent = parent
+        self.inner = self.PORT_TYPE( parent, *args, **kwargs )
+        self.file = openFile( record_file, 'wb' )
+        self.t_last = time.time()
+        self.file.write( MAGIC + HEADER.pack(VERSION, self.t_last) )
+
+    def __getattr__( self, name ):
+        # port specific attributes (port, ser, ...) are from the wrapped one
+        inner = self.__dict__.get('inner')
+        if inner is None:
+            raise AttributeError( name )
+        return getattr( inner, name )
+
+    def __del__( self ):
+        self.close()
+
+    def record( self, kind, data ):
+        if not data or self.file is None:
+            return
+        if Env.PYTHON_V3 and isinstance(data, str):
+            data = data.encode('utf8')
+        now = time.time()
+        delta = now - self.t_last
+        self.t_last = now
+        for i in range(0, len(data), MAX_RECORD_LENGTH):
+            d = data[i:i+MAX_RECORD_LENGTH]
+            self.file.write( RECORD.pack(kind, delta, len(d)) + d )
+            delta = 0
+
+    def close( self ):
+        '''stop recording'''
+        if self.__dict__.get('file') is not None:
+            self.file.close()
+            self.file = None
+
+    def connect( self ):
+        self.inner.connect()
+
+    def disconnect( self ):
+        if self.__dict__.get('inner') is not None:
+            self.inner.disconnect()
+        if self.__dict__.get('file') is not None:
+            self.file.flush()
+
+    @property
+    def connected( self ):
+        return self.inner.connected
+
+    def read( self, read_bytes=1 ):
+        ret = self.inner.read( read_bytes )
+        self.record( READ, ret )
+        return ret
+
+    def read_chunk( self ):
+        ret = self.inner.read_chunk()
+        self.record( READ, ret )
+        return ret
+
+    def readall( self ):
+        ret = self.inner.readall()
+        self.record( READ, ret )
+        return ret
+
+    @property
+    def in_waiting( self ):
+        return self.inner.in_waiting
+
+    def write( self, buf ):
+        self.record( WRITE, buf )
+        self.inner.write( buf )
+
+    def flush( self ):
+        self.inner.flush()
+
+    @property
+    def baudrate( self ):
+        return self.inner.baudrate
+
+    @baudrate.setter
+    def baudrate( self, val ):
+        self.inner.baudrate = val
+
+    @property
+    def timeout( self ):
+        return self.inner.timeout
+
+    @timeout.setter
+    def timeout( self, val ):
+        self.inner.timeout = val
+
+
+class NullSerial(object):
+    '''modem control lines are not recorded, ignore them'''
+
+    def __getattr__( self, name ):
+        return lambda *args, **kwargs: None
+
+
+class ReplayPort(Instrument.Port):
+    '''feed back a recorded session, port is the record file name
+
+    Received bytes are released after the host has written as many bytes as
+    before they were received in the recording, delayed as recorded divided
+    by speed; speed=None replays as fast as possible.  With strict=True,
+    written bytes are compared to the recording.'''
+    speed = None
+    strict = False
+    ser = NullSerial()
+
+    def connect( self ):
+        if self._connected:
+            return
+        records = loadRecords( self.port )
+        self.expected = bytearray()
+        # received segments: (required written bytes, delay after that, data)
+        self.segments = []
+        written, t_gate = 0, 0.0
+        for kind, t, data in records:
+            if kind == WRITE:
+                self.expected += data
+                written += len(data)
+                t_gate = t
+            else:
+                self.segments.append( (written, t - t_gate, data) )
+        self.gates = sorted(set([s[0] for s in self.segments]))
+        self.reached = {}
+        self.index = 0
+        self.written = 0
+        self.rx = bytearray()
+        self._connected = True
+        self.updateGates()
+
+    def disconnect( self ):
+        self._connected = False
+
+    def updateGates( self ):
+        now = time.time()
+        for g in self.gates[:bisect_right(self.gates, self.written)]:
+            self.reached.setdefault( g, now )
+
+    def available( self ):
+        '''return time when the next segment is available, None if never'''
+        required, delay, data = self.segments[self.index]
+        if required not in self.reached:
+            return None
+        if not self.speed:
+            return 0
+        return self.reached[required] + delay / self.speed
+
+    def receive( self ):
+        now = time.time()
+        while self.index < len(self.segments):
+            t = self.available()
+            if t is None or t > now:
+                return t
+            self.rx += self.segments[self.index][2]
+            self.index += 1
+        return None
+
+    @property
+    def in_waiting( self ):
+        if not self._connected:
+            return 0
+        self.receive()
+        return len(self.rx)
+
+    def read( self, read_bytes=1 ):
+        if not self._connected:
+            return Env.EMPTY_BYTE
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        while True:
+            t = self.receive()
+            if self.rx:
+                ret = bytes(self.rx[:read_bytes])
+                del self.rx[:read_bytes]
+                return ret
+            now = time.time()
+            if t is None or (deadline is not None and t > deadline):
+                # nothing more in this recording, timeout at once if not real time
+                if self.speed and deadline is not None:
+                    time.sleep( max(0, deadline - now) )
+                return Env.EMPTY_BYTE
+            time.sleep( max(0, t - now) )
+
+    def readall( self ):
+        return self.read( self.in_waiting )
+
+    def write( self, buf ):
+        if not self._connected:
+            return
+        if Env.PYTHON_V3 and isinstance(buf, str):
+            buf = buf.encode('utf8')
+        if self.strict:
+            expected = self.expected[self.written:self.written+len(buf)]
+            if bytes(expected) != bytes(buf):
+                raise ReplayError( 'written %r, recorded %r'% (buf, bytes(expected)) )
+        self.written += len(buf)
+        self.updateGates()
+
+
+def recordingClass( cls ):
+    '''return a subclass of the instrument class that records its traffic,
+       pass record_file=<filename> when creating the instrument'''
+    port_type = type( 'Recording' + cls.PORT_TYPE.__name__, (RecordingPort,),
+                      {'PORT_TYPE': cls.PORT_TYPE} )
+    class RecordingInstrument( cls ):
+        PORT_TYPE = port_type
+    RecordingInstrument.__name__ = 'Recording' + cls.__name__
+    return RecordingInstrument
+
+def replayClass( cls ):
+    '''return a subclass of the instrument class that replays a record file,
+       the file name is passed as port, speed=<n> for timing, strict=True to
+       check written bytes'''
+    class ReplayInstrument( cls ):
+        PORT_TYPE = ReplayPort
+    ReplayInstrument.__name__ = 'Replay' + cls.__name__
+    return ReplayInstrument
+
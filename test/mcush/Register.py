@@ -2,37 +2,57 @@
 __doc__ = 'mcu registers'
 __author__ = 'Peng Shulin <trees_peng@163.com>'
 __license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
+import struct
 from . import Utils
 
 
 REGISTER_TYPE = {
-# c_type_name: (bit_width, bytes, get_func, set_func)
-'int8':   ( 8,  1, Utils.s2b, Utils.b2s ),
-'uint8':  ( 8,  1, Utils.s2B, Utils.B2s ),
-'int16':  ( 16, 2, Utils.s2h, Utils.h2s ),
-'uint16': ( 16, 2, Utils.s2H, Utils.H2s ),
-'int32':  ( 32, 4, Utils.s2i, Utils.i2s ),
-'uint32': ( 32, 4, Utils.s2I, Utils.I2s ),
-'int64':  ( 64, 8, Utils.s2q, Utils.q2s ),
-'uint64': ( 64, 8, Utils.s2Q, Utils.Q2s ),
-'float':  ( 32, 4, Utils.s2f, Utils.f2s ),
-'double': ( 64, 8, Utils.s2d, Utils.q2s ),
+# c_type_name: (bit_width, bytes, get_func, set_func, struct_format)
+'int8':   ( 8,  1, Utils.s2b, Utils.b2s, 'b' ),
+'uint8':  ( 8,  1, Utils.s2B, Utils.B2s, 'B' ),
+'int16':  ( 16, 2, Utils.s2h, Utils.h2s, 'h' ),
+'uint16': ( 16, 2, Utils.s2H, Utils.H2s, 'H' ),
+'int32':  ( 32, 4, Utils.s2i, Utils.i2s, 'i' ),
+'uint32': ( 32, 4, Utils.s2I, Utils.I2s, 'I' ),
+'int64':  ( 64, 8, Utils.s2q, Utils.q2s, 'q' ),
+'uint64': ( 64, 8, Utils.s2Q, Utils.Q2s, 'Q' ),
+'float':  ( 32, 4, Utils.s2f, Utils.f2s, 'f' ),
+'double': ( 64, 8, Utils.s2d, Utils.q2s, 'd' ),
 }
 
+class Field:
+    '''bit field of register'''
+
+    def __init__( self, name, offset, width, description='' ):
+        self.name = str(name)
+        self.offset = int(offset)
+        self.width = int(width)
+        self.mask = (1 << self.width) - 1
+        self.description = str(description)
+
+    def __str__( self ):
+        return self.name
+
+
 class Register:
     '''mcu register'''
     REG_TYPE = None
 
-    def __init__( self, name, address, description, reg_type=None ):
+    def __init__( self, name, address, description, reg_type=None, fields=None ):
         self.name = str(name)
         self.address = int(address)
         self.description = str(description)
         self.reg_type = str(reg_type) if reg_type is not None else self.REG_TYPE
         assert( self.reg_type in REGISTER_TYPE )
+        self.fields = list(fields) if fields else []
 
     def __str__( self ):
         return self.name
 
+    def decodeFields( self, value ):
+        '''return {field_name: value}'''
+        return dict([(f.name, (value >> f.offset) & f.mask) for f in self.fields])
+
 class Int8(Register):
     REG_TYPE = 'int8'
 
@@ -64,3 +84,53 @@ class Double(Register):
     REG_TYPE = 'double'
 
 
+class RegisterSet:
+    '''registers read together: sorted by address and merged into ranges
+       when the gap between them is not larger than max_gap bytes, each range
+       is read by one readMem and decoded by precompiled structs (one unless
+       registers overlap)'''
+    DEFAULT_MAX_GAP = 32  # a gap costs less than another x command
+
+    def __init__( self, registers, max_gap=None ):
+        if max_gap is None:
+            max_gap = self.DEFAULT_MAX_GAP
+        self.registers = sorted( registers, key=lambda r: r.address )
+        groups = []
+        for r in self.registers:
+            end = r.address + REGISTER_TYPE[r.reg_type][1]
+            if groups and r.address <= groups[-1][1] + max_gap:
+                groups[-1][1] = max( groups[-1][1], end )
+                groups[-1][2].append( r )
+            else:
+                groups.append( [r.address, end, [r]] )
+        self.ranges = []  # [(address, length, [(struct, names)])]
+        for start, end, regs in groups:
+            passes = []  # [[end, format, names]], overlapped register opens a new one
+            for r in regs:
+                for p in passes:
+                    if p[0] <= r.address:
+                        break
+                else:
+                    p = [start, '<', []]
+                    passes.append( p )
+                if r.address > p[0]:
+                    p[1] += '%dx'% (r.address - p[0])
+                p[1] += REGISTER_TYPE[r.reg_type][4]
+                p[2].append( r.name )
+                p[0] = r.address + REGISTER_TYPE[r.reg_type][1]
+            self.ranges.append( (start, end-start, [(struct.Struct(f), names) for e, f, names in passes]) )
+
+    def read( self, instrument ):
+        '''read and decode, return {name: value}'''
+        values = {}
+        for address, length, passes in self.ranges:
+            mem = instrument.readMem( address, length )
+            for s, names in passes:
+                values.update( zip(names, s.unpack_from(mem)) )
+        return values
+
+    def readFields( self, instrument ):
+        '''read and decode bit fields, return {register_name: {field_name: value}},
+           registers without fields are left out'''
+        values = self.read( instrument )
+        return dict([(r.name, r.decodeFields(values[r.name])) for r in self.registers if r.fields])
@@ -0,0 +1,247 @@
+# coding: utf8
+__doc__ = 'build register sets from CMSIS-SVD files, ELF symbol tables and linker map files'
+__author__ = 'Peng Shulin <trees_peng@163.com>'
+__license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
+import re
+import struct
+import xml.etree.ElementTree as ET
+from . import Register
+
+
+# register type of each size, symbols of other sizes need types specified
+TYPE_OF_SIZE = {1: 'uint8', 2: 'uint16', 4: 'uint32', 8: 'uint64'}
+# reserved gaps up to this are read with the peripheral, one readMem for most
+PERIPHERAL_MAX_GAP = 256
+# svd access of registers that can not be read
+ACCESS_WRITE_ONLY = ('write-only', 'writeOnce')
+
+
+class RegisterMapError( Exception ):
+    pass
+
+
+#############################################################################
+# CMSIS-SVD
+def _text( node, tag, default=None ):
+    child = node.find( tag )
+    if child is None or child.text is None:
+        return default
+    return child.text.strip()
+
+def _int( text ):
+    # svd scaled non-negative integer: 0x.., #binary or decimal
+    text = text.strip().lower()
+    if text.startswith('#'):
+        return int(text[1:], 2)
+    return int(text, 0)
+
+def _parseFields( node ):
+    fields = []
+    for f in node.findall( 'fields/field' ):
+        name = _text( f, 'name' )
+        if _text( f, 'bitOffset' ) is not None:
+            offset = _int( _text(f, 'bitOffset') )
+            width = _int( _text(f, 'bitWidth', '1') )
+        elif _text( f, 'lsb' ) is not None:
+            offset = _int( _text(f, 'lsb') )
+            width = _int( _text(f, 'msb') ) - offset + 1
+        else:
+            msb, lsb = _text( f, 'bitRange' ).strip('[]').split(':')
+            offset = _int( lsb )
+            width = _int( msb ) - offset + 1
+        fields.append( Register.Field( name, offset, width, _text(f, 'description', '') ) )
+    return fields
+
+def _expandDim( node, name, offset ):
+    '''return [(name, offset)] of register/cluster arrays'''
+    dim = _text( node, 'dim' )
+    if dim is None:
+        return [(name, offset)]
+    dim = _int( dim )
+    increment = _int( _text(node, 'dimIncrement') )
+    index = _text( node, 'dimIndex' )
+    if index is None:
+        index = [str(i) for i in range(dim)]
+    elif '-' in index:
+        a, b = index.split('-')
+        index = [str(i) for i in range(int(a), int(b)+1)]
+    else:
+        index = index.split(',')
+    name = name.replace('[%s]', '%s')
+    return [(name.replace('%s', index[i]), offset + i * increment) for i in range(dim)]
+
+def _hasReadAction( node ):
+    '''readAction (clear, set, modify...) of the register or any field'''
+    if _text( node, 'readAction' ) is not None:
+        return True
+    return any(_text( f, 'readAction' ) is not None for f in node.findall( 'fields/field' ))
+
+def _parseRegisters( node, base, size, access, prefix ):
+    '''return [Register], with the svd access and read_action (True if
+       reading changes the register) attached'''
+    registers = []
+    access = _text( node, 'access', access )
+    for r in node.findall( 'register' ):
+        reg_size = _int( _text(r, 'size', str(size)) )
+        reg_type = TYPE_OF_SIZE[reg_size // 8]
+        fields = _parseFields( r )
+        description = _text( r, 'description', '' )
+        reg_access = _text( r, 'access', access )
+        read_action = _hasReadAction( r )
+        for name, offset in _expandDim( r, _text(r, 'name'), _int(_text(r, 'addressOffset')) ):
+            reg = Register.Register( prefix + name, base + offset, description, reg_type, fields )
+            reg.access = reg_access
+            reg.read_action = read_action
+            registers.append( reg )
+    for c in node.findall( 'cluster' ):
+        for name, offset in _expandDim( c, _text(c, 'name'), _int(_text(c, 'addressOffset')) ):
+            registers += _parseRegisters( c, base + offset, size, access, prefix + name + '_' )
+    return registers
+
+def isReadSafe( register ):
+    '''False for write-only registers and those changed by reading (data
+       registers popping a fifo, clear-on-read status)'''
+    if getattr(register, 'read_action', False):
+        return False
+    return getattr(register, 'access', None) not in ACCESS_WRITE_ONLY
+
+def loadSvd( filename, prefix=True, max_gap=None, unsafe=False ):
+    '''parse CMSIS-SVD file, return {peripheral_name: RegisterSet},
+       register names are prefixed with the peripheral name (GPIOA_CRL);
+       registers not safe to read (see isReadSafe) are left out unless
+       unsafe is True, as a coalesced read would hit them all'''
+    if max_gap is None:
+        max_gap = PERIPHERAL_MAX_GAP
+    device = ET.parse( filename ).getroot()
+    device_size = _int( _text(device, 'size', '32') )
+    device_access = _text( device, 'access', 'read-write' )
+    nodes = {}
+    for p in device.findall( 'peripherals/peripheral' ):
+        nodes[_text(p, 'name')] = p
+    ret = {}
+    for name, p in nodes.items():
+        source = p
+        derived = p.get( 'derivedFrom' )
+        if derived is not None and p.find( 'registers' ) is None:
+            if derived not in nodes:
+                raise RegisterMapError( '%s derived from unknown %s'% (name, derived) )
+            source = nodes[derived]
+        registers_node = source.find( 'registers' )
+        if registers_node is None:
+            continue
+        size = _int( _text(p, 'size', _text(source, 'size', str(device_size))) )
+        access = _text( p, 'access', _text(source, 'access', device_access) )
+        base = _int( _text(p, 'baseAddress') )
+        registers = _parseRegisters( registers_node, base, size, access, name + '_' if prefix else '' )
+        if not unsafe:
+            registers = [r for r in registers if isReadSafe(r)]
+        if registers:
+            ret[name] = Register.RegisterSet( registers, max_gap )
+    return ret
+
+
+#############################################################################
+# ELF symbol table
+ELF_MAGIC = b'\x7fELF'
+SHT_SYMTAB = 2
+STT_OBJECT = 1
+STB_LOCAL = 0
+
+def _symbolRegisters( symbols, names, types ):
+    '''[(name, address, size)] -> [Register], sizes without register type
+       are skipped unless its type is given'''
+    if types is None:
+        types = {}
+    registers = []
+    for name, address, size in symbols:
+        if names is not None and name not in names:
+            continue
+        reg_type = types.get( name, TYPE_OF_SIZE.get(size) )
+        if reg_type is None:
+            continue
+        registers.append( Register.Register( name, address, '', reg_type ) )
+    return registers
+
+def loadElfSymbols( filename, names=None, types=None, local=False ):
+    '''return [Register] of data objects in the symbol table of ELF file;
+       the type is from types {name: reg_type} or unsigned of the symbol size
+       (C types are in debug info, not parsed here)'''
+    with open( filename, 'rb' ) as f:
+        elf = f.read()
+    if elf[:4] != ELF_MAGIC:
+        raise RegisterMapError( 'not an ELF file: %s'% filename )
+    is64 = bool(struct.unpack_from('B', elf, 4)[0] == 2)
+    endian = '>' if struct.unpack_from('B', elf, 5)[0] == 2 else '<'
+    if is64:
+        shoff, = struct.unpack_from( endian + 'Q', elf, 0x28 )
+        shentsize, shnum = struct.unpack_from( endian + 'HH', elf, 0x3A )
+        section = struct.Struct( endian + 'IIQQQQIIQQ' )
+        symbol = struct.Struct( endian + 'IBBHQQ' )
+    else:
+        shoff, = struct.unpack_from( endian + 'I', elf, 0x20 )
+        shentsize, shnum = struct.unpack_from( endian + 'HH', elf, 0x2E )
+        section = struct.Struct( endian + 'IIIIIIIIII' )
+        symbol = struct.Struct( endian + 'IIIBBH' )
+    sections = [section.unpack_from(elf, shoff + i * shentsize) for i in range(shnum)]
+    symbols = []
+    for sh in sections:
+        if sh[1] != SHT_SYMTAB:
+            continue
+        offset, size, link, entsize = sh[4], sh[5], sh[6], sh[9]
+        strtab = sections[link][4]
+        for pos in range(offset, offset + size, entsize):
+            if is64:
+                st_name, st_info, st_other, st_shndx, st_value, st_size = symbol.unpack_from( elf, pos )
+            else:
+                st_name, st_value, st_size, st_info, st_other, st_shndx = symbol.unpack_from( elf, pos )
+            if st_info & 0xF != STT_OBJECT or st_shndx == 0:
+                continue
+            if st_info >> 4 == STB_LOCAL and not local:
+                continue
+            end = elf.index( b'\x00', strtab + st_name )
+            name = elf[strtab + st_name:end].decode('latin1')
+            symbols.append( (name, st_value, st_size) )
+    return _symbolRegisters( symbols, names, types )
+
+
+#############################################################################
+# GNU ld map file
+# input sections of -fdata-sections objects, long names wrap to the next line,
+# global symbols follow (static variables have no symbol line, static
+# locals are numbered as in the symbol table: .bss.count.1):
+#  .bss.counter   0x20000010        0x4 build/main.o
+#                 0x20000010                counter
+# merged constants (.rodata.cst4, .rodata.str1.1) are not variables
+MAP_SECTION = re.compile( r'^ \.(?:s?bss|s?data|rodata(?!\.(?:cst|str)\d))\.([A-Za-z_]\w*(?:\.\d+)?)(?=\s|$)(?:\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+))?' )
+MAP_WRAPPED = re.compile( r'^\s+0x([0-9a-fA-F]+)\s+0x([0-9a-fA-F]+)' )
+MAP_SYMBOL = re.compile( r'^\s+0x([0-9a-fA-F]+)\s+([A-Za-z_]\w*)\s*$' )
+
+def loadMapSymbols( filename, names=None, types=None, local=False ):
+    '''return [Register] of variables placed in their own data sections
+       (compiled with -fdata-sections), type and local as loadElfSymbols'''
+    symbols = []
+    defined = set()  # (name, address) of global symbols
+    wrapped = None
+    with open( filename, 'r' ) as f:
+        for line in f:
+            if wrapped is not None:
+                match = MAP_WRAPPED.match( line )
+                if match:
+                    symbols.append( (wrapped, int(match.group(1), 16), int(match.group(2), 16)) )
+                wrapped = None
+                continue
+            match = MAP_SECTION.match( line )
+            if match is None:
+                match = MAP_SYMBOL.match( line )
+                if match:
+                    defined.add( (match.group(2), int(match.group(1), 16)) )
+                continue
+            if match.group(2) is None:
+                wrapped = match.group(1)
+            else:
+                symbols.append( (match.group(1), int(match.group(2), 16), int(match.group(3), 16)) )
+    # discarded sections are listed at address 0
+    symbols = [s for s in symbols if s[1]]
+    if not local:
+        symbols = [s for s in symbols if (s[0], s[1]) in defined]
+    return _symbolRegisters( symbols, names, types )
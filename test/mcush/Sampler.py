@@ -0,0 +1,209 @@
+# coding: utf8
+__doc__ = 'poll registers and memory at a fixed rate into a ring buffer'
+__author__ = 'Peng Shulin <trees_peng@163.com>'
+__license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
+import time
+import math
+import struct
+import threading
+from array import array
+from . import Env
+from . import Register
+from . import Shared
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    monotonic = time.monotonic
+except AttributeError:
+    monotonic = time.time  # python 2
+
+
+class Sampler:
+    '''sample sources periodically in a background thread
+
+    Sources are Register objects, RegisterSet, or (address, length[, reg_type])
+    memory ranges expanded into items named '0x20000000[0]'...; all of them
+    are read together with the least readMem commands.  Each sample is a row
+    of (monotonic time, value, ...) in a preallocated ring buffer of
+    capacity rows, numpy array if available (or use_numpy=False for
+    array.array).  Values are stored as double.  Slots missed because
+    reading is slower than rate are counted as dropped.  A SharedInstrument
+    is called with PRIORITY_BACKGROUND.'''
+    DEFAULT_CAPACITY = 10000
+
+    def __init__( self, instrument, sources, rate, capacity=None, use_numpy=None, max_gap=None ):
+        self.instrument = instrument
+        self.registers = []
+        for s in sources:
+            if isinstance(s, Register.Register):
+                self.registers.append( s )
+            elif isinstance(s, Register.RegisterSet):
+                self.registers += s.registers
+            else:
+                address, length = s[0], s[1]
+                reg_type = s[2] if len(s) > 2 else 'uint8'
+                size = Register.REGISTER_TYPE[reg_type][1]
+                for i in range(length // size):
+                    self.registers.append( Register.Register( '0x%08X[%d]'% (address, i),
+                                                              address + i * size, '', reg_type ) )
+        self.reg_set = Register.RegisterSet( self.registers, max_gap )
+        self.names = [r.name for r in self.registers]
+        self.columns = ['time'] + self.names
+        self.period = 1.0 / rate
+        self.capacity = self.DEFAULT_CAPACITY if capacity is None else capacity
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        width = len(self.columns)
+        if use_numpy:
+            self.buffer = numpy.zeros( (self.capacity, width) )
+        else:
+            self.buffer = array( 'd', bytes(8 * self.capacity * width) if Env.PYTHON_V3 else [0.0] * (self.capacity * width) )
+        self.use_numpy = use_numpy
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.reset()
+
+    def reset( self ):
+        '''clear buffer and counters'''
+        with self.lock:
+            self.index = 0  # next row to write
+            self.count = 0  # rows stored, up to capacity
+            self.samples = 0
+            self.dropped = 0
+            self.errors = 0
+            self.last_error = None
+            self.lateness_sum = 0.0
+            self.lateness_sum2 = 0.0
+            self.lateness_max = 0.0
+            self.t_start = None
+            self.t_last = None
+
+    def read( self ):
+        if isinstance(self.instrument, Shared.SharedInstrument):
+            return self.instrument.call( self.reg_set.read, priority=Shared.PRIORITY_BACKGROUND )
+        return self.reg_set.read( self.instrument )
+
+    def sampleOnce( self, t_scheduled=None ):
+        '''read all the sources and append one row'''
+        t = monotonic()
+        try:
+            values = self.read()
+        except Exception as e:
+            with self.lock:
+                self.errors += 1
+                self.last_error = e
+            return False
+        row = [t] + [values[n] for n in self.names]
+        lateness = 0.0 if t_scheduled is None else max(0.0, t - t_scheduled)
+        with self.lock:
+            width = len(self.columns)
+            if self.use_numpy:
+                self.buffer[self.index] = row
+            else:
+                self.buffer[self.index*width:(self.index+1)*width] = array( 'd', row )
+            self.index = (self.index + 1) % self.capacity
+            self.count = min( self.count + 1, self.capacity )
+            self.samples += 1
+            self.lateness_sum += lateness
+            self.lateness_sum2 += lateness * lateness
+            if lateness > self.lateness_max:
+                self.lateness_max = lateness
+            if self.t_start is None:
+                self.t_start = t
+            self.t_last = t
+        return True
+
+    def run( self ):
+        t_next = monotonic()
+        while not self.stop_event.is_set():
+            self.sampleOnce( t_next )
+            t_next += self.period
+            now = monotonic()
+            if now > t_next:
+                # slots passed while reading, keep the schedule without drift
+                missed = int((now - t_next) / self.period) + 1
+                with self.lock:
+                    self.dropped += missed
+                t_next += missed * self.period
+            self.stop_event.wait( t_next - now )
+
+    def start( self ):
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread( target=self.run )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop( self, timeout=None ):
+        thread, self.thread = self.thread, None
+        if thread is None:
+            return
+        self.stop_event.set()
+        thread.join( timeout )
+
+    @property
+    def running( self ):
+        return self.thread is not None
+
+    def getRows( self ):
+        '''return rows in time order, numpy 2d array or list of lists'''
+        with self.lock:
+            start = (self.index - self.count) % self.capacity
+            order = [(start + i) % self.capacity for i in range(self.count)]
+            if self.use_numpy:
+                return self.buffer[order]
+            width = len(self.columns)
+            return [self.buffer[i*width:(i+1)*width].tolist() for i in order]
+
+    def latest( self ):
+        '''return {column: value} of the last sample, None if empty'''
+        with self.lock:
+            if not self.count:
+                return None
+            width = len(self.columns)
+            i = (self.index - 1) % self.capacity
+            row = self.buffer[i] if self.use_numpy else self.buffer[i*width:(i+1)*width]
+            return dict(zip(self.columns, [float(v) for v in row]))
+
+    def stats( self ):
+        '''return achieved rate, jitter (lateness to the schedule) and counters'''
+        with self.lock:
+            n = self.samples
+            elapsed = (self.t_last - self.t_start) if n > 1 else 0
+            mean = self.lateness_sum / n if n else 0.0
+            return {
+                'samples': n,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'rate': (n - 1) / elapsed if elapsed else 0.0,
+                'target_rate': 1.0 / self.period,
+                'jitter_mean': mean,
+                'jitter_std': math.sqrt(max(0.0, self.lateness_sum2 / n - mean * mean)) if n else 0.0,
+                'jitter_max': self.lateness_max,
+                }
+
+    def exportCsv( self, filename ):
+        rows = self.getRows()
+        with open( filename, 'w' ) as f:
+            f.write( ','.join(self.columns) + '\n' )
+            for row in rows:
+                f.write( ','.join(['%r'% float(v) for v in row]) + '\n' )
+
+    def exportNpy( self, filename ):
+        '''save rows as 2d float64 .npy, written directly without numpy'''
+        rows = self.getRows()
+        if self.use_numpy:
+            numpy.save( filename, rows )
+            return
+        header = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d, %d), }"% (len(rows), len(self.columns))
+        # magic, version 1.0, header length, header padded to 64 bytes with '\n'
+        header += ' ' * (63 - (10 + len(header)) % 64) + '\n'
+        with open( filename, 'wb' ) as f:
+            f.write( b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1') )
+            for row in rows:
+                f.write( struct.pack('<%dd'% len(row), *row) )
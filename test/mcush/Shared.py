@@ -0,0 +1,243 @@
+# coding: utf8
+__doc__ = 'share one instrument among threads with a prioritized command queue'
+__author__ = 'Peng Shulin <trees_peng@163.com>'
+__license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
+import threading
+import itertools
+try:
+    from Queue import PriorityQueue
+except ImportError:
+    from queue import PriorityQueue
+from . import Instrument
+
+
+# lower value runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 10
+PRIORITY_BACKGROUND = 20
+PRIORITY_STOP = 1000  # after all the submitted jobs
+
+
+class CancelledError( Exception ):
+    pass
+
+
+class Future(object):
+    '''result of a submitted job'''
+
+    def __init__( self ):
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.state = 'pending'  # pending/running/done/cancelled
+        self.ret = None
+        self.error = None
+        self.callbacks = []
+
+    def cancel( self ):
+        '''cancel if not started, return True if cancelled'''
+        with self.lock:
+            if self.state != 'pending':
+                return bool(self.state == 'cancelled')
+            self.state = 'cancelled'
+            self.error = CancelledError()
+        self.finish()
+        return True
+
+    def cancelled( self ):
+        return self.state == 'cancelled'
+
+    def done( self ):
+        return self.event.is_set()
+
+    def setRunning( self ):
+        '''return False if cancelled already'''
+        with self.lock:
+            if self.state != 'pending':
+                return False
+            self.state = 'running'
+            return True
+
+    def setResult( self, ret ):
+        self.ret = ret
+        self.state = 'done'
+        self.finish()
+
+    def setException( self, error ):
+        self.error = error
+        self.state = 'done'
+        self.finish()
+
+    def finish( self ):
+        self.event.set()
+        with self.lock:
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback( self )
+
+    def addDoneCallback( self, callback ):
+        '''callback(future) is called in the worker thread when done,
+           or at once if done already'''
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append( callback )
+                return
+        callback( self )
+
+    def wait( self, timeout=None ):
+        if not self.event.wait( timeout ):
+            raise Instrument.CommandTimeoutError( 'job not finished in %s seconds'% timeout )
+
+    def result( self, timeout=None ):
+        '''wait and return the result, or raise the exception of the job'''
+        self.wait( timeout )
+        if self.error is not None:
+            raise self.error
+        return self.ret
+
+    def exception( self, timeout=None ):
+        self.wait( timeout )
+        return self.error
+
+
+class SharedInstrument:
+    '''a worker thread owns the instrument and executes the submitted jobs
+       in order of priority (FIFO within the same priority), so that several
+       threads (GUI, logger, test script) use the same port safely'''
+
+    def __init__( self, instrument, priority=PRIORITY_NORMAL, start=True ):
+        self.instrument = instrument
+        self.priority = priority  # default of submit()
+        self.queue = PriorityQueue()
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.worker = None
+        if start:
+            self.start()
+
+    def start( self ):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = self.worker = threading.Thread( target=self.run )
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop( self, cancel=False, timeout=None ):
+        '''stop the worker after the submitted jobs are done,
+           or cancel the pending ones'''
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is None:
+            return
+        if cancel:
+            self.cancelPending()
+        self.queue.put( (PRIORITY_STOP, next(self.counter), None) )
+        if thread is not threading.current_thread():
+            thread.join( timeout )
+
+    def close( self ):
+        '''stop the worker and disconnect'''
+        self.stop()
+        self.instrument.disconnect()
+
+    @property
+    def running( self ):
+        return self.thread is not None
+
+    def inWorker( self ):
+        return self.worker is threading.current_thread()
+
+    def cancelPending( self ):
+        '''cancel all jobs not started yet, return count'''
+        count = 0
+        for priority, index, job in list(self.queue.queue):
+            if job is not None and job[0].cancel():
+                count += 1
+        return count
+
+    @property
+    def pending( self ):
+        return self.queue.qsize()
+
+    def run( self ):
+        while True:
+            priority, index, job = self.queue.get()
+            if job is None:
+                return
+            future, func, args, kwargs = job
+            if not future.setRunning():
+                continue  # cancelled
+            try:
+                ret = func( self.instrument, *args, **kwargs )
+            except Exception as e:
+                future.setException( e )
+            else:
+                future.setResult( ret )
+
+    def submit( self, func, args=(), kwargs=None, priority=None ):
+        '''queue func(instrument, *args, **kwargs), func can also be the name of
+           an instrument method, return Future'''
+        if kwargs is None:
+            kwargs = {}
+        if not callable(func):
+            name = func
+            func = lambda instrument, *a, **k: getattr(instrument, name)( *a, **k )
+        if priority is None:
+            priority = self.priority
+        future = Future()
+        if self.inWorker():
+            # called from a running job, queueing it would deadlock
+            future.setRunning()
+            try:
+                future.setResult( func( self.instrument, *args, **kwargs ) )
+            except Exception as e:
+                future.setException( e )
+            return future
+        if self.thread is None:
+            raise Instrument.CommandExecuteError( 'worker not started' )
+        self.queue.put( (priority, next(self.counter), (future, func, args, kwargs)) )
+        return future
+
+    def call( self, func, *args, **kwargs ):
+        '''submit and wait for the result'''
+        priority = kwargs.pop( 'priority', None )
+        timeout = kwargs.pop( 'timeout', None )
+        return self.submit( func, args, kwargs, priority ).result( timeout )
+
+    def writeCommand( self, cmd, priority=None, timeout=None ):
+        return self.submit( 'writeCommand', (cmd,), None, priority ).result( timeout )
+
+    def proxy( self, priority ):
+        '''return an object calling instrument methods with the priority'''
+        return SharedProxy( self, priority )
+
+    def __getattr__( self, name ):
+        # methods of the instrument are called through the queue
+        if name.startswith('__') or name == 'instrument':
+            raise AttributeError( name )
+        return SharedProxy( self, self.priority ).getMethod( name )
+
+
+class SharedProxy:
+    '''instrument methods called through the queue of SharedInstrument,
+       obj.led(0, on=True) blocks until the worker has executed it'''
+
+    def __init__( self, shared, priority ):
+        self.shared = shared
+        self.priority = priority
+
+    def getMethod( self, name ):
+        attr = getattr( self.shared.instrument, name )
+        if not callable(attr):
+            return attr
+        def method( *args, **kwargs ):
+            return self.shared.submit( name, args, kwargs, self.priority ).result()
+        method.__name__ = name
+        return method
+
+    def __getattr__( self, name ):
+        if name.startswith('__'):
+            raise AttributeError( name )
+        return self.getMethod( name )
+
@@ -0,0 +1,906 @@
+# coding: utf8
+__doc__ = 'virtual mcush device, for testing and benchmarking without hardware'
+__author__ = 'Peng Shulin <trees_peng@163.com>'
+__license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
+import os
+import time
+import struct
+import shlex
+import random
+import base64
+import threading
+from collections import deque
+from . import Env
+from . import Utils
+from . import Instrument
+from . import Mcush
+
+
+class ShellSyntaxError( Exception ):
+    '''command returns negative errnum, prompt '?>' '''
+    pass
+
+class ShellExecuteError( Exception ):
+    '''command returns positive errnum, prompt '!>' '''
+    pass
+
+
+def parseInt( s ):
+    '''parse integer like firmware parse_int: decimal or 0x/0b/0o prefixed'''
+    try:
+        return int(s, 0)
+    except ValueError:
+        pass
+    try:
+        return int(s, 10)
+    except ValueError:
+        raise ShellSyntaxError( '%s error'% s )
+
+def parseOptions( argv, spec ):
+    '''parse argv with spec {short_name: (long_name, need_value)},
+       return ({long_name: value_or_True}, [positional args])'''
+    longs = dict([(v[0], (k, v[1])) for k, v in spec.items()])
+    opts, args = {}, []
+    i = 0
+    while i < len(argv):
+        a = argv[i]
+        i += 1
+        if a.startswith('--') and len(a) > 2:
+            name, sep, val = a[2:].partition('=')
+            if name not in longs:
+                raise ShellSyntaxError( '%s error'% a )
+            need_value = longs[name][1]
+        elif a.startswith('-') and len(a) > 1 and not a[1].isdigit():
+            if a[1] not in spec:
+                raise ShellSyntaxError( '%s error'% a )
+            name, need_value = spec[a[1]]
+            val = a[2:]
+        else:
+            args.append( a )
+            continue
+        if need_value:
+            if not val:
+                if i >= len(argv):
+                    raise ShellSyntaxError( '%s error'% name )
+                val = argv[i]
+                i += 1
+            opts[name] = val
+        else:
+            opts[name] = True
+    return opts, args
+
+
+class Shell(object):
+    '''emulated mcush shell, process() takes input bytes and returns output bytes'''
+    DEFAULT_MODEL = 'mcush'
+    DEFAULT_VERSION = '1.2'
+    DEFAULT_SERIAL_NUMBER = '000000000000000000000001'
+    RAM_BASE = 0x20000000
+    RAM_SIZE = 0x10000  # the upper half is used as heap
+    SPIFFS_SIZE = 0x40000
+    SPIFFS_SECTOR_SIZE = 4096
+    SPIFFS_PAGE_SIZE = 256
+    VOLUMES = ['s']
+    LED_NUMBER = 4
+    GPIO_NUMBER = 4
+    SUB_PROMPT = '>'
+    BAUDRATES = [9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600]
+    BAUDRATE_REVERT_TIME = 0.5  # switched baudrate not confirmed in time
+    POWER_ON_BAUDRATE = None  # None matches any port baudrate
+    BOOT_DELAY = 0  # input is ignored while booting after reboot
+
+    # (name, short name, method)
+    COMMANDS = [
+        ('help', '?', 'cmdHelp'),
+        ('*idn?', None, 'cmdScpiIdn'),
+        ('*rst', None, 'cmdScpiRst'),
+        ('reboot', None, 'cmdReboot'),
+        ('dump', 'x', 'cmdDump'),
+        ('write', 'w', 'cmdWrite'),
+        ('mfill', None, 'cmdMfill'),
+        ('mapi', None, 'cmdMapi'),
+        ('mkbuf', None, 'cmdMkbuf'),
+        ('uptime', None, 'cmdUptime'),
+        ('gpio', None, 'cmdGpio'),
+        ('led', None, 'cmdLed'),
+        ('i2c', None, 'cmdI2c'),
+        ('spi', None, 'cmdSpi'),
+        ('beep', 'b', 'cmdBeep'),
+        ('error', None, 'cmdError'),
+        ('spiffs', 's', 'cmdSpiffs'),
+        ('cat', None, 'cmdCat'),
+        ('rm', None, 'cmdRm'),
+        ('rename', None, 'cmdRename'),
+        ('ls', 'l', 'cmdList'),
+        ('crc', None, 'cmdCrc'),
+        ('baud', None, 'cmdBaud'),
+        ]
+
+    def __init__( self, model=None, version=None, serial_number=None ):
+        self.model = self.DEFAULT_MODEL if model is None else model
+        self.version = self.DEFAULT_VERSION if version is None else version
+        self.serial_number = self.DEFAULT_SERIAL_NUMBER if serial_number is None else serial_number
+        self.commands = {}
+        for name, sname, method in self.COMMANDS:
+            self.commands[name] = getattr(self, method)
+            if sname:
+                self.commands[sname] = getattr(self, method)
+        self.ram = bytearray(self.RAM_SIZE)
+        self.spiffs_flash = bytearray(b'\xFF' * self.SPIFFS_SIZE)
+        self.files = {}  # {'/s/name': bytes}
+        self.reboot_counter = 0
+        self.boot_until = 0
+        self.reset()
+
+    def reset( self ):
+        '''power on state, memory and files are kept'''
+        self.line = bytearray()
+        self.out = bytearray()
+        self.errnum = 0
+        self.errno = 0
+        self.collector = None  # (lines, callback) in multi-line input mode
+        self.heap = {}  # {address: size}
+        self.leds = [False] * self.LED_NUMBER
+        self.gpio_out = [0] * self.GPIO_NUMBER
+        self.gpio_dir = [0] * self.GPIO_NUMBER
+        self.boot_time = time.time()
+        self.pending_logs = bytearray()  # printed after the next line input
+        self.baudrate = self.POWER_ON_BAUDRATE
+        self.baudrate_revert = None  # (old baudrate, deadline) until confirmed
+
+    @property
+    def idn( self ):
+        return '%s,%s'% (self.model, self.version)
+
+    @property
+    def prompt( self ):
+        if self.errnum < 0:
+            return '?>'
+        elif self.errnum > 0:
+            return '!>'
+        return '=>'
+
+    def write( self, s ):
+        if not isinstance(s, (bytes, bytearray)):
+            s = s.encode('utf8')
+        self.out += s
+
+    def writeLine( self, s ):
+        self.write( s )
+        self.out += b'\r\n'
+
+    def checkBaudrate( self, baudrate ):
+        '''return True if input sent at the baudrate can be received'''
+        if self.baudrate_revert is not None and time.time() > self.baudrate_revert[1]:
+            self.baudrate = self.baudrate_revert[0]
+            self.baudrate_revert = None
+        return self.baudrate is None or baudrate is None or self.baudrate == baudrate
+
+    def booting( self ):
+        return time.time() < self.boot_until
+
+    def process( self, data ):
+        '''feed input bytes, return output bytes'''
+        if self.booting():
+            return Env.EMPTY_BYTE
+        for c in bytearray(data):
+            if c == 0x0A:
+                self.out += b'\n'
+                if self.pending_logs:
+                    self.flushLogs()
+                line = self.line.decode('utf8', 'replace')
+                self.line = bytearray()
+                self.processLine( line )
+            elif c == 0x03:  # Ctrl-C
+                self.line = bytearray()
+                self.collector = None
+                self.errnum = 0
+                self.out += b'\r\n'
+                self.write( self.prompt )
+            elif c in (0x08, 0x7F):  # backspace
+                if self.line:
+                    del self.line[-1]
+                    self.out += b'\b \b'
+            elif c != 0x0D:
+                self.line.append( c )
+                self.out.append( c )
+        if not data and self.pending_logs:
+            self.flushLogs()
+        ret = bytes(self.out)
+        self.out = bytearray()
+        return ret
+
+    def log( self, message, level='I', module='sim' ):
+        '''queue a log line as the logger task prints it, it interleaves
+           with the output of the next command, or call process(b'')'''
+        t = time.time() - self.boot_time
+        s = int(t)
+        line = '%u:%02u:%02u.%03u %s '% (s//3600, (s//60)%60, s%60, int((t-s)*1000), level)
+        if module:
+            line += module + ': '
+        self.pending_logs += (line + message + '\n').encode('utf8')
+
+    def flushLogs( self ):
+        logs, self.pending_logs = self.pending_logs, bytearray()
+        self.out += logs
+
+    def processLine( self, line ):
+        self.errnum = 0
+        if self.collector is not None:
+            lines, callback = self.collector
+            if line:
+                lines.append( line )
+                self.write( self.SUB_PROMPT )
+                return
+            self.collector = None
+            if lines:
+                self.call( callback, lines )
+            else:
+                self.errnum = 1
+        elif line.strip():
+            self.execute( line )
+        if self.collector is None and not self.booting():
+            self.write( self.prompt )
+
+    def readLines( self, callback ):
+        '''enter multi-line input mode, callback(lines) is called after an empty line'''
+        self.collector = ([], callback)
+        self.write( self.SUB_PROMPT )
+
+    def call( self, func, *args ):
+        try:
+            func( *args )
+            self.errnum = 0
+        except ShellSyntaxError as e:
+            if str(e):
+                self.writeLine( str(e) )
+            self.errnum = -1
+        except ShellExecuteError as e:
+            if str(e):
+                self.writeLine( str(e) )
+            self.errnum = 1
+
+    def execute( self, line ):
+        try:
+            argv = shlex.split( line )
+        except ValueError:
+            self.errnum = -1
+            return
+        func = self.commands.get( argv[0] )
+        if func is None:
+            self.writeLine( 'Invalid command: %s'% argv[0] )
+            self.errnum = -1
+            return
+        self.call( func, argv[1:] )
+
+    # memory model
+    def checkAddress( self, addr, length ):
+        offset = addr - self.RAM_BASE
+        if offset < 0 or offset + length > self.RAM_SIZE:
+            raise ShellExecuteError( 'address error' )
+        return offset
+
+    def readRam( self, addr, length ):
+        offset = self.checkAddress( addr, length )
+        return bytes(self.ram[offset:offset+length])
+
+    def writeRam( self, addr, data ):
+        offset = self.checkAddress( addr, len(data) )
+        self.ram[offset:offset+len(data)] = data
+
+    def malloc( self, length ):
+        '''first fit allocator in the upper half of ram, 8 bytes aligned'''
+        length = (length + 7) & ~7
+        addr = self.RAM_BASE + self.RAM_SIZE // 2
+        for a in sorted(self.heap):
+            if a - addr >= length:
+                break
+            addr = a + ((self.heap[a] + 7) & ~7)
+        if addr + length > self.RAM_BASE + self.RAM_SIZE:
+            return 0
+        self.heap[addr] = length
+        return addr
+
+    def free( self, addr ):
+        self.heap.pop( addr, None )
+
+    # file system model
+    def splitPathname( self, pathname ):
+        '''return (volume, name), name may be empty'''
+        if not pathname.startswith('/'):
+            pathname = '/' + self.VOLUMES[0] + '/' + pathname
+        vol, sep, name = pathname[1:].partition('/')
+        if vol not in self.VOLUMES:
+            raise ShellExecuteError()
+        return vol, name
+
+    def getFilePathname( self, pathname ):
+        vol, name = self.splitPathname( pathname )
+        if not name:
+            raise ShellSyntaxError()
+        return '/%s/%s'% (vol, name)
+
+    # commands
+    def cmdHelp( self, argv ):
+        opts, args = parseOptions( argv, {'c': ('check', True), 's': ('sname', True), 'a': ('all', False)} )
+        if 'check' in opts:
+            self.writeLine( '1' if opts['check'] in self.commands else '0' )
+        elif 'sname' in opts:
+            for name, sname, method in self.COMMANDS:
+                if name == opts['sname'] and sname:
+                    self.writeLine( sname )
+        else:
+            for name, sname, method in self.COMMANDS:
+                self.writeLine( '%s/%s'% (name, sname) if sname else name )
+
+    def cmdScpiIdn( self, argv ):
+        self.writeLine( self.idn )
+        if self.serial_number:
+            self.writeLine( self.serial_number )
+
+    def cmdScpiRst( self, argv ):
+        pass
+
+    def cmdReboot( self, argv ):
+        opts, args = parseOptions( argv, {'c': ('counter', False), 'r': ('reset', False)} )
+        if 'counter' in opts:
+            self.writeLine( '%u'% self.reboot_counter )
+        elif 'reset' in opts:
+            self.reboot_counter = 0
+        else:
+            self.reboot_counter += 1
+            self.reset()
+            self.boot_until = time.time() + self.BOOT_DELAY
+            if not self.booting():
+                self.out += b'\r\n'
+
+    def cmdUptime( self, argv ):
+        t = time.time() - self.boot_time
+        s = int(t)
+        self.writeLine( '%u:%02u:%02u.%03u'% (s//3600, (s//60)%60, s%60, int((t-s)*1000)) )
+
+    def cmdDump( self, argv ):
+        opts, args = parseOptions( argv, {'b': ('address', True), 'l': ('length', True),
+                                          'w': ('width', True), 'c': ('compact', False)} )
+        if 'address' not in opts:
+            raise ShellSyntaxError( 'address error' )
+        addr = parseInt( opts['address'] )
+        length = parseInt( opts.get('length', '16') )
+        width = parseInt( opts.get('width', '1') )
+        if width not in (1, 2, 4):
+            raise ShellSyntaxError( 'width error' )
+        compact = 'compact' in opts
+        fmt = {1: 'B', 2: 'H', 4: 'I'}[width]
+        item_fmt = '%%0%dX'% (width*2) if compact else '%%0%dX '% (width*2)
+        count = 0
+        while count < length:
+            items = min(16 // width, (length - count + width - 1) // width)
+            dat = self.readRam( addr, items*width )
+            line = '' if compact else '%08X: '% addr
+            line += ''.join([item_fmt% v for v in struct.unpack('<%d%s'% (items, fmt), dat)])
+            self.writeLine( line )
+            addr += items * width
+            count += items * width
+
+    def cmdWrite( self, argv ):
+        opts, args = parseOptions( argv, {'b': ('address', True), 'w': ('width', True)} )
+        if 'address' not in opts:
+            raise ShellSyntaxError( 'address error' )
+        addr = parseInt( opts['address'] )
+        width = parseInt( opts.get('width', '1') )
+        if width not in (1, 2, 4):
+            raise ShellSyntaxError( 'width error' )
+        fmt = {1: '<B', 2: '<H', 4: '<I'}[width]
+        mask = (1 << (width*8)) - 1
+        for a in args:
+            try:
+                v = parseInt( a )
+            except ShellSyntaxError:
+                raise ShellExecuteError( 'data err: %s'% a )
+            self.writeRam( addr, struct.pack(fmt, v & mask) )
+            addr += width
+
+    def cmdMfill( self, argv ):
+        opts, args = parseOptions( argv, {'b': ('address', True), 'l': ('length', True),
+                                          'w': ('width', True), 'p': ('pattern', True),
+                                          't': ('test', False)} )
+        for name in ['address', 'pattern', 'length']:
+            if name not in opts:
+                raise ShellSyntaxError( '%s error'% name )
+        addr = parseInt( opts['address'] )
+        width = parseInt( opts.get('width', '1') )
+        if width not in (1, 2, 4):
+            raise ShellSyntaxError( 'width error' )
+        length = parseInt( opts['length'] )
+        mask = (1 << (width*8)) - 1
+        item = struct.pack( {1: '<B', 2: '<H', 4: '<I'}[width], parseInt(opts['pattern']) & mask )
+        count = (length + width - 1) // width
+        if 'test' in opts:
+            if self.readRam( addr, count*width ) != item * count:
+                raise ShellExecuteError()
+        else:
+            self.writeRam( addr, item * count )
+
+    def cmdMapi( self, argv ):
+        opts, args = parseOptions( argv, {'m': ('malloc', False), 'r': ('realloc', False),
+                                          'f': ('free', False), 'b': ('address', True),
+                                          'l': ('length', True)} )
+        if 'malloc' in opts or 'realloc' in opts:
+            length = parseInt( opts.get('length', '0') )
+            if length <= 0:
+                raise ShellSyntaxError( 'length error' )
+            if 'realloc' in opts:
+                if 'address' not in opts:
+                    raise ShellSyntaxError( 'address error' )
+                old = parseInt( opts['address'] )
+                size = self.heap.get( old, 0 )
+                dat = self.readRam( old, size )
+                self.free( old )
+                addr = self.malloc( length )
+                if addr:
+                    self.writeRam( addr, dat[:length] )
+            else:
+                addr = self.malloc( length )
+            self.writeLine( '0x%08X'% addr )
+        elif 'free' in opts:
+            if 'address' not in opts:
+                raise ShellSyntaxError( 'address error' )
+            self.free( parseInt(opts['address']) )
+        else:
+            raise ShellSyntaxError( 'usage error' )
+
+    def makeDataBuffer( self, lines, float_mode=False ):
+        '''parse input lines into 16 bits integer or float buffer bytes'''
+        values = ' '.join(lines).replace(',', ' ').split()
+        if not values:
+            raise ShellExecuteError()
+        try:
+            if float_mode:
+                return struct.pack( '<%df'% len(values), *[float(v) for v in values] )
+            return struct.pack( '<%dH'% len(values), *[parseInt(v) & 0xFFFF for v in values] )
+        except ShellSyntaxError:
+            raise ShellExecuteError()
+
+    def cmdMkbuf( self, argv ):
+        opts, args = parseOptions( argv, {'f': ('float', False)} )
+        def done( lines ):
+            buf = self.makeDataBuffer( lines, 'float' in opts )
+            addr = self.malloc( len(buf) )
+            if not addr:
+                raise ShellExecuteError( 'malloc failed' )
+            self.writeRam( addr, buf )
+            self.writeLine( 'address: 0x%08X'% addr )
+            self.writeLine( 'length: %d'% (len(buf) // (4 if 'float' in opts else 2)) )
+        self.readLines( done )
+
+    def cmdLed( self, argv ):
+        opts, args = parseOptions( argv, {'s': ('set', False), 't': ('toggle', False),
+                                          'c': ('clr', False), 'i': ('index', True),
+                                          'n': ('number', False), 'T': ('test', False)} )
+        if 'number' in opts:
+            self.writeLine( '%d'% self.LED_NUMBER )
+            return
+        if 'test' in opts:
+            return
+        idx = parseInt( opts.get('index', '-1') )
+        if not 0 <= idx < self.LED_NUMBER:
+            raise ShellSyntaxError( 'index error' )
+        if 'clr' in opts:
+            self.leds[idx] = False
+        elif 'set' in opts:
+            self.leds[idx] = True
+        elif 'toggle' in opts:
+            self.leds[idx] = not self.leds[idx]
+        else:
+            self.writeLine( '1' if self.leds[idx] else '0' )
+
+    def cmdGpio( self, argv ):
+        spec = {'p': ('port', True), 'n': ('number', False), 'u': ('pullup', False),
+                'd': ('pulldown', False), 'O': ('opendrain', False)}
+        # optional mask values
+        argv2 = []
+        for a in argv:
+            if len(a) == 2 and a[0] == '-' and a[1] in 'iosct':
+                a += '-1'
+            argv2.append( a )
+        for c, name in [('i', 'input'), ('o', 'output'), ('s', 'set'), ('c', 'clr'), ('t', 'toggle')]:
+            spec[c] = (name, True)
+        opts, args = parseOptions( argv2, spec )
+        if 'number' in opts:
+            self.writeLine( '%d'% self.GPIO_NUMBER )
+            return
+        if 'port' not in opts:
+            raise ShellExecuteError( 'port/bit error' )
+        port, sep, bit = opts['port'].partition('.')
+        try:
+            port = int(port)
+            mask = (1 << int(bit)) if sep else 0xFFFFFFFF
+        except ValueError:
+            raise ShellExecuteError( 'port/bit error' )
+        if not 0 <= port < self.GPIO_NUMBER:
+            raise ShellExecuteError( 'port/bit error' )
+        def value( name ):
+            v = parseInt( opts[name] )
+            return mask if (sep or v == -1) else (v & 0xFFFFFFFF)
+        none_set = True
+        for name in ['input', 'output', 'set', 'clr', 'toggle']:
+            if name not in opts:
+                continue
+            none_set = False
+            v = value( name )
+            if name == 'input':
+                self.gpio_dir[port] &= ~v
+            elif name == 'output':
+                self.gpio_dir[port] |= v
+            elif name == 'set':
+                self.gpio_out[port] |= v
+            elif name == 'clr':
+                self.gpio_out[port] &= ~v
+            else:
+                self.gpio_out[port] ^= v
+        if none_set:
+            if sep:
+                self.writeLine( '1' if self.gpio_out[port] & mask else '0' )
+            else:
+                self.writeLine( '0x%08X'% (self.gpio_out[port] & 0xFFFFFFFF) )
+
+    def i2cTransfer( self, addr, write, read ):
+        '''i2c bus stub, override to emulate slaves'''
+        return [0] * read
+
+    def spiTransfer( self, write ):
+        '''spi bus stub, sdo is looped back to sdi'''
+        return list(write)
+
+    def cmdI2c( self, argv ):
+        opts, args = parseOptions( argv, {'a': ('address', True), 'r': ('read', True),
+                                          'n': ('nostop', False), 'I': ('init', False),
+                                          'D': ('deinit', False),
+                                          'S': ('scl', True), 'd': ('sda', True),
+                                          'l': ('lsb', False), 'y': ('delay', True)} )
+        if 'init' in opts or 'deinit' in opts:
+            self.i2c_addr = parseInt( opts.get('address', '0') )
+            return
+        addr = parseInt( opts['address'] ) if 'address' in opts else getattr(self, 'i2c_addr', 0)
+        read = parseInt( opts.get('read', '0') )
+        ret = self.i2cTransfer( addr, [parseInt(a) & 0xFF for a in args], read )
+        if read:
+            self.writeLine( ''.join(['0x%02X '% v for v in ret]) )
+
+    def cmdSpi( self, argv ):
+        spec = {'r': ('read', False), 'I': ('init', False), 'U': ('update', False),
+                'D': ('deinit', False), 'l': ('lsb', False),
+                'P': ('cpol', False), 'H': ('cpha', False)}
+        for c, name in [('i', 'sdi'), ('o', 'sdo'), ('k', 'sck'), ('s', 'cs'),
+                        ('w', 'width'), ('y', 'delay')]:
+            spec[c] = (name, True)
+        opts, args = parseOptions( argv, spec )
+        if 'init' in opts or 'update' in opts or 'deinit' in opts:
+            return
+        ret = self.spiTransfer( [parseInt(a) for a in args] )
+        if 'read' in opts:
+            self.writeLine( ''.join(['0x%X '% v for v in ret]) )
+
+    def cmdBeep( self, argv ):
+        parseOptions( argv, {'f': ('frequency', True)} )
+
+    def cmdError( self, argv ):
+        opts, args = parseOptions( argv, {'s': ('stop', False)} )
+        if 'stop' in opts:
+            return
+        if args:
+            self.errno = parseInt( args[0] )
+        else:
+            self.writeLine( '%d'% self.errno )
+
+    def cmdBaud( self, argv ):
+        opts, args = parseOptions( argv, {'l': ('list', False), 's': ('set', True),
+                                          'c': ('confirm', False)} )
+        if 'set' in opts:
+            rate = parseInt( opts['set'] )
+            if rate not in self.BAUDRATES:
+                raise ShellExecuteError( 'unsupported baudrate' )
+            # switched after this response is sent
+            self.baudrate_revert = (self.baudrate, time.time() + self.BAUDRATE_REVERT_TIME)
+            self.baudrate = rate
+        elif 'confirm' in opts:
+            self.baudrate_revert = None
+        else:
+            for rate in self.BAUDRATES:
+                self.writeLine( '%d'% rate )
+
+    def cmdSpiffs( self, argv ):
+        opts, args = parseOptions( argv, {'c': ('command', True), 'b': ('address', True),
+                                          'C': ('compact', False), 'a': ('ascii', False)} )
+        cmd = opts.get('command')
+        addr = parseInt( opts['address'] ) if 'address' in opts else -1
+        if cmd == 'info':
+            used = sum([len(v) for v in self.files.values()])
+            self.writeLine( 'total: %d'% self.SPIFFS_SIZE )
+            self.writeLine( 'used: %d'% used )
+        elif cmd == 'id':
+            self.writeLine( 'EF4013' )
+        elif cmd == 'status':
+            self.writeLine( '0' )
+        elif cmd in ['mount', 'umount', 'remount', 'check', 'test']:
+            if cmd == 'check':
+                self.writeLine( '0' )
+        elif cmd == 'format':
+            self.files.clear()
+        elif cmd == 'erase':
+            if addr == -1:
+                self.spiffs_flash[:] = b'\xFF' * self.SPIFFS_SIZE
+                self.files.clear()
+            else:
+                addr -= addr % self.SPIFFS_SECTOR_SIZE
+                self.spiffs_flash[addr:addr+self.SPIFFS_SECTOR_SIZE] = b'\xFF' * self.SPIFFS_SECTOR_SIZE
+        elif cmd == 'read':
+            addr = max(addr, 0)
+            compact = 'compact' in opts
+            for i in range(0, self.SPIFFS_PAGE_SIZE, 16):
+                dat = bytearray(self.spiffs_flash[addr+i:addr+i+16])
+                line = '' if compact else '%08X: '% (addr+i)
+                line += ''.join([('%02X' if compact else '%02X ')% v for v in dat])
+                self.writeLine( line )
+        elif cmd == 'write':
+            addr = max(addr, 0)
+            def done( lines ):
+                # firmware writes the 16 bits buffer as it is
+                buf = self.makeDataBuffer( lines )[:self.SPIFFS_PAGE_SIZE]
+                for i, v in enumerate(bytearray(buf)):
+                    self.spiffs_flash[addr+i] &= v
+            self.readLines( done )
+        else:
+            raise ShellSyntaxError( 'command error' )
+
+    def cmdCat( self, argv ):
+        opts, args = parseOptions( argv, {'b': ('b64', False), 'w': ('write', False),
+                                          'a': ('append', False), 'd': ('delay', True)} )
+        if not args:
+            raise ShellSyntaxError()
+        pathname = self.getFilePathname( args[0] )
+        b64 = 'b64' in opts
+        if 'write' in opts or 'append' in opts:
+            def done( lines ):
+                if b64:
+                    try:
+                        dat = base64.b64decode( ''.join(lines).encode('utf8') )
+                    except Exception:
+                        raise ShellExecuteError()
+                else:
+                    dat = ('\n'.join(lines) + '\n').encode('utf8')
+                if 'append' in opts:
+                    dat = self.files.get( pathname, Env.EMPTY_BYTE ) + dat
+                self.files[pathname] = dat
+            self.readLines( done )
+        else:
+            if pathname not in self.files:
+                raise ShellExecuteError()
+            dat = self.files[pathname]
+            if b64:
+                dat = base64.b64encode( dat )
+                for i in range(0, len(dat), 72):
+                    self.write( dat[i:i+72] + b'\n' )
+            else:
+                self.write( dat )
+                self.write( '\n' )
+
+    def cmdRm( self, argv ):
+        if not argv:
+            raise ShellSyntaxError()
+        pathname = self.getFilePathname( argv[0] )
+        if self.files.pop( pathname, None ) is None:
+            raise ShellExecuteError()
+
+    def cmdRename( self, argv ):
+        if len(argv) < 2:
+            raise ShellSyntaxError()
+        pathname = self.getFilePathname( argv[0] )
+        vol, name = self.splitPathname( pathname )
+        if pathname not in self.files:
+            raise ShellExecuteError()
+        self.files['/%s/%s'% (vol, argv[1])] = self.files.pop( pathname )
+
+    def cmdList( self, argv ):
+        vol, name = self.splitPathname( argv[0] ) if argv else (None, '')
+        for v in self.VOLUMES:
+            if vol is not None and v != vol:
+                continue
+            self.write( '/%s:\n'% v )
+            prefix = '/%s/'% v
+            for pathname in sorted(self.files):
+                if not pathname.startswith(prefix):
+                    continue
+                if name and pathname[len(prefix):] != name:
+                    continue
+                self.write( '%6d  %s\n'% (len(self.files[pathname]), pathname[len(prefix):]) )
+
+    def cmdCrc( self, argv ):
+        opts, args = parseOptions( argv, {'b': ('address', True), 'l': ('length', True),
+                                          's': ('size', True)} )
+        if 'address' in opts:
+            # memory mode, one crc per block
+            if 'length' not in opts:
+                raise ShellSyntaxError( 'length error' )
+            dat = self.readRam( parseInt(opts['address']), parseInt(opts['length']) )
+            block = parseInt( opts.get('size', '0') )
+            if block <= 0:
+                block = len(dat)
+            pos = 0
+            while True:
+                self.writeLine( '0x%08X'% Utils.crc(bytes(dat[pos:pos+block])) )
+                pos += block
+                if pos >= len(dat):
+                    break
+            return
+        if not args:
+            raise ShellSyntaxError()
+        pathname = self.getFilePathname( args[0] )
+        if pathname not in self.files:
+            raise ShellExecuteError()
+        self.writeLine( '0x%08X'% Utils.crc(self.files[pathname]) )
+
+
+
+class SimulatorPort(Instrument.Port):
+    '''connect to an in-process Shell (pass device=<Shell> or get a new one),
+       with emulate_timing=True the serial line speed, device input queue
+       and command latency are emulated'''
+    emulate_timing = False
+    latency = 0.001  # seconds to process one command line
+    rx_queue_size = 128  # device input queue, HAL_UART_QUEUE_RX_LEN
+    loss = 0  # probability of losing each written byte
+
+    def connect( self ):
+        if self._connected:
+            return
+        if getattr(self, 'device', None) is None:
+            self.device = Shell()
+        self.rx = bytearray()
+        self.segments = deque()  # (time_start, bytes) in transmission
+        self.consumed = deque()  # times when queued input bytes are consumed
+        self.t_tx, self.t_dev, self.t_rx = 0, 0, 0
+        self.dropped = 0
+        self._connected = True
+
+    def disconnect( self ):
+        self._connected = False
+
+    def write( self, buf ):
+        if not self._connected:
+            return
+        if not isinstance(buf, (bytes, bytearray)):
+            buf = buf.encode('utf8')
+        check = getattr(self.device, 'checkBaudrate', None)
+        if check is not None and not check( self.baudrate ):
+            self.dropped += len(buf)  # baudrate mismatch, framing errors
+            return
+        if self.loss:
+            kept = bytearray([c for c in bytearray(buf) if random.random() >= self.loss])
+            self.dropped += len(buf) - len(kept)
+            buf = bytes(kept)
+        if not self.emulate_timing:
+            self.rx += self.device.process( buf )
+            return
+        tb = 10.0 / self.baudrate
+        t = max(time.time(), self.t_tx)
+        self.t_tx = t + len(buf) * tb
+        for i, c in enumerate(bytearray(buf)):
+            t_arrive = t + (i+1) * tb
+            while self.consumed and self.consumed[0] <= t_arrive:
+                self.consumed.popleft()
+            if len(self.consumed) >= self.rx_queue_size:
+                self.dropped += 1  # input queue overflow
+                continue
+            t_start = max(t_arrive, self.t_dev)
+            self.consumed.append( t_start )
+            out = self.device.process( bytearray([c]) )
+            if c == 0x0A:
+                t_start += self.latency
+            self.t_dev = t_start
+            if out:
+                t_out = max(t_start, self.t_rx)
+                self.segments.append( (t_out, out) )
+                self.t_rx = t_out + len(out) * tb
+                if c == 0x0A:
+                    # the shell task blocks until the output is sent
+                    self.t_dev = self.t_rx
+
+    def receive( self ):
+        if getattr(self.device, 'pending_logs', None):
+            # printed while idle
+            self.rx += self.device.process( Env.EMPTY_BYTE )
+        if not self.segments:
+            return
+        tb = 10.0 / self.baudrate
+        now = time.time()
+        while self.segments:
+            t_out, out = self.segments[0]
+            arrived = min(len(out), int((now-t_out)/tb))
+            if arrived <= 0:
+                break
+            self.rx += out[:arrived]
+            if arrived < len(out):
+                self.segments[0] = (t_out + arrived*tb, out[arrived:])
+                break
+            self.segments.popleft()
+
+    @property
+    def in_waiting( self ):
+        self.receive()
+        return len(self.rx)
+
+    def read( self, read_bytes=1 ):
+        deadline = time.time() + self.timeout
+        while True:
+            self.receive()
+            if self.rx:
+                ret = bytes(self.rx[:read_bytes])
+                del self.rx[:read_bytes]
+                return ret
+            now = time.time()
+            if now >= deadline:
+                return Env.EMPTY_BYTE
+            if self.segments:
+                time.sleep( max(0, min(deadline, self.segments[0][0] + 10.0/self.baudrate) - now) )
+            else:
+                # nothing in transmission, wait as a real port until timeout
+                time.sleep( min(deadline - now, 0.01) )
+
+    def readall( self ):
+        return self.read( self.in_waiting )
+
+
+class SimulatorMcush( Mcush.Mcush ):
+    '''Mcush connected to a simulated device, port name is not used'''
+    PORT_TYPE = SimulatorPort
+
+
+class PtyServer(object):
+    '''serve a Shell on a pseudo terminal (posix only),
+       open server.port with any serial port based instrument'''
+
+    def __init__( self, device=None, baudrate=None, latency=0 ):
+        import pty
+        import tty
+        self.device = Shell() if device is None else device
+        self.baudrate = baudrate
+        self.latency = latency
+        self.master, self.slave = pty.openpty()
+        tty.setraw( self.slave )
+        self.port = os.ttyname( self.slave )
+        self.running = False
+        self.thread = None
+
+    def start( self ):
+        self.running = True
+        self.thread = threading.Thread( target=self.serve )
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def serve( self ):
+        from select import select
+        while self.running:
+            if not select( [self.master], [], [], 0.1 )[0]:
+                continue
+            try:
+                dat = os.read( self.master, 4096 )
+            except OSError:
+                break
+            out = self.device.process( dat )
+            if self.latency and b'\n' in dat:
+                time.sleep( self.latency )
+            if self.baudrate:
+                time.sleep( (len(dat) + len(out)) * 10.0 / self.baudrate )
+            if out:
+                os.write( self.master, out )
+
+    def stop( self ):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        os.close( self.master )
+        os.close( self.slave )
+
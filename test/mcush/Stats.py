@@ -0,0 +1,171 @@
+# coding: utf8
+__doc__ = 'per command latency and throughput statistics'
+__author__ = 'Peng Shulin <trees_peng@163.com>'
+__license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
+import time
+import json
+from . import Instrument
+
+
+# latency histogram upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10)
+
+
+class VerbStats:
+    '''counters of one command verb'''
+
+    def __init__( self ):
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.tx_bytes = 0
+        self.rx_bytes = 0
+        self.overhead_bytes = 0
+        self.ttfb_sum = 0.0
+        self.latency_sum = 0.0
+        self.latency_min = None
+        self.latency_max = None
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def add( self, tx, rx, overhead, ttfb, latency ):
+        self.count += 1
+        self.tx_bytes += tx
+        self.rx_bytes += rx
+        self.overhead_bytes += overhead
+        self.ttfb_sum += ttfb
+        self.latency_sum += latency
+        if self.latency_min is None or latency < self.latency_min:
+            self.latency_min = latency
+        if self.latency_max is None or latency > self.latency_max:
+            self.latency_max = latency
+        for i, le in enumerate(LATENCY_BUCKETS):
+            if latency <= le:
+                self.buckets[i] += 1
+                break
+
+    def snapshot( self ):
+        payload = self.rx_bytes - self.overhead_bytes
+        cumulative, histogram = 0, []
+        for le, n in zip(LATENCY_BUCKETS, self.buckets):
+            cumulative += n
+            histogram.append( (le, cumulative) )
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'tx_bytes': self.tx_bytes,
+            'rx_bytes': self.rx_bytes,
+            'overhead_bytes': self.overhead_bytes,
+            'payload_bytes': payload,
+            'overhead_ratio': float(self.overhead_bytes) / payload if payload > 0 else None,
+            'ttfb_sum': self.ttfb_sum,
+            'ttfb_avg': self.ttfb_sum / self.count if self.count else None,
+            'latency_sum': self.latency_sum,
+            'latency_avg': self.latency_sum / self.count if self.count else None,
+            'latency_min': self.latency_min,
+            'latency_max': self.latency_max,
+            'histogram': histogram,
+            }
+
+
+class CommandStats:
+    '''collect statistics of commands by verb (first word of the command line),
+       lines typed in multi-line input mode are counted to the command opening it'''
+
+    def __init__( self ):
+        self.reset()
+
+    def reset( self ):
+        self.verbs = {}
+        self.last_verb = ''
+        self.input_mode = False  # sub prompt '>' returned
+        self.start_time = time.time()
+
+    def getVerbStats( self, verb ):
+        try:
+            return self.verbs[verb]
+        except KeyError:
+            v = self.verbs[verb] = VerbStats()
+            return v
+
+    def measure( self, instrument, cmd, t_write=None, raw=False ):
+        '''call instrument._readCommandResponse and record it'''
+        t0 = time.time() if t_write is None else t_write
+        buf = instrument.rx_buffer
+        # bytes already buffered are regarded as arrived right now
+        instrument.t_first_byte = time.time() if buf else None
+        consumed = instrument.rx_bytes - len(buf)
+        instrument.returned_prompt = None
+        tx = len(cmd) + len(instrument.DEFAULT_TERMINATOR_WRITE)
+        error, timeout = False, False
+        try:
+            return instrument._readCommandResponse( cmd, raw )
+        except Instrument.CommandTimeoutError:
+            timeout = True
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            t1 = time.time()
+            prompt = instrument.returned_prompt or ''
+            if self.input_mode or not cmd:
+                verb = self.last_verb
+            else:
+                verb = cmd.split(None, 1)[0]
+                self.last_verb = verb
+            self.input_mode = bool(prompt == '>')
+            v = self.getVerbStats( verb )
+            if timeout:
+                v.timeouts += 1
+            else:
+                if error:
+                    v.errors += 1
+                rx = instrument.rx_bytes - len(buf) - consumed
+                overhead = len(cmd) + len(instrument.DEFAULT_TERMINATOR_READ) + len(prompt)
+                t_first = instrument.t_first_byte or t1
+                v.add( tx, rx, min(overhead, rx), max(0, t_first - t0), t1 - t0 )
+
+    def snapshot( self ):
+        '''return {verb: {counter: value}}'''
+        return dict([(verb, v.snapshot()) for verb, v in self.verbs.items()])
+
+
+def toJson( snapshot, indent=None ):
+    '''convert snapshot to json string'''
+    return json.dumps( snapshot, indent=indent, sort_keys=True )
+
+def _escapeLabel( value ):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def toPrometheus( snapshot, prefix='mcush_command', labels=None ):
+    '''convert snapshot to prometheus text exposition format'''
+    extra = ''
+    if labels:
+        extra = ''.join([',%s="%s"'% (k, _escapeLabel(v)) for k, v in sorted(labels.items())])
+    lines = []
+    for name, key, metric_type, helps in [
+            ('total', 'count', 'counter', 'commands completed'),
+            ('errors_total', 'errors', 'counter', 'commands returned error prompts'),
+            ('timeouts_total', 'timeouts', 'counter', 'commands timeout'),
+            ('tx_bytes_total', 'tx_bytes', 'counter', 'bytes written'),
+            ('rx_bytes_total', 'rx_bytes', 'counter', 'bytes received'),
+            ('overhead_bytes_total', 'overhead_bytes', 'counter', 'echo and prompt bytes received'),
+            ('ttfb_seconds_total', 'ttfb_sum', 'counter', 'time to first byte') ]:
+        lines.append( '# HELP %s_%s %s'% (prefix, name, helps) )
+        lines.append( '# TYPE %s_%s %s'% (prefix, name, metric_type) )
+        for verb in sorted(snapshot):
+            lines.append( '%s_%s{verb="%s"%s} %s'% (prefix, name, _escapeLabel(verb), extra, snapshot[verb][key]) )
+    name = '%s_latency_seconds'% prefix
+    lines.append( '# HELP %s command latency'% name )
+    lines.append( '# TYPE %s histogram'% name )
+    for verb in sorted(snapshot):
+        s = snapshot[verb]
+        label = 'verb="%s"%s'% (_escapeLabel(verb), extra)
+        for le, n in s['histogram']:
+            lines.append( '%s_bucket{%s,le="%s"} %d'% (name, label, le, n) )
+        lines.append( '%s_bucket{%s,le="+Inf"} %d'% (name, label, s['count']) )
+        lines.append( '%s_sum{%s} %s'% (name, label, s['latency_sum']) )
+        lines.append( '%s_count{%s} %d'% (name, label, s['count']) )
+    return '\n'.join(lines) + '\n'
+
@@ -4,12 +4,15 @@ __author__ = 'Peng Shulin <trees_peng@163.com>'
 __license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
 from os import system, remove
 from sys import platform, stdout
+from sys import byteorder as sys_byteorder
 from binascii import hexlify, unhexlify, crc32
 from random import randint
 from subprocess import Popen, PIPE
 from struct import pack, unpack
 from time import strftime, localtime
+from array import array
 import json
+from importlib import import_module
 from . import Env
 import traceback
 
@@ -267,37 +270,92 @@ def dt2s( dt, need_ms=False ):
         return '%d:%02d:%02d'% (hour, minute, sec)
 
 # array convert 
-def s2fa( val ):
-    length = int(len(val)/4)
-    return [unpack('f', val[i*4:(i+1)*4]) for i in range(length)]
+# item size of struct format chars, all in standard size
+ARRAY_ITEM_SIZE = {'b': 1, 'B': 1, 'h': 2, 'H': 2, 'i': 4, 'I': 4,
+                   'q': 8, 'Q': 8, 'f': 4, 'd': 8}
+# array typecodes of the same item size as in struct
+ARRAY_TYPECODES = []
+for _t in ARRAY_ITEM_SIZE:
+    try:
+        if array( _t ).itemsize == ARRAY_ITEM_SIZE[_t]:
+            ARRAY_TYPECODES.append( _t )
+    except ValueError:
+        pass
+
+def s2a( val, typecode, big_endian=False, copy=True, use_numpy=False ):
+    '''convert buffer into flat sequence of typecode items (struct format
+       char in ARRAY_ITEM_SIZE), trailing partial item is ignored
+       returns:
+         array.array by default (list for q/Q in python 2)
+         memoryview cast to typecode if copy=False (native byte order,
+         python 3 only)
+         numpy array if use_numpy, a view of val if copy=False
+       NOTE: s2*a returned list of 1-tuples before, callers indexing [i][0]
+       must use [i] now
+       NOTE: views with copy=False reference the memory of val, which must
+       not be reused or modified while the view is in use'''
+    size = ARRAY_ITEM_SIZE[typecode]
+    count = len(val) // size
+    swap = size > 1 and big_endian != (sys_byteorder == 'big')
+    if use_numpy:
+        import numpy
+        ret = numpy.frombuffer( val, dtype=('>' if big_endian else '<') + typecode, count=count )
+        return ret.copy() if copy else ret
+    if not copy:
+        if swap or not Env.PYTHON_V3:
+            raise ValueError( 'view of non-native byte order or in python 2' )
+        return memoryview( val ).cast( 'B' )[:count*size].cast( typecode )
+    if typecode in ARRAY_TYPECODES:
+        ret = array( typecode )
+        if Env.PYTHON_V3:
+            ret.frombytes( memoryview( val ).cast( 'B' )[:count*size] )
+        else:
+            ret.fromstring( buffer( val, 0, count*size ) )
+        if swap:
+            ret.byteswap()
+        return ret
+    # no array type of the size (q/Q in python 2)
+    return list( unpack( '%s%d%s'% ('>' if big_endian else '<', count, typecode), val[:count*size] ) )
+
+def s2fa( val, big_endian=False, copy=True, use_numpy=False ):
+    '''buffer to flat float items, see s2a for return types and copy=False'''
+    return s2a( val, 'f', big_endian, copy, use_numpy )
+
+def s2da( val, big_endian=False, copy=True, use_numpy=False ):
+    '''buffer to flat double items, see s2a for return types and copy=False'''
+    return s2a( val, 'd', big_endian, copy, use_numpy )
+
+def s2Ia( val, big_endian=False, copy=True, use_numpy=False ):
+    '''buffer to flat uint32 items, see s2a for return types and copy=False'''
+    return s2a( val, 'I', big_endian, copy, use_numpy )
 
-def s2da( val ):
-    length = int(len(val)/8)
-    return [unpack('d', val[i*8:(i+1)*8]) for i in range(length)]
+def s2ia( val, big_endian=False, copy=True, use_numpy=False ):
+    '''buffer to flat int32 items, see s2a for return types and copy=False'''
+    return s2a( val, 'i', big_endian, copy, use_numpy )
 
-def s2Ia( val ):
-    length = int(len(val)/4)
-    return [unpack('I', val[i*4:(i+1)*4]) for i in range(length)]
+def s2Ha( val, big_endian=False, copy=True, use_numpy=False ):
+    '''buffer to flat uint16 items, see s2a for return types and copy=False'''
+    return s2a( val, 'H', big_endian, copy, use_numpy )
 
-def s2ia( val ):
-    length = int(len(val)/4)
-    return [unpack('i', val[i*4:(i+1)*4]) for i in range(length)]
+def s2ha( val, big_endian=False, copy=True, use_numpy=False ):
+    '''buffer to flat int16 items, see s2a for return types and copy=False'''
+    return s2a( val, 'h', big_endian, copy, use_numpy )
 
-def s2Ha( val ):
-    length = int(len(val)/2)
-    return [unpack('H', val[i*2:(i+1)*2]) for i in range(length)]
+def s2Ba( val, copy=True, use_numpy=False ):
+    '''buffer to flat uint8 items, see s2a for return types and copy=False'''
+    return s2a( val, 'B', False, copy, use_numpy )
 
-def s2ha( val ):
-    length = int(len(val)/2)
-    return [unpack('h', val[i*2:(i+1)*2]) for i in range(length)]
+def s2ba( val, copy=True, use_numpy=False ):
+    '''buffer to flat int8 items, see s2a for return types and copy=False'''
+    return s2a( val, 'b', False, copy, use_numpy )
 
-def s2Ba( val ):
-    length = len(val)
-    return [unpack('B', val[i]) for i in range(length)]
+def s2Qa( val, big_endian=False, copy=True, use_numpy=False ):
+    '''buffer to flat uint64 items, see s2a for return types and copy=False'''
+    return s2a( val, 'Q', big_endian, copy, use_numpy )
 
-def s2ba( val ):
-    length = len(val)
-    return [unpack('b', val[i]) for i in range(length)]
+def s2qa( val, big_endian=False, copy=True, use_numpy=False ):
+    '''buffer to flat int64 items, see s2a for return types and copy=False'''
+    return s2a( val, 'q', big_endian, copy, use_numpy )
 
 
 def checksum( string ):
@@ -574,9 +632,39 @@ class FCFS:
         else:
             output = Env.EMPTY_BYTE.join([o.__bytes__() for o in newlst])
         return output
- 
 
 
+class LazyModule(object):
+    '''placeholder of a module, imported at the first attribute access'''
+
+    def __init__( self, name ):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_module'] = None
+
+    def _load( self ):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = import_module( self.__dict__['_lazy_name'] )
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__( self, name ):
+        return getattr( self._load(), name )
+
+    def __setattr__( self, name, value ):
+        setattr( self._load(), name, value )
+
+    def __dir__( self ):
+        return dir( self._load() )
 
+    def __repr__( self ):
+        if self.__dict__['_lazy_module'] is None:
+            return "<lazy module '%s'>"% self.__dict__['_lazy_name']
+        return repr( self.__dict__['_lazy_module'] )
 
+def lazyImport( namespace, package, names ):
+    '''bind placeholders of package submodules into namespace (globals()),
+       so that 'from package import *' does not load them all'''
+    for name in names:
+        namespace[name] = LazyModule( '%s.%s'% (package, name) )
 
@@ -10,14 +10,19 @@ from . import Utils
 from . import Instrument
 from . import Register
 from . import Mcush
-from . import AppUtils
 
-try:
-    from .android import *
-    from .linkong import *
-    from .fluke import *
-    from .uni_trend import *
-    from .rigol import *
-    from .misc import *  # require pymodbus
-except ImportError as e:
-    print( 'import error:', e )
+# the others are imported at the first use, keep startup of scripts fast
+Utils.lazyImport( globals(), __name__, [
+    'AppUtils', 'DeviceManager', 'Simulator', 'Recorder', 'Stats', 'Shared',
+    'AdaptiveTimeout', 'RegisterMap', 'Sampler',
+    'MemoryMirror' ] )
+if Env.PYTHON_V3:
+    # require python 3.5+
+    Utils.lazyImport( globals(), __name__, ['AsyncInstrument', 'AsyncMcush'] )
+
+from .android import *
+from .linkong import *
+from .fluke import *
+from .uni_trend import *
+from .rigol import *
+from .misc import *
@@ -3,6 +3,8 @@ __doc__ = 'modules on android'
 __author__ = 'Peng Shulin <trees_peng@163.com>'
 __license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
 
-from . import Kivy
-from . import Qpython
+from ..Utils import lazyImport as _lazyImport
 
+# imported at the first use
+_lazyImport( globals(), __name__, [
+    'Kivy', 'Qpython' ] )
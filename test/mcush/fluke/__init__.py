@@ -3,6 +3,8 @@ __doc__ = 'Products from FLUKE Corporation.'
 __author__ = 'Peng Shulin <trees_peng@163.com>'
 __license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
 
-from . import F8808A
-from . import F5520A
+from ..Utils import lazyImport as _lazyImport
 
+# imported at the first use
+_lazyImport( globals(), __name__, [
+    'F8808A', 'F5520A' ] )
@@ -167,7 +167,7 @@ class ShellLabStrap(Mcush.Mcush):
     DEFAULT_IDN = re_compile( 'ShellLab-L2[a-zA-Z]*,([0-9]+\.[0-9]+.*)' )
 
     def __init__( self, *args, **kwargs ):
-        Instrument.Instrument.__init__( self, *args, **kwargs )
+        Mcush.Mcush.__init__( self, *args, **kwargs )
         self.length = kwargs.get('length', None)
         if self.length is not None:
             self.strapLength( self.length ) 
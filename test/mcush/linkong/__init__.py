@@ -2,6 +2,8 @@
 __doc__ = 'Products from Shanghai Linkong Software Technologies Co., Ltd.'
 __author__ = 'Peng Shulin <trees_peng@163.com>'
 __license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
-from . import ShellKit
-from . import ShellLab
-from . import VAP
+from ..Utils import lazyImport as _lazyImport
+
+# imported at the first use
+_lazyImport( globals(), __name__, [
+    'ShellKit', 'ShellLab', 'VAP' ] )
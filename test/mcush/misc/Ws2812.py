@@ -47,41 +47,42 @@ class LEDS():
             cmd += ' -l%d'% length
         count_data = 0
         count_argv = len(cmd.split())
-        while True:
-            if len(mem) == 0:
-                if count_data:
-                    # the final line left
-                    if ((len(cmd)+3) >= self.DEFAULT_CMD_LINE_LIMIT) or ((count_argv+1) >= self.controller.DEFAULT_CMD_ARGV_LIMIT):
-                        # too full to add -w option
-                        self.controller.writeCommand( cmd )
-                        self.controller.writeCommand( 'W -w')
+        with self.controller.pipeline() as p:
+            while True:
+                if len(mem) == 0:
+                    if count_data:
+                        # the final line left
+                        if ((len(cmd)+3) >= self.DEFAULT_CMD_LINE_LIMIT) or ((count_argv+1) >= self.controller.DEFAULT_CMD_ARGV_LIMIT):
+                            # too full to add -w option
+                            p.writeCommand( cmd )
+                            p.writeCommand( 'W -w')
+                        else:
+                            # add -w option
+                            p.writeCommand( cmd.replace('W', 'W -w') )
                     else:
-                        # add -w option
-                        self.controller.writeCommand( cmd.replace('W', 'W -w') )
-                else:
-                    # all data written, but not flushed
-                    self.controller.writeCommand( 'W -w')
-                break
-            cmd += ' %d'% (int(mem.pop(0)) & 0xFFFFFF)
-            count_data += 1
-            count_argv += 1
-            if (len(cmd) >= self.DEFAULT_CMD_LINE_LIMIT) or (count_argv >= self.controller.DEFAULT_CMD_ARGV_LIMIT):
-                # split data into multiple lines
-                self.controller.writeCommand( cmd )
-                if not push:
-                    offset += count_data
-                cmd = 'W'
-                if offset:
-                    cmd += ' -o%d'% offset
-                if self.swap_rg:
-                    cmd += ' -g'
-                if push is not None:
-                    if push == 'f':
-                        cmd += ' -f'
-                    elif push == 'b':
-                        cmd += ' -b'
-                count_data = 0
-                count_argv = len(cmd.split())
+                        # all data written, but not flushed
+                        p.writeCommand( 'W -w')
+                    break
+                cmd += ' %d'% (int(mem.pop(0)) & 0xFFFFFF)
+                count_data += 1
+                count_argv += 1
+                if (len(cmd) >= self.DEFAULT_CMD_LINE_LIMIT) or (count_argv >= self.controller.DEFAULT_CMD_ARGV_LIMIT):
+                    # split data into multiple lines
+                    p.writeCommand( cmd )
+                    if not push:
+                        offset += count_data
+                    cmd = 'W'
+                    if offset:
+                        cmd += ' -o%d'% offset
+                    if self.swap_rg:
+                        cmd += ' -g'
+                    if push is not None:
+                        if push == 'f':
+                            cmd += ' -f'
+                        elif push == 'b':
+                            cmd += ' -b'
+                    count_data = 0
+                    count_argv = len(cmd.split())
 
     def pushf( self, mem, offset=None, length=None ):
         self.write( mem, offset=offset, push='f', length=length )
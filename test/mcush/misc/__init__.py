@@ -3,37 +3,13 @@ __doc__ = '3rd party modules, addons'
 __author__ = 'Peng Shulin <trees_peng@163.com>'
 __license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
 
-from . import BeepPlayer
-from . import MorseCodeBeeper
-from . import Tjc
-from . import Canvas
-from . import Gratten
-from . import SegmentTable
-from . import Tm1637
-from . import Bitmap
-from . import Font
-from . import Max7219
-from . import Ssd1306
-from . import Ws2812
-from . import Motion 
-from . import Aosong
-from . import Max6675
-from . import Max31865
-from . import Tm7707
-from . import Cs1238
-from . import Hx711
-from . import Ina219
-from . import Bosch
-from . import Feeltech
-from . import Tcs3472
-from . import Max30102
-from . import Ads1115
-from . import Hmc5883
-from . import Korad
-from . import Yaohua
-from . import OpenOCD
-from . import Dallas1W
-from . import Tongmen  # require pymodbus
-from . import Zhouzheng  # require pymodbus
-from . import Miaoguan  # require pymodbus
+from ..Utils import lazyImport as _lazyImport
 
+# imported at the first use, some of them require pymodbus
+_lazyImport( globals(), __name__, [
+    'BeepPlayer', 'MorseCodeBeeper', 'Tjc', 'Canvas', 'Gratten',
+    'SegmentTable', 'Tm1637', 'Bitmap', 'Font', 'Max7219', 'Ssd1306', 'Ws2812',
+    'Motion', 'Aosong', 'Max6675', 'Max31865', 'Tm7707', 'Cs1238', 'Hx711',
+    'Ina219', 'Bosch', 'Feeltech', 'Tcs3472', 'Max30102', 'Ads1115', 'Hmc5883',
+    'Korad', 'Yaohua', 'OpenOCD', 'Dallas1W', 'Tongmen', 'Zhouzheng',
+    'Miaoguan' ] )
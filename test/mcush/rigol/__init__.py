@@ -3,9 +3,8 @@ __doc__ = 'Products from Beijing RIGOL Technologies Inc.'
 __author__ = 'Peng Shulin <trees_peng@163.com>'
 __license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
 
-from . import DP700
-from . import DP800
-from . import DG800
-from . import DM3058
-from . import DS1000
+from ..Utils import lazyImport as _lazyImport
 
+# imported at the first use
+_lazyImport( globals(), __name__, [
+    'DP700', 'DP800', 'DG800', 'DM3058', 'DS1000' ] )
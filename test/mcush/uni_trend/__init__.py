@@ -3,5 +3,8 @@ __doc__ = 'Products from Uni-Trend Technology Co., Ltd.'
 __author__ = 'Peng Shulin <trees_peng@163.com>'
 __license__ = 'MCUSH designed by Peng Shulin, all rights reserved.'
 
-from . import UT61
+from ..Utils import lazyImport as _lazyImport
 
+# imported at the first use
+_lazyImport( globals(), __name__, [
+    'UT61' ] )